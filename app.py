@@ -1,103 +1,534 @@
-from flask import Flask, render_template, request, jsonify, send_file, send_from_directory
-import pandas as pd
-from main import VectorSearch
+from flask import Flask, Response, render_template, request, jsonify, send_file, send_from_directory
+from main import VectorSearch, job_id_for_file
+from job_queue import JobQueue
+from excel_reader import TextSource, read_text_column
+from corpus_store import CorpusStore
+from metrics import metrics, profile_to
+from warmup import Warmup
+from checkpoint import run_stage
+from result_store import PREFILTER_METHODS
+from contextlib import nullcontext
+import json
 import os
+import uuid
+from collections import Counter
 
 app = Flask(__name__)
+# 构造时不加载模型、不连接Milvus，各组件在首次使用时或由下面的预热线程加载
 vector_search = VectorSearch()
+tokenizer = vector_search.text_filter.tokenizer
+warmup = Warmup()
+warmup.add('tokenizer', tokenizer.initialize, check=tokenizer.initialized)
+warmup.add('embedder', vector_search.load_embedder, check=lambda: vector_search.embedder_loaded)
+# 只有文本数量超过NumPy后端上限时才需要Milvus，连接失败不影响就绪状态
+warmup.add('milvus', vector_search.ensure_milvus, required=vector_search.similarity_backend == 'milvus',
+           check=lambda: vector_search.milvus_ready)
+# WARMUP: background（默认，后台预热）/ eager（导入时同步预热）/ off（全部在首次使用时加载）
+WARMUP_MODE = os.getenv('WARMUP', 'background')
+if __name__ == '__mp_main__':
+    # 直接运行 app.py 时，进程池的工作进程（forkserver/spawn）会重新导入本模块，工作进程中不预热
+    WARMUP_MODE = 'off'
+if WARMUP_MODE == 'eager':
+    warmup.run()
+elif WARMUP_MODE != 'off':
+    warmup.start()
+job_queue = JobQueue(max_workers=int(os.getenv('JOB_WORKERS', 2)))
+# 增量查重使用的历史库
+corpus_store = CorpusStore(os.getenv('CORPUS_DB_PATH', 'corpus.db'), text_filter=vector_search.text_filter)
+# 上传时勾选 profile 的任务，其 cProfile 结果保存在此目录
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
+def run_upload_job(job, pipeline, pipeline_args, profile=False):
+    """后台执行检测任务：记录本任务的各阶段指标，profile 为真时对任务做 cProfile 采样"""
+    profiler = nullcontext(False)
+    if profile:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        profiler = profile_to(os.path.join(PROFILE_DIR, f'{job.id}.prof'))
+    with metrics.job_scope() as job_metrics, profiler as profiled:
+        result = pipeline(job, *pipeline_args)
+    result['metrics'] = job_metrics.to_dict()
+    if profiled:
+        result['profile'] = f'/jobs/{job.id}/profile'
+    return result
+
+def read_upload(job, file_path, column_name):
+    """读取上传文件中的文本列"""
+    job.update('ingest', 0, '读取Excel文件...')
+    try:
+        # 单次遍历读取文本列，同时得到总行数
+        with metrics.timer(stage='ingest'):
+            return read_text_column(file_path, column_name)
+    except ValueError:
+        raise
+    except Exception as e:
+        raise ValueError(f'无法读取Excel文件: {str(e)}')
+
+def format_index(fields, side=''):
+    """行号；交叉比对时显示来源文件、工作表与行号"""
+    index = fields[f'index{side}']
+    if f'source{side}' in fields:
+        sheet = fields[f'sheet{side}']
+        return f"{fields[f'source{side}']}{f'/{sheet}' if sheet else ''}#{index}"
+    return index
+
+def format_pair(pair, with_method=False):
+    """转换文本对为前端所需格式"""
+    result = {
+        'text1': pair['text1'],
+        'text2': pair['text2'],
+        'index1': format_index(pair, 1),
+        'index2': format_index(pair, 2),
+        'similarity': f"{pair['similarity']:.2%}",
+        'distance': pair.get('distance', 0)
+    }
+    if with_method:
+        result['method'] = pair['method']
+    if 'scope' in pair:
+        result['scope'] = pair['scope']
+    return result
+
+def format_groups(results, groups, candidates=False):
+    """相似文本分组：成员按与中心文本（medoid）的相似度降序，组内文本对明细由 /jobs/<id>/groups/<n> 按需获取"""
+    scores = results.candidates['score'] if candidates else results.similarity
+    formatted = []
+    for number, group in enumerate(groups):
+        members = []
+        for text_id, similarity in group['members']:
+            member = results.member(text_id)
+            members.append({'index': format_index(member), 'text': member['text'], 'similarity': f"{similarity:.2%}"})
+        edge_scores = scores[group['edges']]
+        formatted.append({
+            'id': number,
+            'size': len(members),
+            'pair_count': len(group['edges']),
+            'max_similarity': f"{edge_scores.max():.2%}",
+            'min_similarity': f"{edge_scores.min():.2%}",
+            'members': members
+        })
+    return formatted
+
+def select_results(results, filter_threshold=None, similarity_threshold=None, include_pairs=False):
+    """按阈值从已保存的结果中筛选（不重新计算），阈值为 None 时使用提交任务时的阈值
+    
+    文本对合并为相似文本分组返回；include_pairs 为真时同时返回逐对明细
+    """
+    with metrics.timer(stage='select_results', items=len(results)):
+        candidate_indices, pair_indices, thresholds = results.select(filter_threshold, similarity_threshold)
+        similarities = results.similarity[pair_indices]
+        selected = {
+            'thresholds': thresholds,
+            'floors': results.floors,
+            'final_pair_count': len(pair_indices),
+            'final_groups': format_groups(results, results.groups(pair_indices)),
+            'similarity_distribution': {
+                '90-100%': int((similarities >= 0.9).sum()),
+                '80-90%': int(((similarities >= 0.8) & (similarities < 0.9)).sum()),
+                '70-80%': int(((similarities >= 0.7) & (similarities < 0.8)).sum()),
+                '< 70%': int((similarities < 0.7).sum())
+            }
+        }
+        if include_pairs:
+            selected['final_pairs'] = [format_pair(results.pair(k)) for k in pair_indices]
+        if candidate_indices is not None:
+            methods = Counter(results.candidates['method'][candidate_indices].tolist())
+            selected.update(
+                initial_pair_count=len(candidate_indices),
+                initial_groups=format_groups(results, results.groups(candidate_indices, candidates=True),
+                                             candidates=True),
+                method_distribution={method: methods[code] for code, method in enumerate(PREFILTER_METHODS)}
+            )
+            if include_pairs:
+                selected['initial_pairs'] = [format_pair(results.candidate(k), with_method=True)
+                                             for k in candidate_indices]
+    return selected
+
+def format_duplicate_groups(duplicate_groups):
+    return [
+        {
+            'rows': group['rows'],
+            'count': len(group['rows']),
+            'text': group['representative'][1],
+            'match_type': group['match_type'],
+            'similarity': f"{1.0:.2%}",
+            **({'source': group['source']} if 'source' in group else {})
+        }
+        for group in duplicate_groups
+    ]
+
+def run_pipeline(job, file_path, column_name, filter_threshold, similarity_threshold,
+                 candidate_mode, tfidf_mode):
+    """后台执行完整的检测流程，返回前端所需格式的结果
+    
+    各阶段的产物按文件内容与列名保存为检查点，任务失败后重新上传同一文件时从未完成的阶段继续
+    """
+    try:
+        job_id = job_id_for_file(file_path, column_name)
+        checkpoint = vector_search.checkpoint_store.open(job_id)
+        # 同一文件的任务依次执行：以不同参数重新开始某阶段时会作废其后各阶段的产物
+        with checkpoint.exclusive(on_wait=lambda: job.update('ingest', 0, '等待同一文件的其他任务完成...')):
+            ingested = run_stage(checkpoint, 'ingest', {'column': column_name},
+                                 lambda: read_upload(job, file_path, column_name))
+            
+            # 按下限阈值计算并保存全部分数，之后调整阈值时直接筛选（见 /jobs/<id>/results）
+            floors = vector_search.score_floors(filter_threshold, similarity_threshold)
+            
+            # 处理文件
+            texts, embeddings, potential_pairs, text_to_index = vector_search.process_excel_with_filter(
+                file_path,
+                column_name,
+                floors['filter'],
+                floors['similarity'],
+                candidate_mode,
+                tfidf_mode,
+                job_id=job_id,
+                progress_callback=job.update,
+                ingested=ingested,
+                checkpoint=checkpoint
+            )
+            
+            # 生成相似度报告
+            job.update('report', 0)
+            duplicate_groups = ingested.duplicate_groups()
+            vector_search.generate_similarity_report(
+                texts, embeddings, text_to_index, floors['similarity'],
+                partition_name=vector_search.partition_for_job(job_id),
+                progress_callback=job.update,
+                duplicate_groups=duplicate_groups,
+                result_key=job.id,
+                checkpoint=checkpoint,
+                candidates=potential_pairs,
+                thresholds={'filter': filter_threshold, 'similarity': similarity_threshold},
+                floors=floors
+            )
+            
+        # 转换结果为前端所需格式
+        return {
+            'total_records': ingested.total_rows,
+            'duplicate_groups': format_duplicate_groups(duplicate_groups),
+            **select_results(vector_search.result_store.get(job.id))
+        }
+    finally:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+def run_incremental_pipeline(job, file_path, column_name, filter_threshold, similarity_threshold,
+                             candidate_mode, commit, source):
+    """后台执行增量查重：新批次只与自身及历史库比对"""
+    try:
+        ingested = read_upload(job, file_path, column_name)
+        result = vector_search.check_incremental(
+            ingested,
+            corpus_store,
+            filter_threshold,
+            similarity_threshold,
+            candidate_mode=candidate_mode,
+            commit=commit,
+            source=source,
+            progress_callback=job.update,
+            result_key=job.id
+        )
+        return {
+            'total_records': ingested.total_rows,
+            'duplicate_groups': format_duplicate_groups(result['duplicate_groups']),
+            'corpus_duplicates': [
+                {
+                    'rows': duplicate['rows'],
+                    'text': duplicate['text'],
+                    'corpus_index': duplicate['corpus_index'],
+                    'corpus_text': duplicate['corpus_text']
+                }
+                for duplicate in result['corpus_duplicates']
+            ],
+            **select_results(vector_search.result_store.get(job.id)),
+            'committed': result['committed'],
+            'corpus_size': result['corpus_size']
+        }
+    finally:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+def run_crosscheck_pipeline(job, sources, compare, filter_threshold, similarity_threshold,
+                            candidate_mode, tfidf_mode):
+    """交叉比对任务：依次读取各来源，再统一比对"""
+    try:
+        for k, source in enumerate(sources):
+            job.update('ingest', k / len(sources) * 100, f'读取 {source.label}...')
+            try:
+                with metrics.timer(stage='ingest'):
+                    source.read()
+            except ValueError as e:
+                raise ValueError(f'{source.name}: {e}')
+            except Exception as e:
+                raise ValueError(f'无法读取文件 {source.name}: {str(e)}')
+        
+        result = vector_search.check_sources(
+            sources, compare,
+            filter_threshold=filter_threshold,
+            similarity_threshold=similarity_threshold,
+            candidate_mode=candidate_mode,
+            tfidf_mode=tfidf_mode,
+            progress_callback=job.update,
+            result_key=job.id
+        )
+        return {
+            'total_records': result['total_rows'],
+            'duplicate_groups': format_duplicate_groups(result['duplicate_groups']),
+            **select_results(vector_search.result_store.get(job.id))
+        }
+    finally:
+        for path in {source.path for source in sources}:
+            if os.path.exists(path):
+                os.remove(path)
+
+def save_upload_file(file):
+    """校验并保存一个上传的文件，返回 (文件路径, 错误信息)"""
+    if file.filename == '':
+        return None, '没有选择文件'
+    
+    # 检查文件扩展名
+    if not file.filename.lower().endswith(('.xlsx', '.xls', '.csv')):
+        return None, '请上传Excel或CSV文件(.xlsx、.xls或.csv)'
+    
+    # 每个任务使用独立的上传文件，任务结束后删除
+    upload_dir = 'uploads'
+    os.makedirs(upload_dir, exist_ok=True)
+    file_path = os.path.join(upload_dir, f"{uuid.uuid4().hex}{os.path.splitext(file.filename)[1]}")
+    file.save(file_path)
+    return file_path, None
+
+def save_upload():
+    """校验并保存上传的文件，返回 (文件路径, 错误信息)"""
+    if 'file' not in request.files:
+        return None, '没有上传文件'
+    return save_upload_file(request.files['file'])
+
+def crosscheck_sources(file_paths, filenames):
+    """根据表单构建交叉比对的来源与待比较分组，返回 (sources, compare)
+
+    spec（JSON，可选）: {"sources": [{"file": 上传文件序号, "columns": 列名或列名列表, "sheet", "group", "name"}],
+                        "compare": [[分组a, 分组b], ...]}
+    未提供 spec 时每个文件为一个分组，column_name 中以 + 连接的多列合并为一条文本；
+    compare=all 时两两比较所有文件，默认只比较第一个文件与其余文件
+    """
+    spec = request.form.get('spec')
+    if spec:
+        spec = json.loads(spec)
+        sources = [
+            TextSource(file_paths[item['file']], item['columns'],
+                       name=item.get('name') or filenames[item['file']],
+                       sheet=item.get('sheet'), group=item.get('group'))
+            for item in spec['sources']
+        ]
+        compare = [tuple(pair) for pair in spec['compare']] if spec.get('compare') else None
+        return sources, compare
+    
+    columns = [column.strip() for column in request.form.get('column_name', 'text_column').split('+')]
+    sources = []
+    for path, filename in zip(file_paths, filenames):
+        # 同名文件作为不同分组
+        group = filename
+        while any(source.group == group for source in sources):
+            group = f'{group}#{len(sources) + 1}'
+        sources.append(TextSource(path, columns, name=filename, group=group))
+    compare = None
+    if request.form.get('compare') == 'all':
+        compare = [(a.group, b.group) for k, a in enumerate(sources) for b in sources[k + 1:]]
+    return sources, compare
+
+def form_flag(name):
+    return request.form.get(name, '').lower() in ('1', 'true', 'on')
+
 @app.route('/upload', methods=['POST'])
 def upload():
     try:
-        if 'file' not in request.files:
-            return jsonify({'error': '没有上传文件'})
+        file_path, error = save_upload()
+        if error:
+            return jsonify({'error': error})
         
-        file = request.files['file']
-        if file.filename == '':
-            return jsonify({'error': '没有选择文件'})
-        
-        # 检查文件扩展名
-        if not file.filename.endswith(('.xlsx', '.xls')):
-            return jsonify({'error': '请上传Excel文件(.xlsx或.xls)'})
-        
-        # 清理旧文件
-        upload_dir = 'uploads'
-        if os.path.exists(upload_dir):
-            for f in os.listdir(upload_dir):
-                os.remove(os.path.join(upload_dir, f))
-        else:
-            os.makedirs(upload_dir)
+        # 获取列名和阈值
+        column_name = request.form.get('column_name', 'text_column')
+        filter_threshold = float(request.form.get('filter_threshold', 0.3))
+        similarity_threshold = float(request.form.get('similarity_threshold', 0.85))
+        candidate_mode = request.form.get('candidate_mode', 'exhaustive')
+        tfidf_mode = request.form.get('tfidf_mode', 'pair')
         
-        # 保存上传的文件
-        file_path = os.path.join(upload_dir, 'temp.xlsx')
-        file.save(file_path)
+        # 提交后台任务，立即返回任务id
+        job = job_queue.submit(
+            run_upload_job,
+            run_pipeline,
+            (file_path, column_name, filter_threshold, similarity_threshold, candidate_mode, tfidf_mode),
+            form_flag('profile')
+        )
+        return jsonify({'job_id': job.id})
+            
+    except Exception as e:
+        return jsonify({'error': f'上传文件时出错: {str(e)}'})
+
+@app.route('/incremental', methods=['POST'])
+def incremental():
+    """增量查重：上传新批次，与历史库比对；commit=1 时比对后写入历史库"""
+    try:
+        file_path, error = save_upload()
+        if error:
+            return jsonify({'error': error})
         
-        # 获取列名和阈值
         column_name = request.form.get('column_name', 'text_column')
         filter_threshold = float(request.form.get('filter_threshold', 0.3))
         similarity_threshold = float(request.form.get('similarity_threshold', 0.85))
+        candidate_mode = request.form.get('candidate_mode', 'lsh')
+        source = request.form.get('source') or request.files['file'].filename
         
-        # 获取总记录数
-        try:
-            df = pd.read_excel(file_path)
-            total_records = len(df)
-        except Exception as e:
-            return jsonify({'error': f'无法读取Excel文件: {str(e)}'})
+        job = job_queue.submit(
+            run_upload_job,
+            run_incremental_pipeline,
+            (file_path, column_name, filter_threshold, similarity_threshold, candidate_mode,
+             form_flag('commit'), source),
+            form_flag('profile')
+        )
+        return jsonify({'job_id': job.id})
+    
+    except Exception as e:
+        return jsonify({'error': f'上传文件时出错: {str(e)}'})
+
+@app.route('/crosscheck', methods=['POST'])
+def crosscheck():
+    """多文件/多列交叉比对：上传多个文件，只比较不同文件（分组）之间的文本"""
+    file_paths = []
+    try:
+        files = request.files.getlist('file')
+        if len(files) < 2 and not request.form.get('spec'):
+            return jsonify({'error': '交叉比对至少需要上传两个文件'})
+        for file in files:
+            file_path, error = save_upload_file(file)
+            if error:
+                raise ValueError(error)
+            file_paths.append(file_path)
         
-        # 处理文件
-        try:
-            texts, embeddings, potential_pairs, text_to_index = vector_search.process_excel_with_filter(
-                file_path,
-                column_name,
-                filter_threshold,
-                similarity_threshold
-            )
-            
-            # 生成相似度报告
-            similar_pairs = vector_search.generate_similarity_report(texts, embeddings, text_to_index, similarity_threshold)
-            
-            # 转换结果为前端所需格式
-            results = {
-                'total_records': total_records,
-                'initial_pairs': [
-                    {
-                        'text1': pair['text1'],
-                        'text2': pair['text2'],
-                        'index1': pair['index1'],
-                        'index2': pair['index2'],
-                        'similarity': f"{pair['similarity']:.2%}",
-                        'method': pair['method'],
-                        'distance': pair.get('distance', 0)
-                    }
-                    for pair in potential_pairs
-                ],
-                'final_pairs': [
-                    {
-                        'text1': pair['text1'],
-                        'text2': pair['text2'],
-                        'index1': pair['index1'],
-                        'index2': pair['index2'],
-                        'similarity': f"{pair['similarity']:.2%}",
-                        'distance': pair['distance']
-                    }
-                    for pair in similar_pairs
-                ]
-            }
-            
-            return jsonify(results)
-            
-        except Exception as e:
-            return jsonify({'error': f'处理文件时出错: {str(e)}'})
-            
+        sources, compare = crosscheck_sources(file_paths, [file.filename for file in files])
+        used_paths = {source.path for source in sources}
+        for file_path in file_paths:
+            if file_path not in used_paths:
+                os.remove(file_path)
+        filter_threshold = float(request.form.get('filter_threshold', 0.3))
+        similarity_threshold = float(request.form.get('similarity_threshold', 0.85))
+        candidate_mode = request.form.get('candidate_mode', 'inverted')
+        tfidf_mode = request.form.get('tfidf_mode', 'pair')
+        
+        job = job_queue.submit(
+            run_upload_job,
+            run_crosscheck_pipeline,
+            (sources, compare, filter_threshold, similarity_threshold, candidate_mode, tfidf_mode),
+            form_flag('profile')
+        )
+        return jsonify({'job_id': job.id})
+    
     except Exception as e:
+        for file_path in file_paths:
+            if os.path.exists(file_path):
+                os.remove(file_path)
         return jsonify({'error': f'上传文件时出错: {str(e)}'})
 
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': '任务不存在'}), 404
+    return jsonify(job.to_dict(include_result=True))
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    """以Server-Sent Events推送任务进度，任务结束时推送最终状态"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': '任务不存在'}), 404
+    
+    def stream():
+        version = -1
+        while True:
+            current = job.wait_for_change(version)
+            if current == version:
+                # 心跳，防止代理断开空闲连接
+                yield ': keep-alive\n\n'
+                continue
+            version = current
+            yield f"data: {json.dumps(job.to_dict(), ensure_ascii=False)}\n\n"
+            if job.finished:
+                break
+    
+    return Response(stream(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+@app.route('/jobs/<job_id>/results')
+def job_results(job_id):
+    """按新的阈值（?filter=&similarity=）重新筛选任务结果，只在已保存的分数上筛选，不重新计算
+    
+    低于下限（floors）的阈值按下限处理，返回实际使用的阈值；增量查重与交叉比对只能调整相似度阈值。
+    默认只返回相似文本分组，pairs=1 时同时返回逐对明细
+    """
+    results = vector_search.result_store.get(job_id)
+    if results is None:
+        return jsonify({'error': '任务结果不存在'}), 404
+    return jsonify(select_results(
+        results,
+        request.args.get('filter', type=float),
+        request.args.get('similarity', type=float),
+        include_pairs=request.args.get('pairs', '').lower() in ('1', 'true', 'on')
+    ))
+
+@app.route('/jobs/<job_id>/groups/<int:group_id>')
+def job_group_pairs(job_id, group_id):
+    """相似文本分组内的文本对明细；kind=initial 为初筛结果的分组，阈值参数与 /jobs/<id>/results 相同"""
+    results = vector_search.result_store.get(job_id)
+    if results is None:
+        return jsonify({'error': '任务结果不存在'}), 404
+    candidate_indices, pair_indices, _ = results.select(
+        request.args.get('filter', type=float),
+        request.args.get('similarity', type=float)
+    )
+    candidates = request.args.get('kind') == 'initial'
+    if candidates and candidate_indices is None:
+        return jsonify({'error': '该任务没有保存初筛结果'}), 404
+    groups = results.groups(candidate_indices if candidates else pair_indices, candidates)
+    if group_id >= len(groups):
+        return jsonify({'error': '分组不存在'}), 404
+    return jsonify({'pairs': [
+        format_pair(results.candidate(k), with_method=True) if candidates else format_pair(results.pair(k))
+        for k in groups[group_id]['edges']
+    ]})
+
+@app.route('/jobs/<job_id>/profile')
+def job_profile(job_id):
+    """下载任务的 cProfile 结果（?format=txt 为文本摘要）"""
+    path = os.path.join(PROFILE_DIR, f'{os.path.basename(job_id)}.prof')
+    if request.args.get('format') == 'txt':
+        path += '.txt'
+    if not os.path.exists(path):
+        return jsonify({'error': '该任务没有性能采样结果'}), 404
+    return send_file(path, as_attachment=True, download_name=os.path.basename(path))
+
+@app.route('/healthz')
+def healthz():
+    """存活检查：进程能响应请求即可"""
+    return jsonify({'status': 'ok', 'uptime_seconds': warmup.status()['uptime_seconds']})
+
+@app.route('/readyz')
+def readyz():
+    """就绪检查：必需组件预热完成时返回200，否则返回503；同时返回各组件的预热状态"""
+    status = warmup.status()
+    return jsonify(status), 200 if status['ready'] else 503
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus 格式的运行指标"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/download_report')
 def download_report():
+    """下载报告：job_id 指定任务（默认最近一次），type 为阈值档位，filter/similarity 为页面上调整后的阈值，
+    format=csv 时流式输出CSV"""
     try:
         report_type = request.args.get('type', 'all')
         threshold = {
@@ -106,20 +537,32 @@ def download_report():
             '80': 0.8,
             '70': 0.7
         }.get(report_type, 0)
+        if report_type not in ('all', '90', '80', '70'):
+            report_type = 'all'
+        job_id = request.args.get('job_id')
+        # 页面上调整过的阈值，默认为提交任务时的阈值
+        filter_threshold = request.args.get('filter', type=float)
+        similarity_threshold = request.args.get('similarity', type=float)
+        result_store = vector_search.result_store
         
-        # 读取原始报告
-        df = pd.read_excel('similarity_report.xlsx')
-        
-        # 根据阈值筛选
-        if threshold > 0:
-            df = df[df['similarity'] >= threshold]
-        
-        # 生成新的报告文件
-        filtered_report_path = f'similarity_report_{report_type}.xlsx'
-        df.to_excel(filtered_report_path, index=False)
+        if request.args.get('format') == 'csv':
+            # 结果很大时使用CSV，边生成边发送
+            results = result_store.get(job_id)
+            if results is None:
+                return jsonify({'error': '报告不存在'}), 404
+            return Response(
+                results.iter_csv(threshold, filter_threshold=filter_threshold,
+                                 similarity_threshold=similarity_threshold),
+                mimetype='text/csv',
+                headers={'Content-Disposition': f'attachment; filename=similarity_report_{report_type}.csv'}
+            )
         
+        # 按阈值筛选后以 write_only 模式导出，同一任务同一档位只生成一次
+        report_path = result_store.export_xlsx(job_id, threshold, report_type, filter_threshold, similarity_threshold)
+        if report_path is None:
+            return jsonify({'error': '报告不存在'}), 404
         return send_file(
-            filtered_report_path,
+            report_path,
             mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
             as_attachment=True,
             download_name=f'similarity_report_{report_type}.xlsx'
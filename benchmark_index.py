@@ -0,0 +1,127 @@
+"""Milvus索引选择基准测试：在生成的数据上比较 FLAT / IVF_FLAT / HNSW 的构建耗时、查询延迟与召回率
+
+用法: python benchmark_index.py --sizes 1000 20000 200000 --dim 128
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+from dotenv import load_dotenv
+from pymilvus import connections, Collection, CollectionSchema, FieldSchema, DataType, utility
+
+from milvus_index import METRIC_TYPE, choose_index, ivf_nlist, search_params_for
+from similarity_backend import NumpySimilarityBackend
+
+load_dotenv()
+
+BENCHMARK_COLLECTION = "index_benchmark"
+
+
+def generate_data(num_vectors, dim, num_queries, seed=0):
+    """生成带聚类结构的归一化向量，查询向量取自数据附近"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(1, num_vectors // 100), dim))
+    labels = rng.integers(0, len(centers), size=num_vectors)
+    data = centers[labels] + 0.3 * rng.normal(size=(num_vectors, dim))
+    queries = data[rng.integers(0, num_vectors, size=num_queries)] + 0.05 * rng.normal(size=(num_queries, dim))
+    return NumpySimilarityBackend.normalize(data), NumpySimilarityBackend.normalize(queries)
+
+
+def exact_top_k(data, queries, top_k):
+    """暴力计算真实的 top-k 结果"""
+    scores = queries @ data.T
+    return np.argsort(-scores, axis=1)[:, :top_k]
+
+
+def candidate_indexes(num_vectors):
+    """每种索引类型在该规模下的参数"""
+    return [
+        {"metric_type": METRIC_TYPE, "index_type": "FLAT", "params": {}},
+        {"metric_type": METRIC_TYPE, "index_type": "IVF_FLAT", "params": {"nlist": ivf_nlist(num_vectors)}},
+        {"metric_type": METRIC_TYPE, "index_type": "HNSW", "params": {"M": 16, "efConstruction": 200}},
+    ]
+
+
+def build_collection(data):
+    """创建临时集合并插入数据"""
+    if utility.has_collection(BENCHMARK_COLLECTION):
+        utility.drop_collection(BENCHMARK_COLLECTION)
+    schema = CollectionSchema(fields=[
+        FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=False),
+        FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=data.shape[1]),
+    ])
+    collection = Collection(BENCHMARK_COLLECTION, schema=schema)
+    for start in range(0, len(data), 10000):
+        chunk = data[start:start + 10000]
+        collection.insert([list(range(start, start + len(chunk))), chunk.tolist()])
+    collection.flush()
+    return collection
+
+
+def run_benchmark(sizes, dim, num_queries, top_k, target_recall):
+    connections.connect(
+        alias="default",
+        host=os.getenv('MILVUS_HOST', 'localhost'),
+        port=os.getenv('MILVUS_PORT', '19530')
+    )
+    results = []
+    for num_vectors in sizes:
+        data, queries = generate_data(num_vectors, dim, num_queries)
+        truth = exact_top_k(data, queries, top_k)
+        collection = build_collection(data)
+        auto_choice = choose_index(num_vectors)["index_type"]
+
+        for index_params in candidate_indexes(num_vectors):
+            start = time.time()
+            collection.create_index(field_name="embedding", index_params=index_params)
+            utility.wait_for_index_building_complete(BENCHMARK_COLLECTION)
+            collection.load()
+            build_time = time.time() - start
+
+            search_params = search_params_for(index_params, target_recall, top_k)
+            start = time.time()
+            hits = collection.search(
+                data=queries.tolist(),
+                anns_field="embedding",
+                param=search_params,
+                limit=top_k
+            )
+            latency = (time.time() - start) / num_queries
+
+            found = [set(hit.id for hit in query_hits) for query_hits in hits]
+            recall = np.mean([len(found[q] & set(truth[q])) / top_k for q in range(num_queries)])
+            results.append({
+                'num_vectors': num_vectors,
+                'index_type': index_params["index_type"],
+                'auto': index_params["index_type"] == auto_choice,
+                'build_time': build_time,
+                'latency_ms': latency * 1000,
+                'recall': recall,
+                'search_params': search_params["params"]
+            })
+            print(f"n={num_vectors:>8} {index_params['index_type']:<9}{'*' if results[-1]['auto'] else ' '} "
+                  f"构建 {build_time:7.2f}s  查询 {latency * 1000:7.2f}ms/条  "
+                  f"recall@{top_k} {recall:.3f}  {search_params['params']}")
+
+            collection.release()
+            collection.drop_index()
+
+        utility.drop_collection(BENCHMARK_COLLECTION)
+    print("* 表示该规模下自动选择的索引")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Milvus索引选择基准测试")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 20000, 200000])
+    parser.add_argument('--dim', type=int, default=128)
+    parser.add_argument('--queries', type=int, default=100)
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--target-recall', type=float, default=0.95)
+    args = parser.parse_args()
+    run_benchmark(args.sizes, args.dim, args.queries, args.top_k, args.target_recall)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+"""全流程基准测试：在带有预置近似重复的合成中文语料上测量初筛、向量化和相似度报告各阶段
+
+不依赖 OpenAI：向量由确定性的字符二元组哈希模型生成；Milvus 路径需加 --milvus 并启动 Milvus 服务。
+结果以JSON写入 --output，便于在不同提交之间比较。
+
+用法: python benchmark_pipeline.py --sizes 1000 20000 200000 --candidate-modes inverted lsh
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+from itertools import combinations
+
+import numpy as np
+
+from excel_reader import IngestResult
+from main import VectorSearch
+from result_store import ResultStore
+from similarity_backend import NumpySimilarityBackend
+from text_filter import TextFilter
+from tokenizer import Tokenizer, shutdown_process_pools
+
+# 合成语料使用的常用汉字与标点
+_CHARS = (
+    "的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说产种面而"
+    "方后多定行学法所民得经十三之进着等部度家电力里如水化高自二理起小物现实加量都两体制机当使点从业本去把性好"
+    "应开它合还因由其些然前外天政四日那社义事平形相全表间样与关各重新线内数正心反你明看原又么利比或但质气第向"
+    "道命此变条只没结解问意建月公无系军很情者最立代想已通并提直题党程展五果料象员革位入常文总次品式活设及管特"
+    "件长求老头基资边流路级少图山统接知较将组见计别她手角期根论运农指几九区强放决西被干做必战先回则任取据处队"
+)
+_PUNCTUATION = "，。；！？"
+_EMBEDDING_DIM = 256
+
+
+def _make_word(rng):
+    return ''.join(rng.choice(_CHARS) for _ in range(rng.choice((1, 2, 2, 3))))
+
+
+def _make_sentence(rng, num_words, topic):
+    """约一半的词取自主题词表，使不相关的文本之间也有词汇重叠（初筛的难负例）"""
+    return [rng.choice(topic) if rng.random() < 0.5 else _make_word(rng) for _ in range(num_words)]
+
+
+def _perturb(rng, words):
+    """对句子做一到两处小改动：替换一个字、交换相邻词、删除一个词或插入标点"""
+    words = list(words)
+    for _ in range(rng.choice((1, 1, 2))):
+        op = rng.randrange(4)
+        pos = rng.randrange(len(words))
+        if op == 0:
+            word = words[pos]
+            k = rng.randrange(len(word))
+            words[pos] = word[:k] + rng.choice(_CHARS) + word[k + 1:]
+        elif op == 1 and pos + 1 < len(words):
+            words[pos], words[pos + 1] = words[pos + 1], words[pos]
+        elif op == 2 and len(words) > 4:
+            del words[pos]
+        else:
+            words.insert(pos, rng.choice(_PUNCTUATION))
+    return words
+
+
+def generate_corpus(num_rows, duplicate_ratio=0.2, max_cluster_size=3, num_topics=50, seed=0):
+    """生成合成语料，返回 (texts_with_index, planted_pairs)
+
+    约 duplicate_ratio 的行是其他行的近似重复；同一簇内的任意两行构成一对预置重复（按行号，行号从1开始）。
+    """
+    rng = random.Random(seed)
+    topics = [[_make_word(rng) for _ in range(30)] for _ in range(num_topics)]
+    clusters = []
+    rows = 0
+    while rows < num_rows:
+        base = _make_sentence(rng, rng.randint(10, 20), rng.choice(topics))
+        size = 1
+        if rng.random() < duplicate_ratio:
+            size = min(rng.randint(2, max_cluster_size), num_rows - rows)
+        clusters.append([base] + [_perturb(rng, base) for _ in range(size - 1)])
+        rows += size
+
+    # 打乱行的顺序，使重复文本分散在文件各处
+    entries = [(cluster_id, ''.join(words)) for cluster_id, cluster in enumerate(clusters) for words in cluster]
+    rng.shuffle(entries)
+
+    texts_with_index = []
+    rows_by_cluster = {}
+    for row_number, (cluster_id, text) in enumerate(entries, 1):
+        texts_with_index.append((row_number, text))
+        rows_by_cluster.setdefault(cluster_id, []).append(row_number)
+    planted_pairs = set()
+    for cluster_rows in rows_by_cluster.values():
+        planted_pairs.update(combinations(sorted(cluster_rows), 2))
+    return texts_with_index, planted_pairs
+
+
+class StubEmbedder:
+    """确定性的本地向量模型：字符二元组哈希到固定维度，相近文本得到相近向量"""
+
+    def __init__(self, dim=_EMBEDDING_DIM):
+        self.dim = dim
+        self.model_name = f"stub-bigram-{dim}"
+
+    def encode(self, texts):
+        embeddings = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for k in range(max(1, len(text) - 1)):
+                h = zlib.crc32(text[k:k + 2].encode('utf-8'))
+                embeddings[row, h % self.dim] += 1.0 if (h >> 16) & 1 else -1.0
+        return embeddings.tolist()
+
+
+def peak_rss_mb():
+    """当前进程与已结束子进程的峰值常驻内存（MB，单调不减）"""
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+    return round(own, 1), round(children, 1)
+
+
+def expand_pairs(pairs, rows_by_representative):
+    """把代表行之间的配对展开为其分组内所有行之间的配对"""
+    expanded = set()
+    for row1, row2 in pairs:
+        for a in rows_by_representative.get(row1, (row1,)):
+            for b in rows_by_representative.get(row2, (row2,)):
+                if a != b:
+                    expanded.add((min(a, b), max(a, b)))
+    return expanded
+
+
+def score_pairs(found, planted):
+    """按预置重复计算召回率与精确率"""
+    hits = len(found & planted)
+    return {
+        'found_pairs': len(found),
+        'recall': round(hits / len(planted), 4) if planted else 1.0,
+        'precision': round(hits / len(found), 4) if found else 1.0,
+    }
+
+
+def _measure(fn):
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    own, children = peak_rss_mb()
+    return result, {'seconds': round(elapsed, 3), 'peak_rss_mb': own, 'children_peak_rss_mb': children}
+
+
+def benchmark_size(num_rows, args, vector_search):
+    texts_with_index, planted = generate_corpus(num_rows, args.duplicate_ratio, seed=args.seed)
+    print(f"\n=== {num_rows} 行, 预置重复 {len(planted)} 对 ===")
+    result = {'num_rows': num_rows, 'planted_pairs': len(planted), 'stages': {}}
+    stages = result['stages']
+
+    # 读取阶段：精确/规范化去重（与 process_excel_with_filter 相同）
+    def ingest():
+        ingested = IngestResult()
+        for row_number, text in texts_with_index:
+            ingested.add(row_number, text)
+        return ingested, ingested.representatives(), ingested.duplicate_groups()
+    (ingested, representatives, duplicate_groups), stats = _measure(ingest)
+    rows_by_representative = {group['rows'][0]: group['rows'] for group in duplicate_groups}
+    dedup_pairs = set()
+    for group in duplicate_groups:
+        dedup_pairs.update(combinations(group['rows'], 2))
+    stats.update(score_pairs(dedup_pairs, planted))
+    stats['throughput_rows_per_s'] = round(num_rows / max(stats['seconds'], 1e-9))
+    stats['representatives'] = len(representatives)
+    stages['ingest'] = stats
+
+    # 分词阶段：串行与多进程（进程池冷启动 / 复用已启动的进程池），用于校准 Tokenizer.parallel_threshold
+    texts = [text for _, text in representatives]
+    Tokenizer.initialize()
+    for name, parallel_threshold in (('serial', len(texts) + 1), ('parallel_cold', 0), ('parallel_warm', 0)):
+        if name == 'parallel_cold':
+            shutdown_process_pools()
+        tokenizer = Tokenizer(parallel_threshold=parallel_threshold, workers=args.tokenize_workers)
+        _, stats = _measure(lambda: tokenizer.tokenize_many(texts))
+        stats['throughput_texts_per_s'] = round(len(texts) / max(stats['seconds'], 1e-9))
+        stages[f'tokenize_{name}'] = stats
+        print(f"分词 {name:<13} {stats['seconds']:8.2f}s  ({args.tokenize_workers or os.cpu_count()} 进程)")
+
+    # 初筛阶段：每种候选对生成方式各运行一次
+    pipeline_pairs = None
+    for mode in args.candidate_modes:
+        if mode == 'exhaustive' and len(representatives) > args.max_exhaustive_rows:
+            print(f"跳过 exhaustive 初筛（{len(representatives)} > {args.max_exhaustive_rows} 条）")
+            continue
+        # 每次使用新的分词缓存，避免前一次运行的结果影响耗时
+        text_filter = TextFilter()
+        pairs, stats = _measure(lambda: text_filter.batch_process(
+            representatives,
+            threshold=args.filter_threshold,
+            candidate_mode=mode,
+            tfidf_mode=args.tfidf_mode,
+            workers=args.workers,
+            block_size=args.block_size
+        ))
+        found = expand_pairs(((p['index1'], p['index2']) for p in pairs), rows_by_representative) | dedup_pairs
+        stats.update(score_pairs(found, planted))
+        stats['throughput_rows_per_s'] = round(len(representatives) / max(stats['seconds'], 1e-9))
+        stages[f'prefilter_{mode}'] = stats
+        print(f"初筛 {mode:<10} {stats['seconds']:8.2f}s  recall {stats['recall']:.3f}  "
+              f"precision {stats['precision']:.3f}  峰值RSS {stats['peak_rss_mb']}MB")
+        if mode == args.pipeline_mode or pipeline_pairs is None:
+            pipeline_pairs = pairs
+    if pipeline_pairs is None:
+        return result
+
+    # 向量阶段：只对初筛保留的文本计算向量
+    text_to_index = {}
+    for pair in pipeline_pairs:
+        text_to_index[pair['text1']] = pair['index1']
+        text_to_index[pair['text2']] = pair['index2']
+    texts = list(text_to_index)
+    # 与 process_excel_with_filter 一致：L2归一化后再写入/比较
+    embeddings, stats = _measure(
+        lambda: NumpySimilarityBackend.normalize(vector_search.embed_texts(texts)).tolist() if texts else []
+    )
+    stats['texts'] = len(texts)
+    stats['throughput_texts_per_s'] = round(len(texts) / max(stats['seconds'], 1e-9))
+    stages['embedding'] = stats
+    print(f"向量化 {len(texts)} 条 {stats['seconds']:8.2f}s")
+
+    # 报告阶段：进程内NumPy后端，以及可选的Milvus后端
+    backends = ['numpy'] + (['milvus'] if args.milvus else [])
+    with tempfile.TemporaryDirectory() as tmpdir:
+        vector_search.result_store = ResultStore(tmpdir)
+        for backend in backends:
+            if not texts:
+                break
+            vector_search.similarity_backend = backend
+            partition_name = None
+            if backend == 'milvus':
+                partition_name = vector_search.partition_for_job(f"benchmark_{num_rows}")
+                vector_search.upsert_job_vectors(partition_name, texts, embeddings)
+            similar_pairs, stats = _measure(lambda: vector_search.generate_similarity_report(
+                texts, embeddings, text_to_index,
+                similarity_threshold=args.similarity_threshold,
+                partition_name=partition_name,
+                duplicate_groups=duplicate_groups,
+                result_key=backend
+            ))
+            if partition_name is not None:
+                vector_search.collection.release()
+                vector_search.collection.drop_partition(partition_name)
+            found = expand_pairs(((p['index1'], p['index2']) for p in similar_pairs), rows_by_representative)
+            stats.update(score_pairs(found | dedup_pairs, planted))
+            stats['throughput_texts_per_s'] = round(len(texts) / max(stats['seconds'], 1e-9))
+            stages[f'report_{backend}'] = stats
+            print(f"报告 {backend:<7} {stats['seconds']:8.2f}s  recall {stats['recall']:.3f}  "
+                  f"precision {stats['precision']:.3f}")
+            _, stats = _measure(lambda: vector_search.result_store.export_xlsx(backend))
+            stages[f'export_xlsx_{backend}'] = stats
+            print(f"导出 {backend:<7} {stats['seconds']:8.2f}s")
+    return result
+
+
+def git_commit():
+    """当前代码的提交号，便于对比不同版本的结果"""
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="文本查重全流程基准测试")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--duplicate-ratio', type=float, default=0.2)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--candidate-modes', nargs='+', default=['exhaustive', 'inverted', 'lsh'],
+                        choices=['exhaustive', 'inverted', 'lsh'])
+    parser.add_argument('--pipeline-mode', default='inverted', help="后续向量与报告阶段使用哪种初筛结果")
+    parser.add_argument('--max-exhaustive-rows', type=int, default=5000)
+    parser.add_argument('--tfidf-mode', default='corpus', choices=['pair', 'corpus'])
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--block-size', type=int, default=256)
+    parser.add_argument('--tokenize-workers', type=int, default=None, help="多进程分词的进程数，默认为CPU核数")
+    parser.add_argument('--filter-threshold', type=float, default=0.3)
+    parser.add_argument('--similarity-threshold', type=float, default=0.8)
+    parser.add_argument('--milvus', action='store_true', help="同时测试Milvus后端（需要Milvus服务）")
+    parser.add_argument('--onnx-model-dir', default=None,
+                        help="使用本地ONNX向量模型（见 onnx_embedder）代替确定性模型，测量真实的向量计算耗时")
+    parser.add_argument('--output', default='benchmark_results.json')
+    args = parser.parse_args()
+
+    if args.onnx_model_dir:
+        from onnx_embedder import OnnxEmbedder
+        embedder = OnnxEmbedder(args.onnx_model_dir)
+    else:
+        embedder = StubEmbedder()
+
+    vector_search = VectorSearch(
+        collection_name="text_vectors_benchmark",
+        use_cache=False,
+        similarity_backend='milvus' if args.milvus else 'numpy',
+        partition_ttl=0,
+        embedder=embedder
+    )
+    results = [benchmark_size(num_rows, args, vector_search) for num_rows in args.sizes]
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'cpu_count': os.cpu_count(),
+        'args': vars(args),
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n基准测试结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""启动耗时基准测试：测量导入 app、首个请求以及预热完成（/readyz 返回200）所需的时间
+
+每种预热方式（WARMUP=eager/background/off）在独立的子进程中测量，eager 相当于导入时加载全部组件的旧行为。
+同时列出导入 app 后已加载的重量级依赖，以及这些依赖单独冷导入的耗时。
+
+用法: python benchmark_startup.py --modes eager background off --runs 3
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# 启动时应当不再导入的重量级依赖
+HEAVY_MODULES = ['torch', 'sentence_transformers', 'sklearn', 'scipy', 'pymilvus', 'openai', 'pandas']
+
+
+def child(ready_timeout):
+    """子进程：导入 app 并依次发送请求，结果以JSON输出到最后一行"""
+    start = time.perf_counter()
+    import app
+    import_seconds = time.perf_counter() - start
+    loaded = [name for name in HEAVY_MODULES if name in sys.modules]
+
+    client = app.app.test_client()
+    result = {'import_seconds': round(import_seconds, 3), 'heavy_modules_loaded': loaded}
+    for path in ['/healthz', '/readyz', '/']:
+        request_start = time.perf_counter()
+        response = client.get(path)
+        result[f'first_request_seconds {path}'] = round(time.perf_counter() - request_start, 4)
+        result[f'first_status {path}'] = response.status_code
+
+    # 首次分词需要加载jieba词典，预热完成后不再承担这部分耗时
+    tokenize_start = time.perf_counter()
+    app.vector_search.text_filter.tokenizer.tokenize('启动耗时基准测试')
+    result['first_tokenize_seconds'] = round(time.perf_counter() - tokenize_start, 4)
+
+    status = None
+    while time.perf_counter() - start < ready_timeout:
+        status = client.get('/readyz').get_json()
+        if status['ready']:
+            break
+        time.sleep(0.05)
+    result['time_to_ready_seconds'] = round(time.perf_counter() - start, 3) if status and status['ready'] else None
+    result['components'] = status['components'] if status else None
+    print(json.dumps(result, ensure_ascii=False))
+
+
+def run_child(mode, args):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        return _run_child(mode, args, tmpdir)
+
+
+def _run_child(mode, args, tmpdir):
+    env = dict(
+        os.environ,
+        WARMUP=mode,
+        # 缓存与结果写入每次运行独立的临时目录，不影响本地数据，也不复用上一次运行的分词缓存
+        TOKEN_CACHE_PATH=os.path.join(tmpdir, 'token_cache.db'),
+        EMBEDDING_CACHE_PATH=os.path.join(tmpdir, 'embedding_cache.db'),
+        CORPUS_DB_PATH=os.path.join(tmpdir, 'corpus.db'),
+        REPORT_DIR=os.path.join(tmpdir, 'reports'),
+        PROFILE_DIR=os.path.join(tmpdir, 'profiles'),
+    )
+    start = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--child', '--ready-timeout', str(args.ready_timeout)],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env, capture_output=True, text=True, check=True
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result['process_seconds'] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def cold_import_seconds(module):
+    """在新进程中单独导入模块的耗时，模块不存在时返回 None"""
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    completed = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True)
+    if completed.returncode != 0:
+        return None
+    return round(float(completed.stdout.strip().splitlines()[-1]), 3)
+
+
+def summarize(runs):
+    """各数值指标取中位数"""
+    summary = {}
+    for key, value in runs[0].items():
+        values = [run[key] for run in runs if isinstance(run.get(key), (int, float))]
+        if isinstance(value, (int, float)) and len(values) == len(runs):
+            summary[key] = round(statistics.median(values), 4)
+        else:
+            summary[key] = runs[-1][key]
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="应用启动耗时基准测试")
+    parser.add_argument('--modes', nargs='+', default=['eager', 'background', 'off'],
+                        choices=['eager', 'background', 'off'])
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--ready-timeout', type=float, default=120)
+    parser.add_argument('--output', default='benchmark_startup.json')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.ready_timeout)
+        return
+
+    results = {}
+    for mode in args.modes:
+        runs = [run_child(mode, args) for _ in range(args.runs)]
+        results[mode] = summarize(runs)
+        stats = results[mode]
+        ready = stats['time_to_ready_seconds']
+        print(f"{mode:<10} 导入 {stats['import_seconds']:6.2f}s  首个请求 {stats['first_request_seconds /']:6.3f}s  "
+              f"首次分词 {stats['first_tokenize_seconds']:6.3f}s  "
+              f"就绪 {'超时' if ready is None else f'{ready:6.2f}s'}  "
+              f"已加载: {', '.join(stats['heavy_modules_loaded']) or '无'}")
+        failed = [name for name, state in (stats['components'] or {}).items() if state['status'] == 'failed']
+        if failed:
+            print(f"{'':<10} 预热失败: {', '.join(failed)}")
+
+    # 子进程导入 app 前不能加载其他模块，因此在此处才导入
+    from benchmark_pipeline import git_commit
+    imports = {module: cold_import_seconds(module) for module in HEAVY_MODULES}
+    print("单独冷导入: " + ', '.join(f"{module} {seconds}s" for module, seconds in imports.items()
+                                 if seconds is not None))
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'args': vars(args),
+        'results': results,
+        'cold_import_seconds': imports,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n基准测试结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
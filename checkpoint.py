@@ -0,0 +1,321 @@
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import numpy as np
+
+from excel_reader import IngestResult
+from metrics import metrics
+
+# 检测流程的阶段，按执行顺序排列；某阶段参数变化时，其后各阶段的产物一并作废
+STAGES = ['ingest', 'prefilter', 'embedding', 'vector_pairs', 'report']
+_EMBEDDING_BATCH_DIR = 'embedding_batches'
+
+
+def _normalize_params(params):
+    """经JSON往返，使元组与列表等写入清单前后可直接比较"""
+    return json.loads(json.dumps(params or {}, sort_keys=True))
+
+
+def _atomic_write(path, write):
+    """先写临时文件再替换，中途失败时不会留下不完整的产物"""
+    tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    with open(tmp_path, 'wb') as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+def _encode_texts(texts):
+    encoded = [text.encode('utf-8') for text in texts]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+
+def _decode_texts(text_bytes, offsets):
+    text_bytes = text_bytes.tobytes()
+    return [text_bytes[offsets[k]:offsets[k + 1]].decode('utf-8') for k in range(len(offsets) - 1)]
+
+
+def _save_ingest(f, ingested):
+    f.write(json.dumps({
+        'total_rows': ingested.total_rows,
+        'rows_by_text': list(ingested.rows_by_text.items())
+    }, ensure_ascii=False).encode('utf-8'))
+
+
+def _load_ingest(f):
+    data = json.loads(f.read().decode('utf-8'))
+    ingested = IngestResult()
+    ingested.total_rows = data['total_rows']
+    ingested.rows_by_text = {text: rows for text, rows in data['rows_by_text']}
+    return ingested
+
+
+def _save_pairs(f, pairs):
+    """文本对按列保存：(文本, 行号) 只保存一次，数值字段为数组，字符串字段（如 method）按类别编码"""
+    ids = {}
+    texts, rows = [], []
+
+    def intern(pair, side):
+        key = (pair[f'text{side}'], pair[f'index{side}'])
+        text_id = ids.get(key)
+        if text_id is None:
+            text_id = ids[key] = len(texts)
+            texts.append(key[0])
+            rows.append(key[1])
+        return text_id
+
+    arrays = {
+        'text1': np.array([intern(pair, 1) for pair in pairs], dtype=np.int32),
+        'text2': np.array([intern(pair, 2) for pair in pairs], dtype=np.int32),
+    }
+    arrays['text_bytes'], arrays['text_offsets'] = _encode_texts(texts)
+    arrays['rows'] = np.array(rows, dtype=np.int64)
+    fields = [field for field in (pairs[0] if pairs else {}) if field[:-1] not in ('text', 'index')]
+    for field in fields:
+        values = [pair[field] for pair in pairs]
+        if isinstance(values[0], str):
+            categories = sorted(set(values))
+            arrays[f'{field}.categories'] = np.array(categories)
+            codes = {category: k for k, category in enumerate(categories)}
+            arrays[field] = np.array([codes[value] for value in values], dtype=np.int32)
+        else:
+            arrays[field] = np.array(values, dtype=np.float64)
+    np.savez(f, fields=np.array(fields, dtype=str), **arrays)
+
+
+def _load_pairs(f):
+    with np.load(f) as data:
+        arrays = {name: data[name] for name in data.files}
+    texts = _decode_texts(arrays['text_bytes'], arrays['text_offsets'])
+    rows = arrays['rows'].tolist()
+    columns = {}
+    for field in arrays['fields'].tolist():
+        values = arrays[field]
+        if f'{field}.categories' in arrays:
+            categories = arrays[f'{field}.categories'].tolist()
+            columns[field] = [categories[code] for code in values.tolist()]
+        else:
+            columns[field] = values.tolist()
+    pairs = []
+    for k, (i, j) in enumerate(zip(arrays['text1'].tolist(), arrays['text2'].tolist())):
+        pair = {'text1': texts[i], 'text2': texts[j], 'index1': rows[i], 'index2': rows[j]}
+        for field, values in columns.items():
+            pair[field] = values[k]
+        pairs.append(pair)
+    return pairs
+
+
+def _save_vectors(f, vectors):
+    """vectors 为 {文本: embedding}"""
+    text_bytes, offsets = _encode_texts(list(vectors))
+    np.savez(f, text_bytes=text_bytes, text_offsets=offsets,
+             vectors=np.asarray(list(vectors.values()), dtype=np.float32))
+
+
+def _load_vectors(f):
+    with np.load(f) as data:
+        texts = _decode_texts(data['text_bytes'], data['text_offsets'])
+        return dict(zip(texts, data['vectors'].tolist()))
+
+
+# 各阶段产物的文件名与读写函数；report 阶段的结果保存在结果库中，清单只记录完成状态
+_ARTIFACTS = {
+    'ingest': ('ingest.json', _save_ingest, _load_ingest),
+    'prefilter': ('prefilter_pairs.npz', _save_pairs, _load_pairs),
+    'embedding': ('embeddings.npz', _save_vectors, _load_vectors),
+    'vector_pairs': ('vector_pairs.npz', _save_pairs, _load_pairs),
+}
+
+
+class JobCheckpoint:
+    """单个文件（内容哈希+列名）的检测流程检查点
+
+    每个阶段完成后将产物写入任务目录，并在 manifest.json 中记录阶段参数与完成状态。
+    再次以相同参数检测同一文件时跳过已完成的阶段；向量阶段按批次提交，失败后从最后提交的批次继续。
+    同一文件的多个任务应在 exclusive() 中执行整个流程，否则一个任务以不同参数重新开始某阶段时会删除另一个任务正在使用的产物。
+    """
+
+    def __init__(self, directory, lock, run_lock=None):
+        self.directory = directory
+        self._lock = lock
+        self._run_lock = run_lock or threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._manifest_path = os.path.join(directory, 'manifest.json')
+
+    def _read_manifest(self):
+        try:
+            with open(self._manifest_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {'stages': {}}
+
+    def _write_manifest(self, manifest):
+        manifest['updated_at'] = time.time()
+        _atomic_write(self._manifest_path,
+                      lambda f: f.write(json.dumps(manifest, ensure_ascii=False, indent=2).encode('utf-8')))
+
+    def manifest(self):
+        with self._lock:
+            return self._read_manifest()
+
+    @contextmanager
+    def exclusive(self, on_wait=None):
+        """独占执行同一文件的检测流程；需要等待其他任务时先调用 on_wait()"""
+        if not self._run_lock.acquire(blocking=False):
+            print(f"检查点 {os.path.basename(self.directory)} 正被其他任务使用，等待其完成...")
+            if on_wait is not None:
+                on_wait()
+            self._run_lock.acquire()
+        try:
+            yield self
+        finally:
+            self._run_lock.release()
+
+    def is_complete(self, stage, params=None):
+        state = self.manifest()['stages'].get(stage)
+        return (state is not None and state['status'] == 'complete'
+                and state['params'] == _normalize_params(params))
+
+    def _discard(self, stage):
+        """删除阶段的产物（调用方持有锁）"""
+        if stage in _ARTIFACTS:
+            path = os.path.join(self.directory, _ARTIFACTS[stage][0])
+            if os.path.exists(path):
+                os.remove(path)
+        if stage == 'embedding':
+            shutil.rmtree(os.path.join(self.directory, _EMBEDDING_BATCH_DIR), ignore_errors=True)
+
+    def start(self, stage, params=None):
+        """开始执行阶段；参数与上次不同时，作废该阶段及其后各阶段的产物（参数相同则保留已提交的部分产物）"""
+        params = _normalize_params(params)
+        with self._lock:
+            manifest = self._read_manifest()
+            state = manifest['stages'].get(stage)
+            if state is None or state['params'] != params:
+                for later in STAGES[STAGES.index(stage):]:
+                    self._discard(later)
+                    manifest['stages'].pop(later, None)
+            manifest['stages'][stage] = {'status': 'running', 'params': params, 'started_at': time.time()}
+            self._write_manifest(manifest)
+
+    def complete(self, stage, **info):
+        with self._lock:
+            manifest = self._read_manifest()
+            state = manifest['stages'].get(stage)
+            if state is None:
+                # 未在 exclusive() 中执行时，该阶段可能已被另一个以不同参数运行的任务作废，产物不再记录为完成
+                print(f"检查点阶段 {stage} 已被其他任务作废，不记录完成状态")
+                return
+            state.update(info, status='complete', completed_at=time.time())
+            state['seconds'] = round(state['completed_at'] - state['started_at'], 3)
+            self._write_manifest(manifest)
+
+    def run(self, stage, params, compute):
+        """已完成的阶段直接读取产物，否则执行 compute() 并保存产物（没有产物的阶段每次都执行）"""
+        if stage in _ARTIFACTS and self.is_complete(stage, params):
+            try:
+                value = self.load(stage)
+            except Exception as e:
+                print(f"读取检查点 {stage} 失败，重新计算: {e}")
+            else:
+                print(f"检查点: 跳过已完成的阶段 {stage}")
+                metrics.inc('checkpoint_stages_total', stage=stage, result='reused')
+                return value
+        self.start(stage, params)
+        value = compute()
+        self.save(stage, value)
+        self.complete(stage, items=len(value) if hasattr(value, '__len__') else None)
+        metrics.inc('checkpoint_stages_total', stage=stage, result='computed')
+        return value
+
+    def load(self, stage):
+        name, _, load = _ARTIFACTS[stage]
+        with open(os.path.join(self.directory, name), 'rb') as f:
+            return load(f)
+
+    def save(self, stage, value):
+        if stage not in _ARTIFACTS:
+            return
+        name, save, _ = _ARTIFACTS[stage]
+        with metrics.timer(stage='checkpoint_save'):
+            _atomic_write(os.path.join(self.directory, name), lambda f: save(f, value))
+        if stage == 'embedding':
+            # 完整产物已写入，按批次提交的部分产物不再需要
+            with self._lock:
+                shutil.rmtree(os.path.join(self.directory, _EMBEDDING_BATCH_DIR), ignore_errors=True)
+
+    def commit_embeddings(self, texts, embeddings):
+        """提交一个已完成批次的向量"""
+        directory = os.path.join(self.directory, _EMBEDDING_BATCH_DIR)
+        os.makedirs(directory, exist_ok=True)
+        _atomic_write(os.path.join(directory, f'{time.time_ns()}-{uuid.uuid4().hex[:8]}.npz'),
+                      lambda f: _save_vectors(f, dict(zip(texts, embeddings))))
+
+    def committed_embeddings(self):
+        """之前运行中已提交批次的向量 {文本: embedding}"""
+        directory = os.path.join(self.directory, _EMBEDDING_BATCH_DIR)
+        vectors = {}
+        if not os.path.isdir(directory):
+            return vectors
+        for name in sorted(os.listdir(directory)):
+            if name.endswith('.npz'):
+                with open(os.path.join(directory, name), 'rb') as f:
+                    vectors.update(_load_vectors(f))
+        return vectors
+
+
+def run_stage(checkpoint, stage, params, compute):
+    """未启用检查点（checkpoint 为 None）时直接执行"""
+    if checkpoint is None:
+        return compute()
+    return checkpoint.run(stage, params, compute)
+
+
+class CheckpointStore:
+    """按键（通常为 job_id_for_file 的结果）管理检查点目录，超过 ttl 秒未更新的目录在打开新检查点时清理"""
+
+    def __init__(self, root='checkpoints', ttl=7 * 24 * 3600):
+        self.root = root
+        self.ttl = ttl
+        self._locks = {}      # key -> 清单读写锁
+        self._run_locks = {}  # key -> 整个流程的独占锁（见 JobCheckpoint.exclusive）
+        self._lock = threading.Lock()
+
+    def open(self, key):
+        self.sweep()
+        key = os.path.basename(str(key))
+        with self._lock:
+            lock = self._locks.setdefault(key, threading.Lock())
+            run_lock = self._run_locks.setdefault(key, threading.Lock())
+        return JobCheckpoint(os.path.join(self.root, key), lock, run_lock)
+
+    def _in_use(self, key):
+        """是否有任务正在 exclusive() 中使用该检查点"""
+        with self._lock:
+            run_lock = self._run_locks.get(key)
+        return run_lock is not None and run_lock.locked()
+
+    def sweep(self, ttl=None):
+        """删除过期的检查点目录，返回删除数量"""
+        ttl = self.ttl if ttl is None else ttl
+        if not ttl or not os.path.isdir(self.root):
+            return 0
+        removed = 0
+        now = time.time()
+        for key in os.listdir(self.root):
+            directory = os.path.join(self.root, key)
+            manifest_path = os.path.join(directory, 'manifest.json')
+            updated_at = os.path.getmtime(manifest_path if os.path.exists(manifest_path) else directory)
+            # 长时间等待或运行中的任务仍在使用的目录不清理
+            if now - updated_at > ttl and not self._in_use(key):
+                shutil.rmtree(directory, ignore_errors=True)
+                removed += 1
+        if removed:
+            print(f"已清理 {removed} 个过期的检查点")
+        return removed
@@ -0,0 +1,85 @@
+import heapq
+
+
+class UnionFind:
+    """并查集（按大小合并 + 路径减半），节点为任意可哈希的值"""
+
+    def __init__(self):
+        self.parent = {}
+        self.size = {}
+
+    def find(self, node):
+        parent = self.parent
+        if node not in parent:
+            parent[node] = node
+            self.size[node] = 1
+            return node
+        while parent[node] != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    def union(self, a, b):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a == root_b:
+            return root_a
+        if self.size[root_a] < self.size[root_b]:
+            root_a, root_b = root_b, root_a
+        self.parent[root_b] = root_a
+        self.size[root_a] += self.size[root_b]
+        return root_a
+
+
+def _widest_paths(source, adjacency):
+    """从 source 出发到组内各节点的最宽路径（路径上最低相似度最大），直接相连时即为两者的相似度"""
+    best = {source: 1.0}
+    heap = [(-1.0, 0, source)]
+    counter = 1
+    while heap:
+        width, _, node = heapq.heappop(heap)
+        width = -width
+        if width < best.get(node, -1):
+            continue
+        for neighbor, similarity in adjacency[node].items():
+            candidate = min(width, similarity)
+            if candidate > best.get(neighbor, -1):
+                best[neighbor] = candidate
+                heapq.heappush(heap, (-candidate, counter, neighbor))
+                counter += 1
+    return best
+
+
+def cluster_pairs(edges):
+    """把文本对合并为连通分量（相似文本分组）
+
+    edges: [(节点a, 节点b, 相似度)]，节点为可哈希的文本标识
+    返回按成员数降序的分组列表，每个分组为
+        {'medoid': 中心节点, 'members': [(节点, 与中心的相似度)], 'edges': [文本对在 edges 中的下标]}
+    中心节点（medoid）为组内相似度之和最大的节点；成员按与中心的相似度降序排列，中心排在首位。
+    不直接相连的成员取经组内文本对到达中心的最宽路径相似度。
+    """
+    union_find = UnionFind()
+    for a, b, _ in edges:
+        union_find.union(a, b)
+
+    components = {}
+    for position, (a, b, similarity) in enumerate(edges):
+        component = components.setdefault(union_find.find(a), {'adjacency': {}, 'edges': []})
+        component['edges'].append(position)
+        adjacency = component['adjacency']
+        # 同一对文本出现多次时保留最高相似度
+        if similarity > adjacency.setdefault(a, {}).get(b, -1):
+            adjacency[a][b] = similarity
+            adjacency.setdefault(b, {})[a] = similarity
+
+    groups = []
+    for component in components.values():
+        adjacency = component['adjacency']
+        medoid = max(adjacency, key=lambda node: sum(adjacency[node].values()))
+        widths = _widest_paths(medoid, adjacency)
+        members = sorted(widths.items(), key=lambda item: (item[0] != medoid, -item[1]))
+        groups.append({'medoid': medoid, 'members': members, 'edges': component['edges']})
+    # 成员多的分组在前，成员数相同时按组内最高相似度
+    groups.sort(key=lambda group: (-len(group['members']),
+                                   -max(edges[position][2] for position in group['edges'])))
+    return groups
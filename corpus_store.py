@@ -0,0 +1,281 @@
+import json
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from text_filter import TextFilter, text_fingerprint
+
+
+class CorpusStore:
+    """持久化的历史文本库，供增量查重使用
+
+    保存已入库文本的分词结果、MinHash/LSH分桶、分词倒排索引（含文档频率）以及按模型区分的向量，
+    新批次只需按桶/倒排项查询可能相似的历史文本，查询量与批次大小成正比，与库的规模无关。
+    """
+
+    # SQLite 单条语句的参数数量有限，批量查询时分块
+    _CHUNK_SIZE = 500
+
+    def __init__(self, db_path='corpus.db', text_filter=None, min_overlap=2, max_df_ratio=0.05,
+                 min_posting_cap=1000):
+        self.db_path = db_path
+        # 与 InvertedTokenIndex 相同：文档频率超过 max(min_posting_cap, max_df_ratio * 库大小) 的词不参与召回
+        self.min_overlap = min_overlap
+        self.max_df_ratio = max_df_ratio
+        self.min_posting_cap = min_posting_cap
+        self.text_filter = text_filter or TextFilter()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS texts (
+                id INTEGER PRIMARY KEY,
+                text TEXT NOT NULL,
+                fingerprint TEXT NOT NULL,
+                tokens TEXT NOT NULL,
+                length INTEGER NOT NULL,
+                source TEXT,
+                row INTEGER,
+                added_at REAL NOT NULL
+            );
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_texts_fingerprint ON texts (fingerprint);
+            CREATE TABLE IF NOT EXISTS lsh_buckets (
+                band INTEGER NOT NULL,
+                bucket BLOB NOT NULL,
+                text_id INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_lsh_buckets ON lsh_buckets (band, bucket);
+            CREATE TABLE IF NOT EXISTS postings (
+                token TEXT NOT NULL,
+                text_id INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_postings_token ON postings (token);
+            CREATE TABLE IF NOT EXISTS token_df (
+                token TEXT PRIMARY KEY,
+                df INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS vectors (
+                text_id INTEGER NOT NULL,
+                model TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                PRIMARY KEY (text_id, model)
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+        """)
+        self._conn.commit()
+        self._check_lsh_params()
+
+    def _lsh_params(self):
+        return json.dumps({
+            'num_bands': self.text_filter.num_bands,
+            'rows_per_band': self.text_filter.rows_per_band,
+            'perm_a': int(self.text_filter._perm_a[0]),
+        })
+
+    def _check_lsh_params(self):
+        """LSH参数与入库时不一致时，根据已保存的分词重建分桶"""
+        params = self._lsh_params()
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'lsh_params'").fetchone()
+            if row is not None and row[0] == params:
+                return
+            if row is not None:
+                print("历史库的LSH参数已变化，正在重建分桶...")
+                self._conn.execute('DELETE FROM lsh_buckets')
+                last_id = 0
+                while True:
+                    rows = self._conn.execute(
+                        'SELECT id, tokens FROM texts WHERE id > ? ORDER BY id LIMIT 10000', (last_id,)
+                    ).fetchall()
+                    if not rows:
+                        break
+                    self._insert_buckets([text_id for text_id, _ in rows],
+                                         [set(json.loads(tokens)) for _, tokens in rows])
+                    last_id = rows[-1][0]
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('lsh_params', ?)", (params,))
+            self._conn.commit()
+
+    def _band_keys(self, token_sets):
+        """每条文本在每个band上的桶键，空分词集合返回 None"""
+        signatures = self.text_filter.minhash_signatures(token_sets)
+        rows = self.text_filter.rows_per_band
+        keys = []
+        for pos, words in enumerate(token_sets):
+            if not words:
+                keys.append(None)
+                continue
+            keys.append([signatures[pos, band * rows:(band + 1) * rows].tobytes()
+                         for band in range(self.text_filter.num_bands)])
+        return keys
+
+    def _insert_buckets(self, text_ids, token_sets):
+        rows = []
+        for text_id, band_keys in zip(text_ids, self._band_keys(token_sets)):
+            if band_keys is not None:
+                rows.extend((band, key, text_id) for band, key in enumerate(band_keys))
+        self._conn.executemany('INSERT INTO lsh_buckets (band, bucket, text_id) VALUES (?, ?, ?)', rows)
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM texts').fetchone()[0]
+
+    def find_fingerprints(self, fingerprints):
+        """按规范化指纹查找已入库的文本，返回 {fingerprint: {'id', 'text', 'source', 'row'}}"""
+        fingerprints = list(dict.fromkeys(fingerprints))
+        found = {}
+        with self._lock:
+            for start in range(0, len(fingerprints), self._CHUNK_SIZE):
+                chunk = fingerprints[start:start + self._CHUNK_SIZE]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self._conn.execute(
+                    f'SELECT fingerprint, id, text, source, row FROM texts WHERE fingerprint IN ({placeholders})',
+                    chunk
+                ).fetchall()
+                for fingerprint, text_id, text, source, row in rows:
+                    found[fingerprint] = {'id': text_id, 'text': text, 'source': source, 'row': row}
+        return found
+
+    def lsh_candidates(self, token_sets, lengths):
+        """按LSH分桶查找可能相似的历史文本，返回 [(批次内位置, 历史文本id)]，已按长度比 >= 0.5 过滤"""
+        candidates = set()
+        with self._lock:
+            for pos, band_keys in enumerate(self._band_keys(token_sets)):
+                if band_keys is None:
+                    continue
+                for band, key in enumerate(band_keys):
+                    rows = self._conn.execute(
+                        'SELECT b.text_id, t.length FROM lsh_buckets b JOIN texts t ON t.id = b.text_id '
+                        'WHERE b.band = ? AND b.bucket = ?', (band, key)
+                    ).fetchall()
+                    for text_id, length in rows:
+                        if min(length, lengths[pos]) >= 0.5 * max(length, lengths[pos]):
+                            candidates.add((pos, text_id))
+        return sorted(candidates)
+
+    def token_candidates(self, token_sets):
+        """按分词倒排索引统计共同词数量，返回共同词 >= min_overlap 的 [(批次内位置, 历史文本id)]"""
+        vocabulary = list({word for words in token_sets for word in words})
+        candidates = []
+        with self._lock:
+            corpus_size = self._conn.execute('SELECT COUNT(*) FROM texts').fetchone()[0]
+            posting_cap = max(self.min_posting_cap, int(self.max_df_ratio * corpus_size))
+            # 先查文档频率，高频词不读取倒排列表
+            usable = set()
+            for start in range(0, len(vocabulary), self._CHUNK_SIZE):
+                chunk = vocabulary[start:start + self._CHUNK_SIZE]
+                placeholders = ','.join('?' * len(chunk))
+                usable.update(word for word, df in self._conn.execute(
+                    f'SELECT token, df FROM token_df WHERE token IN ({placeholders})', chunk
+                ) if df <= posting_cap)
+            postings = {}
+            usable = list(usable)
+            for start in range(0, len(usable), self._CHUNK_SIZE):
+                chunk = usable[start:start + self._CHUNK_SIZE]
+                placeholders = ','.join('?' * len(chunk))
+                for word, text_id in self._conn.execute(
+                        f'SELECT token, text_id FROM postings WHERE token IN ({placeholders})', chunk):
+                    postings.setdefault(word, []).append(text_id)
+
+        for pos, words in enumerate(token_sets):
+            counts = {}
+            for word in words:
+                for text_id in postings.get(word, ()):
+                    counts[text_id] = counts.get(text_id, 0) + 1
+            candidates.extend((pos, text_id) for text_id in sorted(counts) if counts[text_id] >= self.min_overlap)
+        return candidates
+
+    def get_texts(self, text_ids):
+        """返回 {id: {'text', 'tokens', 'source', 'row'}}"""
+        text_ids = list(dict.fromkeys(text_ids))
+        found = {}
+        with self._lock:
+            for start in range(0, len(text_ids), self._CHUNK_SIZE):
+                chunk = text_ids[start:start + self._CHUNK_SIZE]
+                placeholders = ','.join('?' * len(chunk))
+                for text_id, text, tokens, source, row in self._conn.execute(
+                        f'SELECT id, text, tokens, source, row FROM texts WHERE id IN ({placeholders})', chunk):
+                    found[text_id] = {'text': text, 'tokens': tuple(json.loads(tokens)), 'source': source, 'row': row}
+        return found
+
+    def get_vectors(self, model_name, text_ids):
+        """返回已保存的向量 {id: embedding}"""
+        text_ids = list(dict.fromkeys(text_ids))
+        found = {}
+        with self._lock:
+            for start in range(0, len(text_ids), self._CHUNK_SIZE):
+                chunk = text_ids[start:start + self._CHUNK_SIZE]
+                placeholders = ','.join('?' * len(chunk))
+                for text_id, blob in self._conn.execute(
+                        f'SELECT text_id, vector FROM vectors WHERE model = ? AND text_id IN ({placeholders})',
+                        [model_name] + chunk):
+                    found[text_id] = np.frombuffer(blob, dtype=np.float32).tolist()
+        return found
+
+    def put_vectors(self, model_name, vectors):
+        """保存向量，vectors 为 {id: embedding}"""
+        with self._lock:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO vectors (text_id, model, vector) VALUES (?, ?, ?)',
+                [(text_id, model_name, np.asarray(embedding, dtype=np.float32).tobytes())
+                 for text_id, embedding in vectors.items()]
+            )
+            self._conn.commit()
+
+    def add(self, entries, model_name=None, vectors=None, source=None):
+        """将新文本写入历史库
+
+        entries: [(行号, 文本, 分词)]；指纹已存在的文本跳过
+        vectors: 可选的 {文本: embedding}，与 model_name 一起保存，之后比对时无需重新计算
+        返回新写入的 {文本: id}
+        """
+        vectors = vectors or {}
+        added = {}
+        now = time.time()
+        with self._lock:
+            new_entries = []
+            for row, text, tokens in entries:
+                fingerprint = text_fingerprint(text)
+                exists = self._conn.execute('SELECT 1 FROM texts WHERE fingerprint = ?', (fingerprint,)).fetchone()
+                if exists or text in added:
+                    continue
+                cursor = self._conn.execute(
+                    'INSERT INTO texts (text, fingerprint, tokens, length, source, row, added_at) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (text, fingerprint, json.dumps(list(tokens), ensure_ascii=False), len(text), source, row, now)
+                )
+                added[text] = cursor.lastrowid
+                new_entries.append((cursor.lastrowid, set(tokens)))
+
+            if new_entries:
+                self._insert_buckets([text_id for text_id, _ in new_entries], [words for _, words in new_entries])
+                self._conn.executemany(
+                    'INSERT INTO postings (token, text_id) VALUES (?, ?)',
+                    [(word, text_id) for text_id, words in new_entries for word in words]
+                )
+                df = {}
+                for _, words in new_entries:
+                    for word in words:
+                        df[word] = df.get(word, 0) + 1
+                self._conn.executemany(
+                    'INSERT INTO token_df (token, df) VALUES (?, ?) '
+                    'ON CONFLICT(token) DO UPDATE SET df = df + excluded.df',
+                    list(df.items())
+                )
+                if model_name is not None:
+                    self._conn.executemany(
+                        'INSERT OR REPLACE INTO vectors (text_id, model, vector) VALUES (?, ?, ?)',
+                        [(text_id, model_name, np.asarray(vectors[text], dtype=np.float32).tobytes())
+                         for text, text_id in added.items() if text in vectors]
+                    )
+            self._conn.commit()
+        print(f"历史库新增 {len(added)} 条文本")
+        return added
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,126 @@
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+import numpy as np
+
+from metrics import metrics
+
+
+def normalize_text(text):
+    """规范化文本：全角转半角、合并空白"""
+    text = unicodedata.normalize('NFKC', text)
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+class EmbeddingCache:
+    """基于SQLite的持久化向量缓存，键为 (模型名, 维度, 规范化文本哈希)"""
+
+    # SQLite 单条语句的参数数量有限，批量查询时分块
+    _CHUNK_SIZE = 500
+
+    def __init__(self, db_path='embedding_cache.db', max_entries=200000):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                dim INTEGER NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)')
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model_name, dim, text):
+        """生成缓存键"""
+        digest = hashlib.sha256(normalize_text(text).encode('utf-8')).hexdigest()
+        return f"{model_name}:{dim}:{digest}"
+
+    def get_many(self, model_name, dim, texts):
+        """批量查询缓存，返回 {text: embedding}，只包含命中的文本"""
+        keys = {}
+        for text in texts:
+            keys.setdefault(self.make_key(model_name, dim, text), []).append(text)
+
+        found = {}
+        key_list = list(keys)
+        with self._lock:
+            for start in range(0, len(key_list), self._CHUNK_SIZE):
+                chunk = key_list[start:start + self._CHUNK_SIZE]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self._conn.execute(
+                    f'SELECT key, vector FROM embeddings WHERE key IN ({placeholders})', chunk
+                ).fetchall()
+                for key, blob in rows:
+                    embedding = np.frombuffer(blob, dtype=np.float32).tolist()
+                    for text in keys[key]:
+                        found[text] = embedding
+
+            # 更新命中项的最近使用时间（LRU）
+            if found:
+                now = time.time()
+                hit_keys = [key for key in key_list if keys[key][0] in found]
+                self._conn.executemany(
+                    'UPDATE embeddings SET last_used = ? WHERE key = ?',
+                    [(now, key) for key in hit_keys]
+                )
+                self._conn.commit()
+
+        misses = len(set(texts)) - len(found)
+        self.hits += len(found)
+        self.misses += misses
+        metrics.inc('cache_hits_total', len(found), cache='embedding')
+        metrics.inc('cache_misses_total', misses, cache='embedding')
+        return found
+
+    def put_many(self, model_name, dim, texts, embeddings):
+        """批量写入缓存，并按容量淘汰最久未使用的条目"""
+        now = time.time()
+        rows = [
+            (self.make_key(model_name, dim, text), model_name, dim,
+             np.asarray(embedding, dtype=np.float32).tobytes(), now)
+            for text, embedding in zip(texts, embeddings)
+        ]
+        with self._lock:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO embeddings (key, model, dim, vector, last_used) VALUES (?, ?, ?, ?, ?)',
+                rows
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """超过容量时删除最久未使用的条目"""
+        count = self._conn.execute('SELECT COUNT(*) FROM embeddings').fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                'DELETE FROM embeddings WHERE key IN '
+                '(SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)',
+                (overflow,)
+            )
+
+    def stats(self):
+        """返回命中统计"""
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,151 @@
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from metrics import metrics
+
+
+def estimate_tokens(text):
+    """粗略估计文本的token数：中文约每字1个token，英文约每4个字符1个token"""
+    cjk = sum(1 for ch in text if '一' <= ch <= '鿿')
+    return cjk + (len(text) - cjk) // 4 + 1
+
+
+def is_rate_limit_error(error):
+    """判断异常是否为限流（HTTP 429）"""
+    return getattr(error, 'status_code', None) == 429
+
+
+def _retry_after(error):
+    """从限流异常的响应头中读取 Retry-After（秒）"""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        return float(headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """令牌桶限流器：遇到429时降低速率并暂停，成功后逐步恢复"""
+
+    def __init__(self, rate, capacity=None, min_rate=0.1):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min_rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount=1):
+        """阻塞直到获得令牌"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self.blocked_until and self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = max(self.blocked_until - now, (amount - self.tokens) / self.rate)
+            time.sleep(wait)
+
+    def penalize(self, retry_after=None):
+        """收到429后速率减半，并在 retry_after 秒内暂停发放令牌"""
+        with self._lock:
+            now = time.monotonic()
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = 0
+            self.blocked_until = max(self.blocked_until, now + (retry_after or 1 / self.rate))
+
+    def reward(self):
+        """请求成功后缓慢恢复速率"""
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate * 1.1)
+
+
+class EmbeddingScheduler:
+    """将文本按token数和条数打包成批，并发请求embedding接口"""
+
+    def __init__(self, embed_fn, max_batch_items=256, max_batch_tokens=8000, max_workers=4,
+                 requests_per_second=5, max_retries=3, max_rate_limit_retries=10):
+        self.embed_fn = embed_fn
+        self.max_batch_items = max_batch_items
+        self.max_batch_tokens = max_batch_tokens
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.max_rate_limit_retries = max_rate_limit_retries
+        self.rate_limiter = TokenBucket(requests_per_second)
+        self.rate_limit_hits = 0
+
+    def make_batches(self, texts):
+        """按条数和token数上限切分批次，返回 [(起始位置, 文本列表)]"""
+        batches = []
+        current, current_tokens, start = [], 0, 0
+        for pos, text in enumerate(texts):
+            tokens = estimate_tokens(text)
+            if current and (len(current) >= self.max_batch_items or current_tokens + tokens > self.max_batch_tokens):
+                batches.append((start, current))
+                current, current_tokens, start = [], 0, pos
+            current.append(text)
+            current_tokens += tokens
+        if current:
+            batches.append((start, current))
+        return batches
+
+    def _run_batch(self, batch):
+        """执行单个批次，限流错误由令牌桶退避，其他错误指数退避重试"""
+        failures = 0
+        rate_limited = 0
+        while True:
+            self.rate_limiter.acquire()
+            try:
+                result = self.embed_fn(batch)
+                self.rate_limiter.reward()
+                return result
+            except Exception as e:
+                if is_rate_limit_error(e):
+                    rate_limited += 1
+                    self.rate_limit_hits += 1
+                    metrics.inc('api_retries_total', reason='rate_limit')
+                    if rate_limited > self.max_rate_limit_retries:
+                        raise
+                    self.rate_limiter.penalize(_retry_after(e))
+                    continue
+                failures += 1
+                if failures >= self.max_retries:
+                    raise
+                metrics.inc('api_retries_total', reason='error')
+                time.sleep(2 ** failures)
+
+    def run(self, texts, progress_callback=None, batch_callback=None):
+        """并发计算所有文本的embedding，结果顺序与输入一致
+        
+        batch_callback(batch, embeddings) 在每个批次完成后调用，可用于及时写入缓存
+        """
+        texts = list(texts)
+        results = [None] * len(texts)
+        batches = self.make_batches(texts)
+        done = 0
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            # 在调用方的上下文中执行，使工作线程中记录的指标归属到当前任务
+            futures = {
+                executor.submit(contextvars.copy_context().run, self._run_batch, batch): (start, batch)
+                for start, batch in batches
+            }
+            for future in as_completed(futures):
+                start, batch = futures[future]
+                embeddings = future.result()
+                results[start:start + len(batch)] = embeddings
+                if batch_callback is not None:
+                    batch_callback(batch, embeddings)
+                done += len(batch)
+                if progress_callback is not None:
+                    progress_callback(done, len(texts))
+        return results
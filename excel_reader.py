@@ -0,0 +1,226 @@
+import csv
+import os
+
+from openpyxl import load_workbook
+
+from text_filter import text_fingerprint
+
+# 空单元格读取后的文本（与 pandas astype(str) 一致）
+EMPTY_CELL_TEXT = 'nan'
+
+
+def is_empty_text(text):
+    """空单元格或只有空白的文本"""
+    return text == EMPTY_CELL_TEXT or not text.strip()
+
+
+class IngestResult:
+    """文本列的读取结果：总行数、按首次出现顺序的唯一文本及其全部行号"""
+
+    def __init__(self):
+        self.total_rows = 0
+        self.rows_by_text = {}  # text -> [行号, ...]，dict保持首次出现顺序
+        self._groups = None
+
+    def add(self, row_number, text):
+        self.total_rows += 1
+        self.rows_by_text.setdefault(text, []).append(row_number)
+        self._groups = None
+
+    def fingerprint_groups(self):
+        """按规范化指纹合并文本（仅空白、标点、大小写或全半角不同的视为重复），按首次出现顺序返回分组
+        
+        每个分组为 {'representative': (行号, 文本), 'texts': [...], 'rows': [...], 'match_type': 'exact'|'normalized'}
+        空单元格不参与分组：不报告为重复，也不进入初筛（其共同词不足，本来也不会与其他文本配对）
+        """
+        if self._groups is None:
+            groups = {}
+            for text, rows in self.rows_by_text.items():
+                if is_empty_text(text):
+                    continue
+                group = groups.setdefault(text_fingerprint(text), {'texts': [], 'rows': []})
+                group['texts'].append(text)
+                group['rows'].extend(rows)
+            for group in groups.values():
+                group['rows'].sort()
+                # 首个文本最先出现，其第一行即分组的最小行号
+                group['representative'] = (self.rows_by_text[group['texts'][0]][0], group['texts'][0])
+                group['match_type'] = 'exact' if len(group['texts']) == 1 else 'normalized'
+            self._groups = list(groups.values())
+        return self._groups
+
+    def representatives(self):
+        """每个指纹分组只保留一条代表文本，返回按行号排序的 [(行号, 文本)]"""
+        return sorted((group['representative'] for group in self.fingerprint_groups()), key=lambda item: item[0])
+
+    def duplicate_groups(self):
+        """包含两行及以上的重复分组"""
+        return [group for group in self.fingerprint_groups() if len(group['rows']) >= 2]
+
+    @property
+    def unique_count(self):
+        return len(self.rows_by_text)
+
+    def texts_with_index(self):
+        """展开为按行号排序的 [(行号, 文本)]"""
+        return sorted(
+            ((row, text) for text, rows in self.rows_by_text.items() for row in rows),
+            key=lambda item: item[0]
+        )
+
+
+def _cell_to_text(value):
+    """与 pandas astype(str) 保持一致：空单元格为 'nan'"""
+    if value is None:
+        return EMPTY_CELL_TEXT
+    return str(value)
+
+
+def _cells_to_text(values):
+    """单列时与 _cell_to_text 相同；多列时按列顺序以换行连接非空单元格，全部为空时为 'nan'"""
+    if len(values) == 1:
+        return _cell_to_text(values[0])
+    parts = [str(value) for value in values if value is not None]
+    return '\n'.join(parts) if parts else EMPTY_CELL_TEXT
+
+
+def _as_columns(column_name):
+    """列名可以是单个列名，也可以是需要合并的多个列名"""
+    return [column_name] if isinstance(column_name, str) else list(column_name)
+
+
+def _check_columns(columns, header, kind):
+    for column_name in columns:
+        if column_name not in header:
+            raise ValueError(f"Column {column_name} not found in {kind} file")
+
+
+def _iter_xlsx(path, column_name, chunk_size, sheet_name=None):
+    columns = _as_columns(column_name)
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        if sheet_name is not None and sheet_name not in workbook.sheetnames:
+            raise ValueError(f"Sheet {sheet_name} not found in Excel file")
+        sheet = workbook[sheet_name] if sheet_name is not None else workbook.active
+        header = next(sheet.iter_rows(min_row=1, max_row=1, values_only=True), ())
+        _check_columns(columns, header, 'Excel')
+        positions = [header.index(column_name) + 1 for column_name in columns]
+        min_col, max_col = min(positions), max(positions)
+
+        chunk = []
+        # 只读取目标列所在的范围，行号从1开始（不含表头）
+        for row_number, row in enumerate(
+                sheet.iter_rows(min_row=2, min_col=min_col, max_col=max_col, values_only=True), 1):
+            chunk.append((row_number, _cells_to_text([row[position - min_col] for position in positions])))
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+    finally:
+        workbook.close()
+
+
+def _iter_csv(path, column_name, chunk_size):
+    columns = _as_columns(column_name)
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        _check_columns(columns, header, 'CSV')
+        positions = [header.index(column_name) for column_name in columns]
+
+        chunk = []
+        for row_number, row in enumerate(reader, 1):
+            values = [row[column] if column < len(row) and row[column] != '' else None for column in positions]
+            chunk.append((row_number, _cells_to_text(values)))
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+def _iter_xls(path, column_name, chunk_size, sheet_name=None):
+    # openpyxl 不支持旧版 .xls，只加载目标列；pandas 导入较慢，仅在此处使用
+    import pandas as pd
+    columns = _as_columns(column_name)
+    try:
+        df = pd.read_excel(path, sheet_name=sheet_name if sheet_name is not None else 0, usecols=columns)
+    except ValueError:
+        raise ValueError(f"Column {', '.join(columns)} not found in Excel file")
+    if len(columns) == 1:
+        texts = df[columns[0]].astype(str).tolist()
+    else:
+        values = df[columns].astype(object).where(df[columns].notna(), None).values.tolist()
+        texts = [_cells_to_text(row) for row in values]
+    for start in range(0, len(texts), chunk_size):
+        yield [(row_number, text) for row_number, text in enumerate(texts[start:start + chunk_size], start + 1)]
+
+
+def iter_column_chunks(path, column_name, chunk_size=5000, sheet_name=None):
+    """流式读取表格中的指定列（多个列名时合并为一条文本），每次产生一批 [(行号, 文本)]
+
+    sheet_name: 工作表名称，默认为活动工作表；CSV文件忽略
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        return _iter_csv(path, column_name, chunk_size)
+    if extension == '.xls':
+        return _iter_xls(path, column_name, chunk_size, sheet_name)
+    return _iter_xlsx(path, column_name, chunk_size, sheet_name)
+
+
+def default_sheet_name(path):
+    """表格默认读取的工作表名称，CSV文件返回 None"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        return None
+    if extension == '.xls':
+        import pandas as pd
+        return pd.ExcelFile(path).sheet_names[0]
+    workbook = load_workbook(path, read_only=True)
+    try:
+        return workbook.active.title
+    finally:
+        workbook.close()
+
+
+def read_text_column(path, column_name, chunk_size=5000, sheet_name=None):
+    """单次遍历读取文本列：同时统计行数并对相同文本去重"""
+    result = IngestResult()
+    for chunk in iter_column_chunks(path, column_name, chunk_size, sheet_name):
+        for row_number, text in chunk:
+            result.add(row_number, text)
+    return result
+
+
+class TextSource:
+    """交叉比对的一个数据来源：某个文件（工作表）中的一列，或需要合并为一条文本的多列
+
+    group 相同的来源属于同一分组，比对时只比较不同分组（或指定分组）之间的文本。
+    """
+
+    def __init__(self, path, columns, name=None, sheet=None, group=None):
+        self.path = path
+        self.columns = _as_columns(columns)
+        self.name = name or os.path.basename(path)
+        self.sheet = sheet
+        self.group = group or self.name
+        self.ingested = None
+
+    @property
+    def column_label(self):
+        return '+'.join(str(column_name) for column_name in self.columns)
+
+    @property
+    def label(self):
+        """来源标识：文件名[/工作表]:列名"""
+        sheet = f'/{self.sheet}' if self.sheet else ''
+        return f'{self.name}{sheet}:{self.column_label}'
+
+    def read(self, chunk_size=5000):
+        """读取文本列，结果保存在 ingested 中"""
+        if self.sheet is None:
+            self.sheet = default_sheet_name(self.path)
+        self.ingested = read_text_column(self.path, self.columns, chunk_size, self.sheet)
+        return self.ingested
@@ -0,0 +1,143 @@
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import metrics
+
+# 各阶段在总进度中所占的区间（百分比）
+STAGE_RANGES = {
+    'queued': (0, 0),
+    'ingest': (0, 5),
+    'prefilter': (5, 50),
+    'embedding': (50, 80),
+    'report': (80, 100),
+}
+
+STAGE_LABELS = {
+    'queued': '排队中',
+    'ingest': '读取文件',
+    'prefilter': '文本初筛',
+    'embedding': '生成文本向量',
+    'report': '生成相似度报告',
+}
+
+
+class Job:
+    """后台任务的状态与进度"""
+
+    def __init__(self, job_id):
+        self.id = job_id
+        self.status = 'queued'  # queued / running / done / failed
+        self.stage = 'queued'
+        self.progress = 0.0
+        self.message = STAGE_LABELS['queued']
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.version = 0
+        self._condition = threading.Condition()
+
+    def _notify(self):
+        self.version += 1
+        self._condition.notify_all()
+
+    def update(self, stage, percent=0, message=None):
+        """更新阶段进度，percent 为该阶段内的百分比"""
+        low, high = STAGE_RANGES.get(stage, (self.progress, self.progress))
+        with self._condition:
+            self.stage = stage
+            self.progress = max(self.progress, low + (high - low) * min(max(percent, 0), 100) / 100)
+            self.message = message or STAGE_LABELS.get(stage, stage)
+            self._notify()
+
+    def start(self):
+        with self._condition:
+            self.status = 'running'
+            self._notify()
+
+    def finish(self, result):
+        with self._condition:
+            self.status = 'done'
+            self.progress = 100.0
+            self.message = '处理完成'
+            self.result = result
+            self.finished_at = time.time()
+            self._notify()
+
+    def fail(self, error):
+        with self._condition:
+            self.status = 'failed'
+            self.error = error
+            self.message = error
+            self.finished_at = time.time()
+            self._notify()
+
+    @property
+    def finished(self):
+        return self.status in ('done', 'failed')
+
+    def wait_for_change(self, version, timeout=15):
+        """阻塞直到状态版本号变化或超时，返回当前版本号"""
+        with self._condition:
+            if self.version == version and not self.finished:
+                self._condition.wait(timeout)
+            return self.version
+
+    def to_dict(self, include_result=False):
+        data = {
+            'job_id': self.id,
+            'status': self.status,
+            'stage': self.stage,
+            'progress': round(self.progress, 1),
+            'message': self.message,
+        }
+        if self.error:
+            data['error'] = self.error
+        if include_result and self.status == 'done':
+            data['result'] = self.result
+        return data
+
+
+class JobQueue:
+    """有界线程池执行的任务队列，完成的任务保留 retention 秒供查询"""
+
+    def __init__(self, max_workers=2, retention=3600):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self.retention = retention
+        self.jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs):
+        """提交任务，fn 的第一个参数为 Job 对象，返回值作为任务结果"""
+        job = Job(uuid.uuid4().hex)
+        with self._lock:
+            self._purge()
+            self.jobs[job.id] = job
+        self.executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def _run(self, job, fn, args, kwargs):
+        job.start()
+        start = time.perf_counter()
+        try:
+            job.finish(fn(job, *args, **kwargs))
+        except Exception as e:
+            traceback.print_exc()
+            job.fail(str(e))
+        metrics.observe('job_seconds', time.perf_counter() - start)
+        metrics.inc('jobs_total', status=job.status)
+
+    def _purge(self):
+        """删除超过保留时间的已完成任务"""
+        now = time.time()
+        expired = [job_id for job_id, job in self.jobs.items()
+                   if job.finished and now - job.finished_at > self.retention]
+        for job_id in expired:
+            del self.jobs[job_id]
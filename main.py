@@ -1,38 +1,216 @@
 import os
-import pandas as pd
-from openai import OpenAI
-from sentence_transformers import SentenceTransformer
-from pymilvus import connections, Collection, CollectionSchema, FieldSchema, DataType, utility
 from dotenv import load_dotenv
 import time
+import hashlib
+import threading
+from contextlib import contextmanager
 import backoff
-from text_filter import TextFilter  # 导入文本过滤器
+from text_filter import TextFilter, text_fingerprint  # 导入文本过滤器
+from tokenizer import Tokenizer
+from embedding_cache import EmbeddingCache
+from embedding_scheduler import EmbeddingScheduler
+from similarity_backend import NumpySimilarityBackend
+from milvus_index import choose_index, normalize_index, search_params_for, same_index
+from excel_reader import read_text_column
+from metrics import metrics
+from result_store import PairResults, ResultStore
+from checkpoint import CheckpointStore, run_stage
 
 # 加载环境变量
 load_dotenv()
 
+def _record_backoff(details):
+    """backoff 重试回调：计入重试指标"""
+    metrics.inc('api_retries_total', reason='backoff')
+
+def text_id(text):
+    """根据文本内容生成63位整数id，作为Milvus主键（内容寻址）"""
+    return int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], 'big') & ((1 << 63) - 1)
+
+# Milvus 单次搜索的 limit（topk）上限
+MAX_SEARCH_LIMIT = 16384
+
+def job_id_for_file(file_path, column_name):
+    """根据文件内容和列名生成任务id，同一文件重复上传时复用已写入的向量"""
+    digest = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    digest.update(column_name.encode('utf-8'))
+    return digest.hexdigest()[:16]
+
 class VectorSearch:
-    def __init__(self, collection_name="text_vectors", use_openai=True):
+    def __init__(self, collection_name="text_vectors", use_openai=True, use_cache=True, encode_batch_size=64,
+                 similarity_backend='auto', numpy_backend_max_texts=20000, partition_ttl=24 * 3600,
+                 target_recall=0.95, embedder=None, embedding_backend=None):
         self.collection_name = collection_name
-        self.use_openai = use_openai
-        # OpenAI模型维度为1536，Sentence-Transformer模型维度为384
-        self.dim = 1536 if use_openai else 384
-        self.text_filter = TextFilter()
+        # 向量模型：'openai'、'sentence_transformers' 或 'onnx'（本地量化模型，见 onnx_embedder）
+        embedding_backend = embedding_backend or os.getenv('EMBEDDING_BACKEND')
+        if embedding_backend == 'onnx' and embedder is None:
+            from onnx_embedder import OnnxEmbedder
+            embedder = OnnxEmbedder.from_env()
+        elif embedding_backend in ('openai', 'sentence_transformers'):
+            use_openai = embedding_backend == 'openai'
+        elif embedding_backend not in (None, 'onnx'):
+            raise ValueError(f"Unknown embedding backend: {embedding_backend}")
+        # 自定义向量模型（需提供 model_name、dim 和 encode(texts)），例如基准测试中的确定性模型
+        self.embedder = embedder
+        self.use_openai = use_openai and embedder is None
+        if embedder is not None:
+            self.model_name = embedder.model_name
+        else:
+            # OpenAI模型维度为1536，Sentence-Transformer模型维度为384
+            self._dim = 1536 if use_openai else 384
+            self.model_name = "text-embedding-ada-002" if use_openai else "all-MiniLM-L6-v2"
+        # 分词结果持久化缓存，重复上传相同文本时无需再次分词
+        self.text_filter = TextFilter(tokenizer=Tokenizer(
+            cache_path=os.getenv('TOKEN_CACHE_PATH', 'token_cache.db'),
+            parallel_threshold=int(os.getenv('TOKENIZE_PARALLEL_THRESHOLD', 20000))
+        ))
+        self.encode_batch_size = encode_batch_size
+        # 初筛并行进程数（<=1 为串行）与分块大小
+        self.prefilter_workers = int(os.getenv('PREFILTER_WORKERS', 1))
+        self.prefilter_block_size = int(os.getenv('PREFILTER_BLOCK_SIZE', 256))
         
-        if use_openai:
-            self.client = OpenAI(
-                api_key=os.getenv('OPENAI_API_KEY'),
-                base_url=os.getenv('OPENAI_API_BASE')
+        # 报告阶段的相似度后端：'milvus'、'numpy' 或 'auto'（按文本数量自动选择）
+        if similarity_backend not in ('auto', 'milvus', 'numpy'):
+            raise ValueError(f"Unknown similarity backend: {similarity_backend}")
+        self.similarity_backend = similarity_backend
+        self.numpy_backend_max_texts = numpy_backend_max_texts
+        self.numpy_backend = NumpySimilarityBackend(
+            block_size=int(os.getenv('NUMPY_BACKEND_BLOCK_SIZE', 1024))
+        )
+        # 每个任务的相似文本对按列保存，下载报告时按阈值筛选导出
+        self.result_store = ResultStore(os.getenv('REPORT_DIR', 'reports'))
+        # 整表查重按不高于下限的阈值计算并保存全部分数，页面上在下限以上调整阈值时无需重新计算（见 score_floors）
+        self.filter_floor = float(os.getenv('RESULTS_FILTER_FLOOR', 0.2))
+        self.similarity_floor = float(os.getenv('RESULTS_SIMILARITY_FLOOR', 0.7))
+        # 各阶段的中间产物按文件保存，重新检测同一文件时跳过已完成的阶段（见 checkpoint）
+        self.checkpoint_store = CheckpointStore(
+            os.getenv('CHECKPOINT_DIR', 'checkpoints'),
+            ttl=float(os.getenv('CHECKPOINT_TTL', 7 * 24 * 3600))
+        )
+        self._milvus_ready = False
+        self._milvus_lock = threading.Lock()
+        # Milvus索引按集合规模自动选择，搜索参数由目标召回率推导
+        self.target_recall = target_recall
+        self.index_params = None
+        # 集合为所有任务共用：正在搜索的任务计数，有任务在搜索时不重建索引，重建期间新的搜索等待
+        self._index_condition = threading.Condition()
+        self._active_searches = 0
+        
+        # 每个任务写入独立分区，超过 partition_ttl 秒未使用的分区由后台线程清理
+        # 多个任务并发执行，正在写入或搜索的分区（分区名 -> 使用中的任务数）不会被清理
+        self.partition_ttl = partition_ttl
+        self._partition_last_used = {}
+        self._partitions_in_use = {}
+        self._partition_lock = threading.Lock()
+        self._sweeper = None
+        
+        # 持久化向量缓存，相同文本不重复调用API/模型
+        self.embedding_cache = None
+        if use_cache:
+            self.embedding_cache = EmbeddingCache(
+                db_path=os.getenv('EMBEDDING_CACHE_PATH', 'embedding_cache.db'),
+                max_entries=int(os.getenv('EMBEDDING_CACHE_MAX_ENTRIES', 200000))
             )
-        else:
-            # 初始化Sentence-Transformer模型
-            self.model = SentenceTransformer('all-MiniLM-L6-v2')
         
-        self.connect_milvus()
-        self.setup_collection()
+        # OpenAI客户端与本地模型在首次使用时创建（见 client / model），也可由 load_embedder 预先加载
+        self._client = None
+        self._model = None
+        self._embedder_lock = threading.Lock()
+        if self.use_openai:
+            # 按token数和条数打包请求，并发发送并使用令牌桶限流
+            self.embedding_scheduler = EmbeddingScheduler(
+                self._embed_batch,
+                max_batch_items=int(os.getenv('EMBEDDING_MAX_BATCH_ITEMS', 256)),
+                max_batch_tokens=int(os.getenv('EMBEDDING_MAX_BATCH_TOKENS', 8000)),
+                max_workers=int(os.getenv('EMBEDDING_CONCURRENCY', 4)),
+                requests_per_second=float(os.getenv('EMBEDDING_REQUESTS_PER_SECOND', 5))
+            )
+        # Milvus在首次使用时连接（见 ensure_milvus），仅使用NumPy后端时不需要Milvus服务
+
+    @property
+    def dim(self):
+        """向量维度；自定义向量模型（如本地ONNX模型）的维度可能要在加载模型后才能确定，因此不在构造时读取"""
+        return self.embedder.dim if self.embedder is not None else self._dim
+
+    @property
+    def client(self):
+        """OpenAI客户端，首次使用时创建"""
+        if self._client is None:
+            with self._embedder_lock:
+                if self._client is None:
+                    from openai import OpenAI
+                    self._client = OpenAI(
+                        api_key=os.getenv('OPENAI_API_KEY'),
+                        base_url=os.getenv('OPENAI_API_BASE')
+                    )
+        return self._client
+
+    @property
+    def model(self):
+        """Sentence-Transformer模型，首次使用时加载（导入torch耗时较长）"""
+        if self._model is None:
+            with self._embedder_lock:
+                if self._model is None:
+                    from sentence_transformers import SentenceTransformer
+                    with metrics.timer(stage='load_model'):
+                        self._model = SentenceTransformer(self.model_name)
+        return self._model
+
+    def load_embedder(self):
+        """预先创建向量模型/客户端，供启动后的后台预热调用"""
+        if self.embedder is not None:
+            # 本地ONNX模型提供 load()，加载模型并启动推理线程
+            if hasattr(self.embedder, 'load'):
+                self.embedder.load()
+            return
+        if self.use_openai:
+            self.client
+        else:
+            self.model
+
+    @property
+    def embedder_loaded(self):
+        if self.embedder is not None:
+            return getattr(self.embedder, 'loaded', True)
+        return (self._client if self.use_openai else self._model) is not None
+
+    def score_floors(self, filter_threshold, similarity_threshold):
+        """整表查重实际使用的阈值：不高于下限，使之后在下限以上调整阈值时只需筛选已保存的分数"""
+        return {
+            'filter': min(filter_threshold, self.filter_floor),
+            'similarity': min(similarity_threshold, self.similarity_floor)
+        }
+
+    @property
+    def milvus_ready(self):
+        return self._milvus_ready
+
+    def ensure_milvus(self):
+        """按需连接Milvus并准备集合；连接失败时抛出异常，下次调用时重试"""
+        if self._milvus_ready:
+            return
+        # 多个任务同时首次使用Milvus时只连接一次
+        with self._milvus_lock:
+            if self._milvus_ready:
+                return
+            self.connect_milvus()
+            self.setup_collection()
+            self._milvus_ready = True
+        if self.partition_ttl:
+            self.start_partition_sweeper()
+
+    def select_backend(self, num_texts):
+        """根据文本数量选择报告阶段的相似度后端"""
+        if self.similarity_backend != 'auto':
+            return self.similarity_backend
+        return 'numpy' if num_texts <= self.numpy_backend_max_texts else 'milvus'
 
     def connect_milvus(self):
         """连接到Milvus服务器"""
+        from pymilvus import connections
         try:
             connections.connect(
                 alias="default",
@@ -46,13 +224,26 @@ class VectorSearch:
 
     def setup_collection(self):
         """设置Milvus集合"""
+        from pymilvus import Collection, CollectionSchema, FieldSchema, DataType, utility
         try:
             if utility.has_collection(self.collection_name):
                 self.collection = Collection(self.collection_name)
-                return
+                # 旧版本集合使用自增主键，无法按内容哈希复用；更换向量模型后维度可能不同。两种情况均需重建
+                dims = [field.params.get('dim') for field in self.collection.schema.fields
+                        if field.name == 'embedding']
+                if self.collection.schema.auto_id:
+                    print(f"Collection {self.collection_name} uses auto_id, recreating...")
+                elif dims and dims[0] is not None and int(dims[0]) != self.dim:
+                    print(f"Collection {self.collection_name} has dim {dims[0]}, model {self.model_name} "
+                          f"needs {self.dim}, recreating...")
+                else:
+                    self.ensure_index()
+                    return
+                self.collection.drop()
 
             # 定义字段
-            id_field = FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True)
+            # 主键为文本内容的哈希（见 text_id），同一分区内已存在的文本不再重复插入
+            id_field = FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=False)
             text_field = FieldSchema(name="text", dtype=DataType.VARCHAR, max_length=65535)
             vector_field = FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=self.dim)
             
@@ -69,48 +260,301 @@ class VectorSearch:
                 using='default'
             )
 
-            # 创建索引
-            index_params = {
-                "metric_type": "L2",
-                "index_type": "IVF_FLAT",
-                "params": {"nlist": 1024}
-            }
-            self.collection.create_index(field_name="embedding", index_params=index_params)
+            # 创建索引（按集合规模选择）
+            self.ensure_index()
             print(f"Collection {self.collection_name} created successfully")
         except Exception as e:
             print(f"Error setting up collection: {e}")
             raise
 
-    @backoff.on_exception(backoff.expo, Exception, max_tries=3)
+    def ensure_index(self):
+        """根据集合当前规模选择索引（FLAT / IVF_FLAT / HNSW），规模跨档、度量不一致或 IVF 的 nlist 偏离过多时重建
+        
+        其他任务正在搜索（见 _searching_index）时不删除索引，沿用当前索引，待之后写入向量时再检查
+        """
+        # 持有锁期间新的搜索不会开始，同时只有一个任务检查或重建索引
+        with self._index_condition:
+            desired = choose_index(self.collection.num_entities)
+            current = normalize_index(self.collection.index().params) if self.collection.has_index() else None
+            if same_index(current, desired):
+                # 搜索参数（nprobe）按索引实际的 nlist 推导
+                self.index_params = current
+                return
+            
+            if current is not None:
+                if self._active_searches:
+                    print(f"{self._active_searches} 个任务正在搜索，暂不重建索引 "
+                          f"{current['index_type']}{current['params']} -> {desired['index_type']}{desired['params']}")
+                    metrics.inc('milvus_index_rebuilds_deferred_total')
+                    self.index_params = current
+                    return
+                print(f"重建索引: {current['index_type']}/{current['metric_type']}{current['params']} -> "
+                      f"{desired['index_type']}/{desired['metric_type']}{desired['params']}")
+                self.collection.release()
+                self.collection.drop_index()
+            with metrics.timer('milvus_request_seconds', op='create_index'):
+                self.collection.create_index(field_name="embedding", index_params=desired)
+            self.index_params = desired
+
+    @contextmanager
+    def _searching_index(self):
+        """搜索期间计入正在搜索的任务，期间其他任务不会删除并重建索引"""
+        with self._index_condition:
+            self._active_searches += 1
+        try:
+            yield
+        finally:
+            with self._index_condition:
+                self._active_searches -= 1
+
+    def search_params(self, top_k):
+        """当前索引对应的搜索参数"""
+        return search_params_for(self.index_params, self.target_recall, top_k)
+
+    @staticmethod
+    def partition_for_job(job_id):
+        """任务对应的分区名"""
+        return f"job_{job_id}"
+
+    @classmethod
+    def partition_for_texts(cls, texts):
+        """未指定任务时按文本内容生成分区名"""
+        return cls.partition_for_job(hashlib.sha1('\n'.join(texts).encode('utf-8')).hexdigest()[:16])
+
+    @contextmanager
+    def _using_partition(self, partition_name):
+        """写入或搜索期间将分区标记为使用中，清理线程跳过该分区"""
+        with self._partition_lock:
+            self._partitions_in_use[partition_name] = self._partitions_in_use.get(partition_name, 0) + 1
+            self._partition_last_used[partition_name] = time.time()
+        try:
+            yield
+        finally:
+            with self._partition_lock:
+                self._partitions_in_use[partition_name] -= 1
+                if not self._partitions_in_use[partition_name]:
+                    del self._partitions_in_use[partition_name]
+                self._partition_last_used[partition_name] = time.time()
+
+    def upsert_job_vectors(self, partition_name, texts, embeddings):
+        """将任务的向量写入其分区，已存在的文本（按内容哈希）直接复用"""
+        self.ensure_milvus()
+        with self._using_partition(partition_name):
+            return self._upsert_job_vectors(partition_name, texts, embeddings)
+
+    def _upsert_job_vectors(self, partition_name, texts, embeddings):
+        if not self.collection.has_partition(partition_name):
+            self.collection.create_partition(partition_name)
+        
+        ids = [text_id(text) for text in texts]
+        existing = set()
+        for start in range(0, len(ids), 1000):
+            chunk = ids[start:start + 1000]
+            with metrics.timer('milvus_request_seconds', len(chunk), op='query'):
+                rows = self.collection.query(
+                    expr=f"id in {chunk}",
+                    partition_names=[partition_name],
+                    output_fields=["id"]
+                )
+            existing.update(row['id'] for row in rows)
+        
+        new_rows = [(i, text, embedding) for i, text, embedding in zip(ids, texts, embeddings) if i not in existing]
+        if new_rows:
+            new_ids, new_texts, new_embeddings = (list(column) for column in zip(*new_rows))
+            with metrics.timer('milvus_request_seconds', len(new_ids), op='insert'):
+                self.collection.insert([new_ids, new_texts, new_embeddings], partition_name=partition_name)
+            with metrics.timer('milvus_request_seconds', op='flush'):
+                self.collection.flush()
+            self.ensure_index()
+        print(f"分区 {partition_name}: 新写入 {len(new_rows)} 条，复用已有向量 {len(existing)} 条")
+        return len(new_rows)
+
+    def sweep_partitions(self, ttl=None):
+        """删除超过TTL未使用的任务分区"""
+        ttl = self.partition_ttl if ttl is None else ttl
+        now = time.time()
+        dropped = []
+        for partition in self.collection.partitions:
+            name = partition.name
+            if not name.startswith('job_'):
+                continue
+            with self._partition_lock:
+                if name in self._partitions_in_use:
+                    continue
+                # 重启后首次发现的分区从当前时间开始计时
+                last_used = self._partition_last_used.setdefault(name, now)
+                if now - last_used < ttl:
+                    continue
+                self._partition_last_used.pop(name, None)
+            try:
+                partition.release()
+                self.collection.drop_partition(name)
+                dropped.append(name)
+            except Exception as e:
+                print(f"清理分区 {name} 失败: {e}")
+        if dropped:
+            print(f"已清理过期分区: {', '.join(dropped)}")
+        return dropped
+
+    def start_partition_sweeper(self, interval=600):
+        """启动后台线程定期清理过期分区"""
+        if self._sweeper is not None:
+            return
+        
+        def sweep_loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.sweep_partitions()
+                except Exception as e:
+                    print(f"分区清理出错: {e}")
+        
+        self._sweeper = threading.Thread(target=sweep_loop, daemon=True)
+        self._sweeper.start()
+
     def get_embeddings(self, texts):
-        """获取文本向量嵌入"""
+        """获取文本向量嵌入（优先读取缓存）"""
+        if self.embedding_cache is None:
+            return self._request_embeddings(texts)
+        
+        with metrics.timer(stage='embedding_cache', items=len(texts)):
+            cached = self.embedding_cache.get_many(self.model_name, self.dim, texts)
+        missing = list(dict.fromkeys(text for text in texts if text not in cached))
+        if missing:
+            new_embeddings = self._request_embeddings(missing)
+            self.embedding_cache.put_many(self.model_name, self.dim, missing, new_embeddings)
+            cached.update(zip(missing, new_embeddings))
+        return [cached[text] for text in texts]
+
+    @backoff.on_exception(backoff.expo, Exception, max_tries=3, on_backoff=_record_backoff)
+    def _request_embeddings(self, texts):
+        """调用OpenAI API或本地模型获取文本向量嵌入（带重试）"""
+        return self._embed_batch(texts)
+
+    def _embed_batch(self, texts):
+        """调用OpenAI API或本地模型获取文本向量嵌入"""
+        with metrics.timer(stage='embedding_api', items=len(texts)):
+            if self.embedder is not None:
+                return self.embedder.encode(texts)
+            if self.use_openai:
+                # 使用OpenAI API
+                response = self.client.embeddings.create(
+                    model=self.model_name,
+                    input=texts
+                )
+                return [embedding.embedding for embedding in response.data]
+            else:
+                # 使用Sentence-Transformers
+                return self.model.encode(texts, batch_size=self.encode_batch_size, convert_to_numpy=True).tolist()
+
+    def embed_texts(self, texts, progress_callback=None, checkpoint=None):
+        """批量计算文本向量：OpenAI走并发批处理调度，本地模型分块encode
+        
+        每个批次完成后写入向量缓存，并提交到 checkpoint（如有），失败后重新运行时从已提交的批次继续
+        """
+        def cache_batch(batch, embeddings):
+            if self.embedding_cache is not None:
+                self.embedding_cache.put_many(self.model_name, self.dim, batch, embeddings)
+            if checkpoint is not None:
+                checkpoint.commit_embeddings(batch, embeddings)
+        
+        def report_progress(done, total):
+            print(f"进度: {done}/{total} ({(done/total)*100:.1f}%)")
+            if progress_callback is not None:
+                progress_callback('embedding', done / total * 100, f"生成文本向量: {done}/{total}")
+        
         if self.use_openai:
-            # 使用OpenAI API
-            response = self.client.embeddings.create(
-                model="text-embedding-ada-002",
-                input=texts
+            embeddings = self.embedding_scheduler.run(
+                texts,
+                progress_callback=report_progress,
+                batch_callback=cache_batch
             )
-            return [embedding.embedding for embedding in response.data]
+            if self.embedding_scheduler.rate_limit_hits:
+                print(f"触发限流 {self.embedding_scheduler.rate_limit_hits} 次，已自动降速")
         else:
-            # 使用Sentence-Transformers
-            return self.model.encode(texts, convert_to_numpy=True).tolist()
+            texts = list(texts)
+            embeddings = []
+            chunk_size = self.encode_batch_size * 16
+            for start in range(0, len(texts), chunk_size):
+                batch = texts[start:start + chunk_size]
+                batch_embeddings = self._request_embeddings(batch)
+                cache_batch(batch, batch_embeddings)
+                embeddings.extend(batch_embeddings)
+                report_progress(len(embeddings), len(texts))
+        return embeddings
+
+    def lookup_embeddings(self, texts, progress_callback=None, checkpoint=None):
+        """返回 {text: embedding}：先读取检查点中已提交的批次，再批量查询缓存，其余文本调用API/模型"""
+        print("正在生成文本向量...")
+        texts = list(dict.fromkeys(texts))
+        embeddings_dict = {}
+        if checkpoint is not None:
+            committed = checkpoint.committed_embeddings()
+            embeddings_dict.update((text, committed[text]) for text in texts if text in committed)
+            if embeddings_dict:
+                print(f"检查点: 复用上次已提交的向量 {len(embeddings_dict)}/{len(texts)} 条")
+        
+        # 批量查询缓存，命中的文本不再调用API，也无需等待
+        if self.embedding_cache is not None:
+            lookup_texts = [text for text in texts if text not in embeddings_dict]
+            with metrics.timer(stage='embedding_cache', items=len(lookup_texts)):
+                embeddings_dict.update(self.embedding_cache.get_many(self.model_name, self.dim, lookup_texts))
+            cache_stats = self.embedding_cache.stats()
+            print(f"向量缓存命中: {len(embeddings_dict)}/{len(texts)} "
+                  f"(累计命中 {cache_stats['hits']}, 未命中 {cache_stats['misses']})")
+        
+        missing_texts = [text for text in texts if text not in embeddings_dict]
+        if missing_texts:
+            with metrics.timer(stage='embedding', items=len(missing_texts)):
+                embeddings_dict.update(zip(missing_texts,
+                                           self.embed_texts(missing_texts, progress_callback, checkpoint)))
+        return embeddings_dict
 
-    def process_excel_with_filter(self, excel_path, column_name, filter_threshold=0.3, similarity_threshold=0.9):
-        """使用初筛的Excel处理方法"""
+    def process_excel_with_filter(self, excel_path, column_name, filter_threshold=0.3, similarity_threshold=0.9,
+                                  candidate_mode='exhaustive', tfidf_mode='pair', job_id=None,
+                                  progress_callback=None, ingested=None, checkpoint=None):
+        """使用初筛的Excel处理方法
+        
+        progress_callback(stage, percent, message): 各阶段（ingest/prefilter/embedding）的进度回调
+        ingested: 已通过 read_text_column 读取的结果，传入时不再重复解析文件
+        checkpoint: 本文件的检查点（见 checkpoint_store），已完成的阶段直接读取产物
+        """
         try:
-            # 读取Excel文件
-            df = pd.read_excel(excel_path)
+            # 流式读取文本列（只加载目标列，列不存在时抛出ValueError）
+            if ingested is None:
+                ingested = run_stage(checkpoint, 'ingest', {'column': column_name},
+                                     lambda: read_text_column(excel_path, column_name))
             
-            # 检查列是否存在
-            if column_name not in df.columns:
-                raise ValueError(f"Column {column_name} not found in Excel file")
-
-            # 获取文本列数据，并保留行号（从1开始计数）
-            texts_with_index = list(enumerate(df[column_name].astype(str).tolist(), 1))
+            # 完全重复/规范化后重复的文本只保留一条代表进入初筛和向量阶段
+            texts_with_index = ingested.representatives()
+            duplicate_groups = ingested.duplicate_groups()
+            if duplicate_groups:
+                duplicate_rows = sum(len(group['rows']) for group in duplicate_groups)
+                print(f"发现 {len(duplicate_groups)} 组重复文本（共 {duplicate_rows} 行），"
+                      f"去重后 {len(texts_with_index)}/{ingested.total_rows} 条文本进入初筛")
             
             # 第一步：使用文本过滤器进行初筛
+            if progress_callback is not None:
+                progress_callback('ingest', 100, f"读取完成，共 {len(texts_with_index)} 条文本")
             print(f"开始初筛，共 {len(texts_with_index)} 条文本...")
-            potential_pairs = self.text_filter.batch_process(texts_with_index, threshold=filter_threshold)
+            prefilter_params = {
+                'filter_threshold': filter_threshold,
+                'candidate_mode': candidate_mode,
+                'tfidf_mode': tfidf_mode
+            }
+            def prefilter():
+                return self.text_filter.batch_process(
+                    texts_with_index,
+                    threshold=filter_threshold,
+                    candidate_mode=candidate_mode,
+                    tfidf_mode=tfidf_mode,
+                    progress_callback=progress_callback,
+                    workers=self.prefilter_workers,
+                    block_size=self.prefilter_block_size
+                )
+            
+            with metrics.timer(stage='prefilter', items=len(texts_with_index)):
+                potential_pairs = run_stage(checkpoint, 'prefilter', prefilter_params, prefilter)
             
             # 获取需要处理的唯一文本
             unique_texts = set()
@@ -124,33 +568,25 @@ class VectorSearch:
             print(f"初筛后需要处理的文本数量: {len(unique_texts)}/{len(texts_with_index)}")
             
             # 第二步：只对筛选出的文本计算embedding
-            print("正在生成文本向量...")
-            embeddings_dict = {}
-            total_texts = len(unique_texts)
-            
-            for i, text in enumerate(unique_texts, 1):
-                if text not in embeddings_dict:  # 避免重复处理
-                    embedding = self.get_embeddings([text])[0]
-                    embeddings_dict[text] = embedding
-                    print(f"进度: {i}/{total_texts} ({(i/total_texts)*100:.1f}%)")
-                    time.sleep(0.5)  # 避免API限制
-            
-            # 准备插入数据
+            embeddings_dict = run_stage(checkpoint, 'embedding', {'model': self.model_name, 'dim': self.dim},
+                                        lambda: self.lookup_embeddings(unique_texts, progress_callback, checkpoint))
+            
+            # 准备插入数据（L2归一化后内积即余弦相似度）
             texts_to_insert = list(embeddings_dict.keys())
-            embeddings_to_insert = [embeddings_dict[text] for text in texts_to_insert]
+            embeddings_to_insert = NumpySimilarityBackend.normalize(
+                [embeddings_dict[text] for text in texts_to_insert]
+            ).tolist()
             
-            # 清理旧的collection数据
-            if utility.has_collection(self.collection_name):
-                self.collection.drop()
-                self.setup_collection()
+            # 后端与分区只在本次调用内确定，不保存在实例上（多个任务并发使用同一个 VectorSearch）
+            backend = self.select_backend(len(texts_to_insert))
+            print(f"相似度计算后端: {backend}")
             
-            # 插入数据到Milvus
-            entities = [
-                texts_to_insert,
-                embeddings_to_insert
-            ]
-            self.collection.insert(entities)
-            self.collection.flush()
+            if backend == 'milvus':
+                # 写入任务自己的分区，不再删除重建集合和索引；
+                # 未指定 job_id 时按文本内容命名，与 generate_similarity_report 未指定分区时一致
+                partition_name = (self.partition_for_job(job_id) if job_id is not None
+                                  else self.partition_for_texts(texts_to_insert))
+                self.upsert_job_vectors(partition_name, texts_to_insert, embeddings_to_insert)
             
             print(f"成功处理 {len(texts_to_insert)} 条文本")
             
@@ -160,24 +596,312 @@ class VectorSearch:
             print(f"处理Excel文件时出错: {e}")
             raise
 
+    @staticmethod
+    def corpus_index_label(entry):
+        """历史文本在报告中的位置标识：来源文件#行号"""
+        return f"{entry['source'] or '历史库'}#{entry['row']}"
+
+    def check_incremental(self, ingested, corpus, filter_threshold=0.3, similarity_threshold=0.9,
+                          candidate_mode='lsh', commit=False, source=None, progress_callback=None,
+                          result_key=None):
+        """增量查重：新批次只与自身及历史库比对，工作量与批次大小成正比
+        
+        ingested: read_text_column 的读取结果
+        corpus: 历史库（CorpusStore）
+        candidate_mode: 候选对生成方式，'lsh' 或 'inverted'，批次内部与批次-历史库之间相同
+        commit: 比对完成后是否将新文本写入历史库，source 为写入时记录的来源名称
+        result_key: 结果在结果库中的键（通常为任务id）
+        返回 {'initial_pairs', 'final_pairs', 'duplicate_groups', 'corpus_duplicates', 'committed', 'corpus_size'}；
+        文本对的 scope 为 'batch'（批次内部）或 'corpus'（text2/index2 为历史文本）
+        """
+        try:
+            if candidate_mode not in ('lsh', 'inverted'):
+                raise ValueError(f"Unknown candidate mode for incremental check: {candidate_mode}")
+            texts_with_index = ingested.representatives()
+            duplicate_groups = ingested.duplicate_groups()
+            rows_by_representative = {group['representative'][0]: group['rows']
+                                      for group in ingested.fingerprint_groups()}
+            if progress_callback is not None:
+                progress_callback('ingest', 100, f"读取完成，共 {len(texts_with_index)} 条文本")
+            
+            # 与历史库完全/规范化重复的文本直接报告，不再与历史库做相似度比对
+            fingerprints = [text_fingerprint(text) for _, text in texts_with_index]
+            with metrics.timer(stage='corpus_fingerprint', items=len(texts_with_index)):
+                corpus_matches = corpus.find_fingerprints(fingerprints)
+            corpus_duplicates = []
+            for (idx, text), fingerprint in zip(texts_with_index, fingerprints):
+                if fingerprint in corpus_matches:
+                    entry = corpus_matches[fingerprint]
+                    corpus_duplicates.append({
+                        'rows': rows_by_representative[idx],
+                        'text': text,
+                        'corpus_id': entry['id'],
+                        'corpus_index': self.corpus_index_label(entry),
+                        'corpus_text': entry['text']
+                    })
+            print(f"开始增量初筛：新文本 {len(texts_with_index)} 条，历史库 {corpus.count()} 条，"
+                  f"与历史库重复 {len(corpus_duplicates)} 条")
+            
+            # 第一步：批次内部初筛
+            with metrics.timer(stage='prefilter', items=len(texts_with_index)):
+                potential_pairs = self.text_filter.batch_process(
+                    texts_with_index,
+                    threshold=filter_threshold,
+                    candidate_mode=candidate_mode,
+                    progress_callback=progress_callback,
+                    workers=self.prefilter_workers,
+                    block_size=self.prefilter_block_size
+                )
+            for pair in potential_pairs:
+                pair['scope'] = 'batch'
+            
+            # 第二步：批次与历史库之间，只查询分桶/倒排项命中的历史文本
+            text_tokens = self.text_filter.tokenizer.tokenize_many([text for _, text in texts_with_index])
+            query_positions = [pos for pos, fingerprint in enumerate(fingerprints) if fingerprint not in corpus_matches]
+            token_sets = [set(text_tokens[texts_with_index[pos][1]]) for pos in query_positions]
+            with metrics.timer(stage=f'corpus_candidates_{candidate_mode}', items=len(query_positions)):
+                if candidate_mode == 'lsh':
+                    lengths = [len(texts_with_index[pos][1]) for pos in query_positions]
+                    candidates = corpus.lsh_candidates(token_sets, lengths)
+                else:
+                    candidates = corpus.token_candidates(token_sets)
+                corpus_texts = corpus.get_texts(text_id for _, text_id in candidates)
+            print(f"历史库候选对数量: {len(candidates)}")
+            
+            with metrics.timer(stage='corpus_scoring', items=len(candidates)):
+                for entry in corpus_texts.values():
+                    # 历史文本的分词已保存在库中，计算TF-IDF时无需重新分词
+                    self.text_filter.tokenizer.seed(entry['text'], entry['tokens'])
+                for k, text_id in candidates:
+                    idx, text = texts_with_index[query_positions[k]]
+                    entry = corpus_texts[text_id]
+                    result = self.text_filter._evaluate_pair(
+                        text, entry['text'], token_sets[k], set(entry['tokens']), filter_threshold
+                    )
+                    if result is None:
+                        continue
+                    potential_pairs.append({
+                        'text1': text,
+                        'text2': entry['text'],
+                        'index1': idx,
+                        'index2': self.corpus_index_label(entry),
+                        'similarity': result[0],
+                        'method': result[1],
+                        'scope': 'corpus',
+                        'corpus_id': text_id
+                    })
+            print(f"增量初筛完成，找到 {len(potential_pairs)} 对相似文本")
+            
+            # 第三步：只对初筛保留的文本计算向量；历史文本优先使用库中保存的向量
+            batch_texts = list(dict.fromkeys(
+                text for pair in potential_pairs
+                for text in ((pair['text1'], pair['text2']) if pair['scope'] == 'batch' else (pair['text1'],))
+            ))
+            corpus_ids = list(dict.fromkeys(pair['corpus_id'] for pair in potential_pairs if pair['scope'] == 'corpus'))
+            batch_embeddings = self.lookup_embeddings(batch_texts, progress_callback)
+            corpus_embeddings = corpus.get_vectors(self.model_name, corpus_ids)
+            missing_ids = [text_id for text_id in corpus_ids if text_id not in corpus_embeddings]
+            if missing_ids:
+                computed = self.lookup_embeddings([corpus_texts[text_id]['text'] for text_id in missing_ids])
+                new_vectors = {text_id: computed[corpus_texts[text_id]['text']] for text_id in missing_ids}
+                corpus.put_vectors(self.model_name, new_vectors)
+                corpus_embeddings.update(new_vectors)
+            
+            # 第四步：新文本之间、新文本与候选历史文本之间的向量相似度
+            if progress_callback is not None:
+                progress_callback('report', 0)
+            text_to_index = {text: idx for idx, text in texts_with_index}
+            similar_pairs = []
+            with metrics.timer(stage='similarity_numpy', items=len(batch_texts)):
+                if batch_texts:
+                    batch_matrix = [batch_embeddings[text] for text in batch_texts]
+                    for i, j, similarity, distance in self.numpy_backend.find_similar_pairs(
+                            batch_matrix, similarity_threshold):
+                        similar_pairs.append({
+                            'text1': batch_texts[i],
+                            'text2': batch_texts[j],
+                            'index1': text_to_index[batch_texts[i]],
+                            'index2': text_to_index[batch_texts[j]],
+                            'similarity': similarity,
+                            'distance': distance,
+                            'scope': 'batch'
+                        })
+                    if corpus_ids:
+                        corpus_matrix = [corpus_embeddings[text_id] for text_id in corpus_ids]
+                        for i, j, similarity, distance in self.numpy_backend.find_cross_pairs(
+                                batch_matrix, corpus_matrix, similarity_threshold):
+                            entry = corpus_texts[corpus_ids[j]]
+                            similar_pairs.append({
+                                'text1': batch_texts[i],
+                                'text2': entry['text'],
+                                'index1': text_to_index[batch_texts[i]],
+                                'index2': self.corpus_index_label(entry),
+                                'similarity': similarity,
+                                'distance': distance,
+                                'scope': 'corpus',
+                                'corpus_id': corpus_ids[j]
+                            })
+            similar_pairs.sort(key=lambda x: x['similarity'], reverse=True)
+            self.save_results(result_key, similar_pairs, duplicate_groups, corpus_duplicates,
+                              candidates=potential_pairs,
+                              thresholds={'filter': filter_threshold, 'similarity': similarity_threshold},
+                              floors={'similarity': similarity_threshold})
+            print(f"共找到 {len(similar_pairs)} 对相似文本")
+            
+            # 第五步：可选地将新文本写入历史库（与历史库重复的文本不再写入）
+            committed = 0
+            if commit:
+                entries = [(idx, text, text_tokens[text])
+                           for (idx, text), fingerprint in zip(texts_with_index, fingerprints)
+                           if fingerprint not in corpus_matches]
+                with metrics.timer(stage='corpus_commit', items=len(entries)):
+                    committed = len(corpus.add(entries, self.model_name, batch_embeddings, source))
+            
+            return {
+                'initial_pairs': potential_pairs,
+                'final_pairs': similar_pairs,
+                'duplicate_groups': duplicate_groups,
+                'corpus_duplicates': corpus_duplicates,
+                'committed': committed,
+                'corpus_size': corpus.count()
+            }
+            
+        except Exception as e:
+            print(f"增量查重时出错: {e}")
+            raise
+
+    def check_sources(self, sources, compare=None, filter_threshold=0.3, similarity_threshold=0.9,
+                      candidate_mode='inverted', tfidf_mode='pair', progress_callback=None, result_key=None):
+        """多文件/多列交叉比对：全部来源的文本放入同一个候选索引，只比较指定分组之间的文本对
+
+        sources: 已读取的 TextSource 列表（见 TextSource.read），group 相同的来源属于同一分组
+        compare: 需要比较的 [(分组a, 分组b)]，(a, a) 表示分组内部也比较；默认第一个分组与其余各分组比较
+        返回 {'initial_pairs', 'final_pairs', 'duplicate_groups', 'total_rows'}；
+        文本对的 index1/index2 为行号，source/sheet/column 1/2 为两侧文本的来源
+        """
+        try:
+            group_names = list(dict.fromkeys(source.group for source in sources))
+            if compare is None:
+                compare = [(group_names[0], group) for group in group_names[1:]] or [(group_names[0], group_names[0])]
+            unknown = {group for pair in compare for group in pair} - set(group_names)
+            if unknown:
+                raise ValueError(f"Unknown source group: {', '.join(sorted(map(str, unknown)))}")
+            group_order = {group: k for k, group in enumerate(group_names)}
+            compare_ids = {tuple(sorted((group_order[a], group_order[b]))) for a, b in compare}
+            used_groups = {group for pair in compare_ids for group in pair}
+            
+            # 同一来源内的重复文本只保留一条代表；不参与任何比较的分组不放入索引
+            entries = []  # [(来源, 行号, 文本)]，按分组连续排列
+            groups = []
+            duplicate_groups = []
+            for source in sorted(sources, key=lambda source: group_order[source.group]):
+                group = group_order[source.group]
+                if group not in used_groups:
+                    continue
+                for row, text in source.ingested.representatives():
+                    entries.append((source, row, text))
+                    groups.append(group)
+                duplicate_groups.extend(dict(duplicate, source=source.label)
+                                        for duplicate in source.ingested.duplicate_groups())
+            total_rows = sum(source.ingested.total_rows for source in sources)
+            if progress_callback is not None:
+                progress_callback('ingest', 100, f"读取完成，{len(sources)} 个来源共 {len(entries)} 条文本")
+            print(f"开始交叉比对：{len(sources)} 个来源，{len(group_names)} 个分组，共 {len(entries)} 条文本，"
+                  f"比较分组: {', '.join(f'{group_names[a]}-{group_names[b]}' for a, b in sorted(compare_ids))}")
+            
+            def describe(pos, side):
+                source, row, text = entries[pos]
+                return {
+                    f'text{side}': text,
+                    f'index{side}': row,
+                    f'source{side}': source.name,
+                    f'sheet{side}': source.sheet,
+                    f'column{side}': source.column_label
+                }
+            
+            # 第一步：所有来源共用分词、TF-IDF和候选索引，只对需要比较的分组之间的文本对打分
+            with metrics.timer(stage='prefilter', items=len(entries)):
+                prefilter_pairs = self.text_filter.batch_process(
+                    [(pos, text) for pos, (_, _, text) in enumerate(entries)],
+                    threshold=filter_threshold,
+                    candidate_mode=candidate_mode,
+                    tfidf_mode=tfidf_mode,
+                    progress_callback=progress_callback,
+                    workers=self.prefilter_workers,
+                    block_size=self.prefilter_block_size,
+                    groups=groups,
+                    compare=compare_ids
+                )
+            potential_pairs = [
+                {**describe(pair['index1'], 1), **describe(pair['index2'], 2),
+                 'similarity': pair['similarity'], 'method': pair['method']}
+                for pair in prefilter_pairs
+            ]
+            
+            # 第二步：只对初筛保留的文本计算向量
+            positions = sorted({pos for pair in prefilter_pairs for pos in (pair['index1'], pair['index2'])})
+            embeddings = self.lookup_embeddings([entries[pos][2] for pos in positions], progress_callback)
+            
+            # 第三步：按分组计算向量相似度，分组之间用交叉矩阵，不计算分组内部的文本对
+            if progress_callback is not None:
+                progress_callback('report', 0)
+            positions_by_group = {}
+            for pos in positions:
+                positions_by_group.setdefault(groups[pos], []).append(pos)
+            similar_pairs = []
+            with metrics.timer(stage='similarity_numpy', items=len(positions)):
+                for a, b in sorted(compare_ids):
+                    rows, cols = positions_by_group.get(a, []), positions_by_group.get(b, [])
+                    if not rows or not cols:
+                        continue
+                    row_matrix = [embeddings[entries[pos][2]] for pos in rows]
+                    if a == b:
+                        found = self.numpy_backend.find_similar_pairs(row_matrix, similarity_threshold)
+                    else:
+                        col_matrix = [embeddings[entries[pos][2]] for pos in cols]
+                        found = self.numpy_backend.find_cross_pairs(row_matrix, col_matrix, similarity_threshold)
+                    for i, j, similarity, distance in found:
+                        similar_pairs.append({
+                            **describe(rows[i], 1), **describe(cols[j], 2),
+                            'similarity': similarity,
+                            'distance': distance
+                        })
+            similar_pairs.sort(key=lambda x: x['similarity'], reverse=True)
+            self.save_results(result_key, similar_pairs, duplicate_groups,
+                              candidates=potential_pairs,
+                              thresholds={'filter': filter_threshold, 'similarity': similarity_threshold},
+                              floors={'similarity': similarity_threshold})
+            print(f"共找到 {len(similar_pairs)} 对相似文本")
+            
+            return {
+                'initial_pairs': potential_pairs,
+                'final_pairs': similar_pairs,
+                'duplicate_groups': duplicate_groups,
+                'total_rows': total_rows
+            }
+        
+        except Exception as e:
+            print(f"交叉比对时出错: {e}")
+            raise
+
     def search_similar(self, query_text, top_k=5):
         """搜索相似文本"""
         try:
+            self.ensure_milvus()
+            
             # 获取查询文本的embedding
-            query_embedding = self.get_embeddings([query_text])[0]
-            
-            # 加载集合
-            self.collection.load()
-            
-            # 执行搜索
-            search_params = {"metric_type": "L2", "params": {"nprobe": 10}}
-            results = self.collection.search(
-                data=[query_embedding],
-                anns_field="embedding",
-                param=search_params,
-                limit=top_k,
-                output_fields=["text"]
-            )
+            query_embedding = NumpySimilarityBackend.normalize(self.get_embeddings([query_text])).tolist()[0]
+            
+            # 加载集合并执行搜索，期间其他任务不会重建索引
+            with self._searching_index():
+                self.collection.load()
+                results = self.collection.search(
+                    data=[query_embedding],
+                    anns_field="embedding",
+                    param=self.search_params(top_k),
+                    limit=top_k,
+                    output_fields=["text"]
+                )
             
             # 返回结果
             similar_texts = []
@@ -194,92 +918,164 @@ class VectorSearch:
             print(f"Error searching similar texts: {e}")
             raise
 
-    def generate_similarity_report(self, texts, embeddings, text_to_index, similarity_threshold=0.9):
-        """生成相似度报告"""
-        try:
-            print("正在生成相似度报告...")
-            similar_pairs = []
-            processed_pairs = set()  # 用于记录已处理的文本对
+    def _milvus_similar_pairs(self, texts, embeddings, similarity_threshold, query_batch_size, max_hits,
+                              partition_name, progress_callback=None):
+        """使用Milvus在任务分区内批量搜索相似文本，返回 [(i, j, similarity, distance)]"""
+        self.ensure_milvus()
+        with self._using_partition(partition_name):
+            return self._milvus_search_partition(texts, embeddings, similarity_threshold, query_batch_size,
+                                                 max_hits, partition_name, progress_callback)
+
+    def _milvus_search_partition(self, texts, embeddings, similarity_threshold, query_batch_size, max_hits,
+                                 partition_name, progress_callback):
+        from pymilvus import utility
+        similar_pairs = []
+        processed_pairs = set()  # 用于记录已处理的文本对（按整数id）
+        id_to_position = {text_id(text): pos for pos, text in enumerate(texts)}
+        
+        # 确保集合与分区存在
+        max_retries = 3
+        retry_count = 0
+        while retry_count < max_retries:
+            try:
+                if not utility.has_collection(self.collection_name):
+                    print("Collection not found, recreating...")
+                    self.setup_collection()
+                if not self.collection.has_partition(partition_name):
+                    # 重新插入数据
+                    self.upsert_job_vectors(partition_name, texts, embeddings)
+                break
+            except Exception as e:
+                retry_count += 1
+                if retry_count == max_retries:
+                    raise
+                print(f"Retry {retry_count}/{max_retries} due to: {e}")
+                time.sleep(1)
+        
+        # 搜索期间其他任务不会删除并重建索引；之前的重建会释放集合，因此在此加载
+        with self._searching_index():
+            # 集合加载后新建的分区会自动加载，重复调用load不会重建索引
+            with metrics.timer('milvus_request_seconds', op='load'):
+                self.collection.load()
             
-            # 确保集合存在并已加载
-            max_retries = 3
-            retry_count = 0
-            while retry_count < max_retries:
-                try:
-                    if not utility.has_collection(self.collection_name):
-                        print("Collection not found, recreating...")
-                        self.setup_collection()
-                        # 重新插入数据
-                        entities = [texts, embeddings]
-                        self.collection.insert(entities)
-                        self.collection.flush()
-                    
-                    self.collection.load()
-                    break
-                except Exception as e:
-                    retry_count += 1
-                    if retry_count == max_retries:
-                        raise
-                    print(f"Retry {retry_count}/{max_retries} due to: {e}")
-                    time.sleep(1)
-            
-            # 计算所有文本对之间的相似度
-            for i, (text1, emb1) in enumerate(zip(texts, embeddings)):
-                try:
-                    # 使用Milvus搜索相似文本
-                    search_params = {"metric_type": "L2", "params": {"nprobe": 10}}
-                    results = self.collection.search(
-                        data=[emb1],
+            # 内积即余弦相似度，阈值直接作为范围搜索下限，只返回满足条件的结果
+            top_k = min(max_hits, len(texts))
+            search_params = self.search_params(top_k)
+            search_params["params"]["radius"] = similarity_threshold - 1e-6
+            
+            def search(data, limit):
+                params = {**search_params, "params": {**search_params["params"]}}
+                if "ef" in params["params"]:
+                    # HNSW 要求 ef >= limit
+                    params["params"]["ef"] = max(params["params"]["ef"], limit)
+                with metrics.timer('milvus_request_seconds', len(data), op='search'):
+                    return self.collection.search(
+                        data=data,
                         anns_field="embedding",
-                        param=search_params,
-                        limit=len(texts),
-                        output_fields=["text"]
+                        param=params,
+                        limit=limit,
+                        partition_names=[partition_name]
                     )
+            
+            def collect(i, hits):
+                for hit in hits:
+                    j = id_to_position.get(hit.id)
+                    # 跳过自身比较
+                    if j is None or i == j:
+                        continue
+                    
+                    # 使用整数id对作为键，避免重复比较
+                    pair_key = (min(i, j), max(i, j))
+                    if pair_key in processed_pairs:
+                        continue
+                    
+                    # IP度量下返回的distance即余弦相似度
+                    similarity = hit.distance
+                    if similarity >= similarity_threshold:
+                        similar_pairs.append((pair_key[0], pair_key[1], similarity, 1 - similarity))
+                        processed_pairs.add(pair_key)
+            
+            # 返回结果数等于 limit 时，半径内可能还有更多文本（如大量近似重复的模板文本），放大 limit 重新查询
+            saturated = []
+            
+            # 按批次发送多条查询向量
+            for start in range(0, len(texts), query_batch_size):
+                batch_embeddings = embeddings[start:start + query_batch_size]
+                try:
+                    results = search(batch_embeddings, top_k)
                     
                     # 处理搜索结果
-                    for hits in results:
-                        for hit in hits:
-                            text2 = hit.entity.get('text')
-                            # 跳过自身比较
-                            if text1 == text2:
-                                continue
-                                
-                            # 创建一个排序后的文本对作为键，避免重复比较
-                            pair_key = tuple(sorted([text1, text2]))
-                            if pair_key in processed_pairs:
-                                continue
-                                
-                            # 将L2距离转换为相似度分数（越小越相似）
-                            similarity = 1 / (1 + hit.distance)
-                            if similarity >= similarity_threshold:
-                                similar_pairs.append({
-                                    'text1': text1,
-                                    'text2': text2,
-                                    'index1': text_to_index[text1],
-                                    'index2': text_to_index[text2],
-                                    'similarity': similarity,
-                                    'distance': hit.distance
-                                })
-                                processed_pairs.add(pair_key)
+                    for offset, hits in enumerate(results):
+                        collect(start + offset, hits)
+                        if len(hits) >= top_k and top_k < len(texts):
+                            saturated.append(start + offset)
                     
-                    if (i + 1) % 10 == 0:
-                        print(f"已处理 {i + 1}/{len(texts)} 条文本")
+                    done = min(start + query_batch_size, len(texts))
+                    print(f"已处理 {done}/{len(texts)} 条文本")
+                    if progress_callback is not None:
+                        progress_callback('report', done / len(texts) * 100, f"相似度搜索: {done}/{len(texts)}")
                 except Exception as e:
-                    print(f"Error processing text pair {i + 1}: {e}")
+                    print(f"Error processing text batch starting at {start + 1}: {e}")
                     continue
             
-            # 按相似度降序排序
-            similar_pairs.sort(key=lambda x: x['similarity'], reverse=True)
-            
-            # 生成报告
-            report_path = 'similarity_report.xlsx'
-            df_report = pd.DataFrame(similar_pairs)
-            # 添加更多信息到报告中
-            df_report['similarity_percentage'] = df_report['similarity'].apply(lambda x: f"{x:.2%}")
-            df_report['distance'] = df_report['distance']
-            df_report.to_excel(report_path, index=False)
+            limit = top_k
+            while saturated:
+                metrics.inc('milvus_saturated_queries_total', len(saturated))
+                if limit >= min(len(texts), MAX_SEARCH_LIMIT):
+                    print(f"警告: {len(saturated)} 条文本在相似度 {similarity_threshold} 以上的结果超过 "
+                          f"{limit} 条上限，部分文本对可能未报告")
+                    metrics.inc('milvus_truncated_queries_total', len(saturated))
+                    break
+                limit = min(limit * 4, len(texts), MAX_SEARCH_LIMIT)
+                print(f"{len(saturated)} 条文本的搜索结果达到上限，以 limit={limit} 重新查询")
+                rows, saturated = saturated, []
+                for start in range(0, len(rows), query_batch_size):
+                    batch_rows = rows[start:start + query_batch_size]
+                    try:
+                        results = search([embeddings[i] for i in batch_rows], limit)
+                    except Exception as e:
+                        print(f"Error re-querying saturated texts: {e}")
+                        continue
+                    for i, hits in zip(batch_rows, results):
+                        collect(i, hits)
+                        if len(hits) >= limit and limit < len(texts):
+                            saturated.append(i)
+        
+        return similar_pairs
+
+    def generate_similarity_report(self, texts, embeddings, text_to_index, similarity_threshold=0.9,
+                                   query_batch_size=100, max_hits=100, partition_name=None,
+                                   progress_callback=None, duplicate_groups=None, result_key=None,
+                                   checkpoint=None, candidates=None, thresholds=None, floors=None):
+        """生成相似度报告
+        
+        query_batch_size: 每次搜索请求携带的查询向量数量（Milvus后端）
+        max_hits: 每条文本首次搜索返回的结果数（Milvus后端的top-k）；返回数达到该值时放大 limit 重新查询，
+            超过 MAX_SEARCH_LIMIT 时记录警告与 milvus_truncated_queries_total 指标
+        partition_name: 搜索范围所在的任务分区，默认按文本内容确定（见 partition_for_texts）
+        progress_callback(stage, percent, message): 进度回调，stage 固定为 'report'
+        duplicate_groups: 重复文本分组（见 IngestResult.duplicate_groups），写入报告的单独工作表
+        result_key: 结果在结果库中的键（通常为任务id），默认为 'latest'
+        checkpoint: 本文件的检查点，相似文本对已按相同参数计算过时不再搜索
+        candidates / thresholds / floors: 初筛文本对、任务提交时的阈值与实际计算所用的下限阈值，
+            一并写入结果库，之后可在下限以上重新筛选（见 PairResults.select）
+        """
+        try:
+            print("正在生成相似度报告...")
+            # 与 process_excel_with_filter 中按相同规则选择，避免依赖实例上的共享状态
+            backend = self.select_backend(len(texts))
+            params = {'similarity_threshold': similarity_threshold, 'backend': backend, 'max_hits': max_hits}
+            similar_pairs = run_stage(checkpoint, 'vector_pairs', params, lambda: self._find_similar_pairs(
+                texts, embeddings, text_to_index, similarity_threshold, backend, query_batch_size, max_hits,
+                partition_name, progress_callback
+            ))
             
-            print(f"\n相似度报告已生成: {report_path}")
+            # 保存结果
+            run_stage(checkpoint, 'report', params, lambda: self.save_results(
+                result_key, similar_pairs, duplicate_groups, candidates=candidates,
+                thresholds=thresholds or {'similarity': similarity_threshold},
+                floors=floors or {'similarity': similarity_threshold}
+            ))
             print(f"共找到 {len(similar_pairs)} 对相似文本")
             
             return similar_pairs
@@ -288,6 +1084,47 @@ class VectorSearch:
             print(f"Error generating similarity report: {e}")
             raise
 
+    def _find_similar_pairs(self, texts, embeddings, text_to_index, similarity_threshold, backend,
+                            query_batch_size, max_hits, partition_name, progress_callback):
+        """按所选后端计算相似度 >= similarity_threshold 的文本对，按相似度降序返回"""
+        if backend == 'numpy':
+            with metrics.timer(stage='similarity_numpy', items=len(texts)):
+                pair_scores = self.numpy_backend.find_similar_pairs(embeddings, similarity_threshold)
+        else:
+            # 未指定分区时按文本内容确定（与 process_excel_with_filter 未指定 job_id 时相同）
+            partition_name = partition_name or self.partition_for_texts(texts)
+            with metrics.timer(stage='similarity_milvus', items=len(texts)):
+                pair_scores = self._milvus_similar_pairs(
+                    texts, embeddings, similarity_threshold, query_batch_size, max_hits, partition_name,
+                    progress_callback
+                )
+        
+        similar_pairs = []
+        for i, j, similarity, distance in pair_scores:
+            text1, text2 = texts[i], texts[j]
+            similar_pairs.append({
+                'text1': text1,
+                'text2': text2,
+                'index1': text_to_index[text1],
+                'index2': text_to_index[text2],
+                'similarity': similarity,
+                'distance': distance
+            })
+        
+        # 按相似度降序排序
+        similar_pairs.sort(key=lambda x: x['similarity'], reverse=True)
+        return similar_pairs
+
+    def save_results(self, result_key, similar_pairs, duplicate_groups=None, corpus_duplicates=None,
+                     candidates=None, thresholds=None, floors=None):
+        """将相似文本对按列存入结果库，下载时再按阈值筛选并流式导出（见 result_store）"""
+        with metrics.timer(stage='save_results', items=len(similar_pairs)):
+            results = PairResults.from_pairs(similar_pairs, duplicate_groups, corpus_duplicates,
+                                             candidates, thresholds, floors)
+            self.result_store.save(result_key or 'latest', results)
+        print(f"\n相似度报告已保存: {self.result_store.path(result_key or 'latest')}")
+        return results
+
 def main():
     # 创建.env文件示例
     if not os.path.exists('.env'):
@@ -0,0 +1,206 @@
+import contextvars
+import cProfile
+import io
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+
+# 指标说明，渲染 /metrics 时作为 HELP 行输出
+_HELP = {
+    'stage_seconds': '各处理阶段的耗时（秒）',
+    'stage_items_total': '各处理阶段处理的条目数',
+    'cache_hits_total': '缓存命中次数',
+    'cache_misses_total': '缓存未命中次数',
+    'api_retries_total': '向量接口的重试次数',
+    'milvus_request_seconds': 'Milvus 调用耗时（秒）',
+    'milvus_request_items_total': 'Milvus 调用处理的条目数',
+    'milvus_index_rebuilds_deferred_total': '因有任务正在搜索而推迟的索引重建次数',
+    'milvus_saturated_queries_total': 'Milvus 范围搜索命中数达到 top_k、需要扩大 limit 重新查询的向量数',
+    'milvus_truncated_queries_total': '扩大到 limit 上限后仍然饱和、结果可能不完整的向量数',
+    'checkpoint_stages_total': '断点续跑各阶段复用或重新计算的次数',
+    'inverted_index_postings_total': '倒排索引建立的倒排项数',
+    'inverted_index_skipped_postings_total': '倒排索引因跳过高频词而省去的倒排项数',
+    'jobs_total': '已结束的任务数',
+    'job_seconds': '任务总耗时（秒）',
+}
+
+
+def _items_metric(metric):
+    """耗时指标对应的条目数计数器：stage_seconds -> stage_items_total"""
+    base = metric[:-len('_seconds')] if metric.endswith('_seconds') else metric
+    return f'{base}_items_total'
+
+# 当前线程/上下文所属任务的指标，未在任务中时为 None
+_current_job = contextvars.ContextVar('current_job_metrics', default=None)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(label_key):
+    if not label_key:
+        return ''
+    parts = []
+    for name, value in label_key:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{name}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+
+class JobMetrics:
+    """单个任务的指标汇总，随任务结果返回"""
+
+    def __init__(self):
+        self.timers = {}    # metric -> {标签值: {'seconds', 'calls', 'items'}}
+        self.counters = {}  # metric -> {标签值: 数值}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _name(labels):
+        return ','.join(str(value) for _, value in _label_key(labels)) or 'total'
+
+    def observe(self, metric, seconds, items=None, **labels):
+        with self._lock:
+            entry = self.timers.setdefault(metric, {}).setdefault(
+                self._name(labels), {'seconds': 0.0, 'calls': 0, 'items': 0}
+            )
+            entry['seconds'] += seconds
+            entry['calls'] += 1
+            if items:
+                entry['items'] += items
+
+    def inc(self, metric, value=1, **labels):
+        with self._lock:
+            values = self.counters.setdefault(metric, {})
+            name = self._name(labels)
+            values[name] = values.get(name, 0) + value
+
+    def to_dict(self):
+        with self._lock:
+            timers = {
+                metric: {name: {**entry, 'seconds': round(entry['seconds'], 4)} for name, entry in entries.items()}
+                for metric, entries in self.timers.items()
+            }
+            return {'timers': timers, 'counters': {metric: dict(values) for metric, values in self.counters.items()}}
+
+
+class MetricsRegistry:
+    """进程内的轻量指标：计数器与耗时汇总，按 Prometheus 文本格式导出
+
+    记录时同时写入当前任务的 JobMetrics（见 job_scope）。
+    """
+
+    def __init__(self, prefix='textcheck'):
+        self.prefix = prefix
+        self._counters = {}   # (metric, labels) -> 数值
+        self._summaries = {}  # (metric, labels) -> [次数, 总和]
+        self._lock = threading.Lock()
+
+    def inc(self, metric, value=1, **labels):
+        """计数器加 value"""
+        if not value:
+            return
+        with self._lock:
+            key = (metric, _label_key(labels))
+            self._counters[key] = self._counters.get(key, 0) + value
+        job = _current_job.get()
+        if job is not None:
+            job.inc(metric, value, **labels)
+
+    def observe(self, metric, seconds, items=None, **labels):
+        """记录一次耗时；items 为本次处理的条目数，累加到对应的条目数计数器（stage_seconds -> stage_items_total）"""
+        with self._lock:
+            key = (metric, _label_key(labels))
+            summary = self._summaries.setdefault(key, [0, 0.0])
+            summary[0] += 1
+            summary[1] += seconds
+            if items:
+                items_key = (_items_metric(metric), key[1])
+                self._counters[items_key] = self._counters.get(items_key, 0) + items
+        job = _current_job.get()
+        if job is not None:
+            job.observe(metric, seconds, items, **labels)
+
+    @contextmanager
+    def timer(self, metric='stage_seconds', items=None, **labels):
+        """计时上下文：with metrics.timer(stage='tokenize', items=n): ..."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(metric, time.perf_counter() - start, items, **labels)
+
+    @contextmanager
+    def job_scope(self):
+        """在上下文中执行的指标同时记录到返回的 JobMetrics"""
+        job = JobMetrics()
+        token = _current_job.set(job)
+        try:
+            yield job
+        finally:
+            _current_job.reset(token)
+
+    def render(self):
+        """Prometheus 文本格式"""
+        with self._lock:
+            counters = dict(self._counters)
+            summaries = {key: list(value) for key, value in self._summaries.items()}
+
+        lines = []
+        for metric in sorted({metric for metric, _ in counters}):
+            name = f'{self.prefix}_{metric}'
+            lines.append(f'# HELP {name} {_HELP.get(metric, metric)}')
+            lines.append(f'# TYPE {name} counter')
+            for (m, labels), value in sorted(counters.items()):
+                if m == metric:
+                    lines.append(f'{name}{_format_labels(labels)} {value}')
+        for metric in sorted({metric for metric, _ in summaries}):
+            name = f'{self.prefix}_{metric}'
+            lines.append(f'# HELP {name} {_HELP.get(metric, metric)}')
+            lines.append(f'# TYPE {name} summary')
+            for (m, labels), (count, total) in sorted(summaries.items()):
+                if m == metric:
+                    lines.append(f'{name}_count{_format_labels(labels)} {count}')
+                    lines.append(f'{name}_sum{_format_labels(labels)} {total:.6f}')
+        return '\n'.join(lines) + '\n'
+
+
+# 全局指标，VectorSearch、TextFilter 等模块共用
+metrics = MetricsRegistry()
+
+# cProfile 同一时间只能有一个实例在采样
+_profile_lock = threading.Lock()
+
+
+@contextmanager
+def profile_to(path):
+    """对当前线程执行的代码做 cProfile 采样，结束后写入 path（.prof）及 path.txt（按累计耗时排序的摘要）
+
+    已有其他任务在采样时跳过本次采样，返回值为是否实际进行了采样。
+    """
+    if not _profile_lock.acquire(blocking=False):
+        print("已有任务正在采样，本次不生成 profile")
+        yield False
+        return
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+        try:
+            yield True
+        finally:
+            # 任务失败时同样写出采样结果，便于定位
+            profiler.disable()
+            _write_profile(profiler, path)
+    finally:
+        _profile_lock.release()
+
+
+def _write_profile(profiler, path):
+    profiler.dump_stats(path)
+    summary = io.StringIO()
+    pstats.Stats(profiler, stream=summary).sort_stats('cumulative').print_stats(40)
+    with open(f'{path}.txt', 'w', encoding='utf-8') as f:
+        f.write(summary.getvalue())
+    print(f"性能采样已写入: {path}")
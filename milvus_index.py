@@ -0,0 +1,95 @@
+import json
+import math
+
+# 向量均已L2归一化，内积即余弦相似度，similarity_threshold 可直接作为范围搜索的下限
+METRIC_TYPE = "IP"
+
+# 集合规模分档：小于 FLAT_MAX_VECTORS 用暴力搜索，小于 IVF_MAX_VECTORS 用 IVF_FLAT，更大用 HNSW
+FLAT_MAX_VECTORS = 10000
+IVF_MAX_VECTORS = 1000000
+# 集合增长后，现有 IVF 索引的 nlist 与按当前规模计算的值相差超过该倍数时重建
+NLIST_REBUILD_RATIO = 2
+
+# 目标召回率 -> (IVF 探查比例 nprobe/nlist, HNSW ef)，按经验值分档
+_RECALL_TABLE = [
+    (0.90, 0.02, 64),
+    (0.95, 0.05, 128),
+    (0.99, 0.10, 256),
+    (1.00, 0.25, 512),
+]
+
+
+def ivf_nlist(num_vectors):
+    """IVF 聚类中心数：约 4*sqrt(n)"""
+    return int(min(65536, max(16, round(4 * math.sqrt(num_vectors)))))
+
+
+def choose_index(num_vectors):
+    """根据集合中的向量数量选择索引类型与构建参数"""
+    if num_vectors < FLAT_MAX_VECTORS:
+        return {"metric_type": METRIC_TYPE, "index_type": "FLAT", "params": {}}
+    if num_vectors < IVF_MAX_VECTORS:
+        return {"metric_type": METRIC_TYPE, "index_type": "IVF_FLAT", "params": {"nlist": ivf_nlist(num_vectors)}}
+    return {"metric_type": METRIC_TYPE, "index_type": "HNSW", "params": {"M": 16, "efConstruction": 200}}
+
+
+def _recall_setting(target_recall):
+    for recall, probe_ratio, ef in _RECALL_TABLE:
+        if target_recall <= recall:
+            return probe_ratio, ef
+    return _RECALL_TABLE[-1][1:]
+
+
+def search_params_for(index_params, target_recall=0.95, top_k=10):
+    """根据索引类型和目标召回率推导搜索参数（nprobe / ef）"""
+    probe_ratio, ef = _recall_setting(target_recall)
+    index_type = index_params["index_type"]
+    if index_type == "IVF_FLAT":
+        nlist = index_params["params"]["nlist"]
+        params = {"nprobe": max(1, min(nlist, math.ceil(nlist * probe_ratio)))}
+    elif index_type == "HNSW":
+        # HNSW 要求 ef >= top_k
+        params = {"ef": max(ef, top_k)}
+    else:
+        params = {}
+    return {"metric_type": index_params["metric_type"], "params": params}
+
+
+def normalize_index(index_params):
+    """将 describe_index 返回的索引参数整理为与 choose_index 相同的格式
+
+    不同版本的 pymilvus 中构建参数可能为JSON字符串、数值为字符串，或与 index_type 平铺在同一层
+    """
+    params = index_params.get("params") or {}
+    if isinstance(params, str):
+        params = json.loads(params)
+    params = dict(params)
+    for key, value in index_params.items():
+        if key not in ("index_type", "metric_type", "params", "field_name", "index_name"):
+            params.setdefault(key, value)
+    for key, value in params.items():
+        if isinstance(value, str):
+            try:
+                params[key] = json.loads(value)
+            except ValueError:
+                pass
+    return {"metric_type": index_params.get("metric_type"), "index_type": index_params.get("index_type"),
+            "params": params}
+
+
+def same_index(current, desired):
+    """判断集合当前索引（normalize_index 的结果）是否与期望的索引一致
+
+    IVF 索引的 nlist 与期望值相差 NLIST_REBUILD_RATIO 倍以内视为一致，避免集合每次增长都重建
+    """
+    if current is None:
+        return False
+    if (current.get("index_type") != desired["index_type"]
+            or current.get("metric_type") != desired["metric_type"]):
+        return False
+    if desired["index_type"] == "IVF_FLAT":
+        nlist = current["params"].get("nlist")
+        desired_nlist = desired["params"]["nlist"]
+        if not nlist or max(nlist, desired_nlist) > NLIST_REBUILD_RATIO * min(nlist, desired_nlist):
+            return False
+    return True
@@ -0,0 +1,270 @@
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+from metrics import metrics
+
+# 量化后的模型文件名（见 quantize_model）
+QUANTIZED_FILE = 'model_quantized.onnx'
+DEFAULT_MODEL_DIR = 'models/paraphrase-multilingual-MiniLM-L12-v2'
+
+
+class _Request:
+    """一次待推理的文本批次，由推理线程填充结果"""
+
+    def __init__(self, texts):
+        self.texts = texts
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class OnnxEmbedder:
+    """本地ONNX向量模型（可为int8量化模型），在CPU上推理
+
+    并发任务的请求在 max_wait_ms 内合并为一次推理（动态微批），批次上限为 max_batch_size 条文本。
+    model_dir 中需包含 model.onnx（或量化后的 model_quantized.onnx）、tokenizer.json 和 config.json，例如：
+        optimum-cli export onnx --model sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2 <model_dir>
+        python onnx_embedder.py quantize <model_dir>
+    可作为 VectorSearch 的 embedder 使用（提供 model_name、dim 和 encode）。
+    """
+
+    def __init__(self, model_dir=DEFAULT_MODEL_DIR, quantized=True, threads=None, max_batch_size=64,
+                 max_wait_ms=5, max_length=256, model_name=None, dim=None):
+        self.model_dir = model_dir
+        quantized_path = os.path.join(model_dir, QUANTIZED_FILE)
+        if quantized and not os.path.exists(quantized_path):
+            print(f"未找到量化模型 {quantized_path}，使用原始精度模型")
+            quantized = False
+        self.quantized = quantized
+        self.model_path = quantized_path if quantized else os.path.join(model_dir, 'model.onnx')
+        # 推理线程数（intra-op），默认使用全部CPU核心
+        self.threads = threads or os.cpu_count() or 1
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_length = max_length
+        # 不同模型/精度的向量不能混用，名称同时用作向量缓存的键
+        suffix = '-int8' if quantized else ''
+        self.model_name = model_name or f"onnx:{os.path.basename(os.path.normpath(model_dir))}{suffix}"
+        self.batches = 0
+        self.batched_texts = 0
+        self._session = None
+        self._tokenizer = None
+        self._load_lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._worker = None
+        # 没有 config.json 时维度在 load() 中由模型输出形状得到
+        self._dim = dim or self._config_dim()
+
+    @classmethod
+    def from_env(cls):
+        """按环境变量创建：ONNX_MODEL_DIR、ONNX_QUANTIZED、ONNX_THREADS、ONNX_MAX_BATCH_SIZE、
+        ONNX_MAX_WAIT_MS、ONNX_MAX_LENGTH"""
+        return cls(
+            model_dir=os.getenv('ONNX_MODEL_DIR', DEFAULT_MODEL_DIR),
+            quantized=os.getenv('ONNX_QUANTIZED', '1').lower() in ('1', 'true', 'on'),
+            threads=int(os.getenv('ONNX_THREADS', 0)) or None,
+            max_batch_size=int(os.getenv('ONNX_MAX_BATCH_SIZE', 64)),
+            max_wait_ms=float(os.getenv('ONNX_MAX_WAIT_MS', 5)),
+            max_length=int(os.getenv('ONNX_MAX_LENGTH', 256))
+        )
+
+    def _config_dim(self):
+        """从 config.json 读取向量维度，读取失败时返回 None"""
+        try:
+            with open(os.path.join(self.model_dir, 'config.json'), encoding='utf-8') as f:
+                return int(json.load(f)['hidden_size'])
+        except (OSError, KeyError, ValueError):
+            return None
+
+    @property
+    def dim(self):
+        """向量维度；config.json 中没有时需加载模型才能确定"""
+        if self._dim is None:
+            self.load()
+        return self._dim
+
+    @property
+    def loaded(self):
+        return self._session is not None
+
+    def load(self):
+        """加载模型与分词器并启动推理线程（首次调用 encode 时自动执行）"""
+        if self._session is not None:
+            return
+        with self._load_lock:
+            if self._session is not None:
+                return
+            # onnxruntime 与 tokenizers 为可选依赖，只在使用本地模型时导入
+            import onnxruntime as ort
+            from tokenizers import Tokenizer as HFTokenizer
+
+            with metrics.timer(stage='load_model'):
+                tokenizer = HFTokenizer.from_file(os.path.join(self.model_dir, 'tokenizer.json'))
+                tokenizer.enable_truncation(max_length=self.max_length)
+                pad_token = '<pad>' if tokenizer.token_to_id('<pad>') is not None else '[PAD]'
+                tokenizer.enable_padding(pad_id=tokenizer.token_to_id(pad_token) or 0, pad_token=pad_token)
+
+                options = ort.SessionOptions()
+                options.intra_op_num_threads = self.threads
+                options.inter_op_num_threads = 1
+                options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+                options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+                session = ort.InferenceSession(self.model_path, options, providers=['CPUExecutionProvider'])
+            self._input_names = {model_input.name for model_input in session.get_inputs()}
+            self._output_names = [output.name for output in session.get_outputs()]
+            if self._dim is None:
+                self._dim = int(session.get_outputs()[0].shape[-1])
+            self._tokenizer = tokenizer
+            self._session = session
+            self._worker = threading.Thread(target=self._serve, name='onnx-embedder', daemon=True)
+            self._worker.start()
+            print(f"已加载本地向量模型: {self.model_path}（{self.threads} 线程）")
+
+    def encode(self, texts):
+        """返回文本向量（L2归一化的列表）；与其他任务的请求合并推理"""
+        if not texts:
+            return []
+        self.load()
+        requests = [_Request(texts[start:start + self.max_batch_size])
+                    for start in range(0, len(texts), self.max_batch_size)]
+        for request in requests:
+            self._queue.put(request)
+        embeddings = []
+        for request in requests:
+            request.done.wait()
+            if request.error is not None:
+                raise request.error
+            embeddings.extend(request.result)
+        return embeddings
+
+    def _serve(self):
+        """推理线程：取出第一个请求后最多等待 max_wait，把期间到达的请求合并为一批"""
+        carry = None
+        while True:
+            pending = [carry or self._queue.get()]
+            carry = None
+            size = len(pending[0].texts)
+            deadline = time.monotonic() + self.max_wait
+            while size < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if size + len(request.texts) > self.max_batch_size:
+                    # 放不下的请求留到下一批
+                    carry = request
+                    break
+                pending.append(request)
+                size += len(request.texts)
+
+            texts = [text for request in pending for text in request.texts]
+            try:
+                vectors = self._infer(texts)
+            except Exception as e:
+                print(f"本地向量模型推理出错: {e}")
+                for request in pending:
+                    request.error = e
+                    request.done.set()
+                continue
+            offset = 0
+            for request in pending:
+                request.result = vectors[offset:offset + len(request.texts)].tolist()
+                offset += len(request.texts)
+                request.done.set()
+
+    def _infer(self, texts):
+        """一次推理：分词、前向计算、按注意力掩码做平均池化并归一化"""
+        with metrics.timer(stage='onnx_inference', items=len(texts)):
+            encodings = self._tokenizer.encode_batch(texts)
+            input_ids = np.array([encoding.ids for encoding in encodings], dtype=np.int64)
+            attention_mask = np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+            feeds = {'input_ids': input_ids, 'attention_mask': attention_mask}
+            if 'token_type_ids' in self._input_names:
+                feeds['token_type_ids'] = np.array([encoding.type_ids for encoding in encodings], dtype=np.int64)
+            outputs = dict(zip(self._output_names, self._session.run(None, feeds)))
+
+            if 'sentence_embedding' in outputs:
+                pooled = outputs['sentence_embedding']
+            else:
+                hidden = outputs.get('last_hidden_state', next(iter(outputs.values())))
+                mask = attention_mask[:, :, None].astype(np.float32)
+                pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+            norms[norms == 0] = 1
+        self.batches += 1
+        self.batched_texts += len(texts)
+        return (pooled / norms).astype(np.float32)
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'texts': self.batched_texts,
+            'average_batch_size': self.batched_texts / self.batches if self.batches else 0
+        }
+
+
+def quantize_model(model_dir):
+    """将 model.onnx 动态量化为 int8 权重，写入 model_quantized.onnx"""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    source = os.path.join(model_dir, 'model.onnx')
+    target = os.path.join(model_dir, QUANTIZED_FILE)
+    quantize_dynamic(source, target, weight_type=QuantType.QInt8)
+    print(f"量化模型已写入: {target}（{os.path.getsize(source) / 2**20:.0f}MB -> {os.path.getsize(target) / 2**20:.0f}MB）")
+    return target
+
+
+def benchmark(model_dir, num_texts=2000, clients=4, quantized=True, threads=None):
+    """多个客户端并发请求时的吞吐量（条/秒）及平均批大小"""
+    embedder = OnnxEmbedder(model_dir, quantized=quantized, threads=threads)
+    embedder.load()
+    texts = [f"第{k}条测试文本，用于测量本地向量模型的吞吐量。" for k in range(num_texts)]
+
+    def client(part):
+        # 模拟多个任务各自按小批次请求
+        for start in range(0, len(part), 16):
+            embedder.encode(part[start:start + 16])
+
+    workers = [threading.Thread(target=client, args=(texts[k::clients],)) for k in range(clients)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+    stats = embedder.stats()
+    print(f"{embedder.model_name}: {num_texts / elapsed:.0f} 条/秒（{embedder.threads} 线程，{clients} 个并发客户端，"
+          f"平均批大小 {stats['average_batch_size']:.1f}）")
+    return num_texts / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地ONNX向量模型工具")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    quantize_parser = subparsers.add_parser('quantize', help="生成int8量化模型")
+    quantize_parser.add_argument('model_dir')
+    bench_parser = subparsers.add_parser('bench', help="测量并发吞吐量")
+    bench_parser.add_argument('model_dir')
+    bench_parser.add_argument('--texts', type=int, default=2000)
+    bench_parser.add_argument('--clients', type=int, default=4)
+    bench_parser.add_argument('--threads', type=int, default=None)
+    bench_parser.add_argument('--full-precision', action='store_true')
+    args = parser.parse_args()
+
+    if args.command == 'quantize':
+        quantize_model(args.model_dir)
+    else:
+        benchmark(args.model_dir, args.texts, args.clients, not args.full_precision, args.threads)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,397 @@
+import csv
+import io
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from openpyxl import Workbook
+
+from clustering import cluster_pairs
+
+# 报告中相似文本工作表的列，增量查重的结果额外带有 scope 列
+PAIR_COLUMNS = ['text1', 'text2', 'index1', 'index2', 'similarity', 'distance']
+_SCOPES = ['batch', 'corpus']
+# 交叉比对的结果额外带有两侧文本的来源文件、工作表和列
+ORIGIN_FIELDS = ['source', 'sheet', 'column']
+# 初筛文本对的最高分对应的方法（见 TextFilter._score_pair）
+PREFILTER_METHODS = ['keyword', 'tfidf', 'edit_distance']
+
+
+class PairResults:
+    """单个任务的相似文本对，按列存储：文本只保存一次，文本对为文本编号与分数数组
+
+    文本对按相似度降序保存，按阈值筛选得到的仍是有序的前缀。
+    整表查重时还保存初筛文本对（candidate*，按初筛分数降序），文本对与初筛结果均按较低的下限阈值（floors）计算，
+    之后调整初筛阈值或相似度阈值只需在已保存的分数上筛选（见 select），不必重新上传。
+    """
+
+    def __init__(self, texts, labels, text1, text2, similarity, distance, scope=None,
+                 duplicate_groups=None, corpus_duplicates=None, origins=None, candidates=None,
+                 thresholds=None, floors=None):
+        self.texts = texts          # 文本列表（同一文本出现在不同位置时各保存一次）
+        self.labels = labels        # 每个文本在原文件中的行号（历史文本为来源标识）
+        self.origins = origins      # 每个文本的 [来源, 工作表, 列]；非交叉比对时为 None
+        self.text1 = text1          # int32 文本编号
+        self.text2 = text2
+        self.similarity = similarity  # float64，降序
+        self.distance = distance
+        self.scope = scope          # uint8，0=batch 1=corpus；非增量查重时为 None
+        self.duplicate_groups = duplicate_groups or []
+        self.corpus_duplicates = corpus_duplicates or []
+        # 初筛文本对 {'text1', 'text2', 'score', 'method'}（int32/int32/float64降序/uint8）；未保存时为 None
+        self.candidates = candidates
+        # 任务提交时选择的阈值与实际计算所用的下限阈值 {'filter', 'similarity'}
+        self.thresholds = thresholds or {}
+        self.floors = floors or {}
+        self._filter_scores = None
+
+    @classmethod
+    def from_pairs(cls, similar_pairs, duplicate_groups=None, corpus_duplicates=None, candidates=None,
+                   thresholds=None, floors=None):
+        """由 generate_similarity_report 产生的文本对列表构建；candidates 为 batch_process 产生的初筛文本对"""
+        pairs = sorted(similar_pairs, key=lambda pair: pair['similarity'], reverse=True)
+        has_origins = (any('source1' in pair for pair in pairs) or
+                       any('source1' in pair for pair in candidates or []))
+        ids = {}
+        texts, labels, origins = [], [], []
+
+        def intern(pair, side):
+            text, label = pair[f'text{side}'], pair[f'index{side}']
+            origin = tuple(pair.get(f'{field}{side}') for field in ORIGIN_FIELDS) if has_origins else None
+            key = (text, label, origin)
+            text_id = ids.get(key)
+            if text_id is None:
+                text_id = ids[key] = len(texts)
+                texts.append(text)
+                labels.append(label)
+                origins.append(list(origin) if has_origins else None)
+            return text_id
+
+        text1 = np.fromiter((intern(p, 1) for p in pairs), dtype=np.int32, count=len(pairs))
+        text2 = np.fromiter((intern(p, 2) for p in pairs), dtype=np.int32, count=len(pairs))
+        candidate_arrays = None
+        if candidates is not None:
+            candidates = sorted(candidates, key=lambda pair: pair['similarity'], reverse=True)
+            candidate_arrays = {
+                'text1': np.fromiter((intern(p, 1) for p in candidates), dtype=np.int32, count=len(candidates)),
+                'text2': np.fromiter((intern(p, 2) for p in candidates), dtype=np.int32, count=len(candidates)),
+                'score': np.fromiter((p['similarity'] for p in candidates), dtype=np.float64, count=len(candidates)),
+                'method': np.fromiter((PREFILTER_METHODS.index(p['method']) for p in candidates),
+                                      dtype=np.uint8, count=len(candidates)),
+            }
+        scope = None
+        if any('scope' in pair for pair in pairs):
+            scope = np.fromiter((_SCOPES.index(p.get('scope', 'batch')) for p in pairs),
+                                dtype=np.uint8, count=len(pairs))
+        return cls(
+            texts, labels, text1, text2,
+            np.fromiter((p['similarity'] for p in pairs), dtype=np.float64, count=len(pairs)),
+            np.fromiter((p['distance'] for p in pairs), dtype=np.float64, count=len(pairs)),
+            scope,
+            [
+                {
+                    'rows': list(group['rows']),
+                    'text': group['representative'][1],
+                    'match_type': group['match_type'],
+                    **({'source': group['source']} if 'source' in group else {})
+                }
+                for group in duplicate_groups or []
+            ],
+            corpus_duplicates,
+            origins if has_origins else None,
+            candidate_arrays,
+            thresholds,
+            floors
+        )
+
+    def __len__(self):
+        return len(self.similarity)
+
+    def count(self, threshold=0):
+        """相似度 >= threshold 的文本对数量（similarity 降序，二分查找）"""
+        return int(np.searchsorted(-self.similarity, -threshold, side='right'))
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        encoded = [text.encode('utf-8') for text in self.texts]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        arrays = {
+            'text_bytes': np.frombuffer(b''.join(encoded), dtype=np.uint8),
+            'text_offsets': offsets,
+            'text1': self.text1,
+            'text2': self.text2,
+            'similarity': self.similarity,
+            'distance': self.distance,
+        }
+        if self.scope is not None:
+            arrays['scope'] = self.scope
+        if self.candidates is not None:
+            arrays.update((f'candidate_{name}', values) for name, values in self.candidates.items())
+        np.savez(os.path.join(directory, 'pairs.npz'), **arrays)
+        with open(os.path.join(directory, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump({
+                'labels': self.labels,
+                'origins': self.origins,
+                'duplicate_groups': self.duplicate_groups,
+                'corpus_duplicates': self.corpus_duplicates,
+                'thresholds': self.thresholds,
+                'floors': self.floors
+            }, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, directory):
+        with np.load(os.path.join(directory, 'pairs.npz')) as data:
+            arrays = {name: data[name] for name in data.files}
+        with open(os.path.join(directory, 'meta.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        text_bytes, offsets = arrays['text_bytes'].tobytes(), arrays['text_offsets']
+        texts = [text_bytes[offsets[k]:offsets[k + 1]].decode('utf-8') for k in range(len(offsets) - 1)]
+        candidates = None
+        if 'candidate_score' in arrays:
+            candidates = {name[len('candidate_'):]: values for name, values in arrays.items()
+                          if name.startswith('candidate_')}
+        return cls(
+            texts, meta['labels'], arrays['text1'], arrays['text2'], arrays['similarity'], arrays['distance'],
+            arrays.get('scope'), meta['duplicate_groups'], meta['corpus_duplicates'], meta.get('origins'),
+            candidates, meta.get('thresholds'), meta.get('floors')
+        )
+
+    @property
+    def filter_scores(self):
+        """每个文本在初筛中的最高分：调整初筛阈值后，只有最高分不低于阈值的文本才会进入向量阶段"""
+        if self._filter_scores is None:
+            scores = np.zeros(len(self.texts), dtype=np.float64)
+            np.maximum.at(scores, self.candidates['text1'], self.candidates['score'])
+            np.maximum.at(scores, self.candidates['text2'], self.candidates['score'])
+            self._filter_scores = scores
+        return self._filter_scores
+
+    def select(self, filter_threshold=None, similarity_threshold=None):
+        """按阈值筛选，返回 (初筛文本对下标, 相似文本对下标, 实际使用的阈值)
+        
+        阈值为 None 时使用任务提交时的阈值；低于下限阈值时按下限处理（更低分数的文本对并未计算）。
+        与按该阈值重新运行整个流程的结果一致：相似文本对的两个文本都须通过初筛，且向量相似度不低于阈值。
+        没有初筛下限（增量查重、交叉比对）时初筛阈值不可调整，返回全部初筛文本对。
+        """
+        similarity_threshold = max(
+            self.thresholds.get('similarity', 0) if similarity_threshold is None else similarity_threshold,
+            self.floors.get('similarity', 0)
+        )
+        pair_indices = np.arange(self.count(similarity_threshold))
+        candidate_indices = None
+        if self.candidates is not None and 'filter' not in self.floors:
+            filter_threshold = self.thresholds.get('filter')
+            candidate_indices = np.arange(len(self.candidates['score']))
+        elif self.candidates is not None:
+            filter_threshold = max(
+                self.thresholds.get('filter', 0) if filter_threshold is None else filter_threshold,
+                self.floors.get('filter', 0)
+            )
+            candidate_indices = np.arange(int(np.searchsorted(-self.candidates['score'], -filter_threshold,
+                                                              side='right')))
+            scores = self.filter_scores
+            keep = ((scores[self.text1[pair_indices]] >= filter_threshold) &
+                    (scores[self.text2[pair_indices]] >= filter_threshold))
+            pair_indices = pair_indices[keep]
+        else:
+            filter_threshold = None
+        return candidate_indices, pair_indices, {'filter': filter_threshold, 'similarity': similarity_threshold}
+
+    def member(self, text_id):
+        """文本 {'text', 'index'}，交叉比对时还有来源文件、工作表和列"""
+        fields = {'text': self.texts[text_id], 'index': self.labels[text_id]}
+        if self.origins is not None:
+            fields.update(zip(ORIGIN_FIELDS, self.origins[text_id]))
+        return fields
+
+    def _pair_fields(self, i, j):
+        fields = {}
+        for side, text_id in ((1, i), (2, j)):
+            fields.update((f'{name}{side}', value) for name, value in self.member(text_id).items())
+        return fields
+
+    def groups(self, indices, candidates=False):
+        """把选中的文本对（select 返回的下标）合并为相似文本分组，见 clustering.cluster_pairs
+        
+        分组成员为文本编号（见 member），edges 为组内文本对的下标（见 pair / candidate）
+        """
+        if candidates:
+            text1, text2, scores = self.candidates['text1'], self.candidates['text2'], self.candidates['score']
+        else:
+            text1, text2, scores = self.text1, self.text2, self.similarity
+        indices = np.asarray(indices, dtype=np.int64)
+        groups = cluster_pairs(list(zip(text1[indices].tolist(), text2[indices].tolist(), scores[indices].tolist())))
+        for group in groups:
+            group['edges'] = indices[group['edges']].tolist()
+        return groups
+
+    def pair(self, k):
+        """第 k 个相似文本对，格式与 generate_similarity_report 的结果相同"""
+        pair = self._pair_fields(self.text1[k], self.text2[k])
+        pair.update(similarity=float(self.similarity[k]), distance=float(self.distance[k]))
+        if self.scope is not None:
+            pair['scope'] = _SCOPES[self.scope[k]]
+        return pair
+
+    def candidate(self, k):
+        """第 k 个初筛文本对，格式与 batch_process 的结果相同"""
+        pair = self._pair_fields(self.candidates['text1'][k], self.candidates['text2'][k])
+        pair.update(similarity=float(self.candidates['score'][k]),
+                    method=PREFILTER_METHODS[self.candidates['method'][k]])
+        return pair
+
+    @property
+    def columns(self):
+        columns = list(PAIR_COLUMNS)
+        if self.scope is not None:
+            columns.append('scope')
+        if self.origins is not None:
+            columns += [f'{field}{side}' for side in (1, 2) for field in ORIGIN_FIELDS]
+        return columns + ['similarity_percentage']
+
+    def _report_indices(self, threshold=0, filter_threshold=None, similarity_threshold=None):
+        """报告中的文本对下标：默认按任务提交时的阈值筛选，threshold 为额外的相似度下限"""
+        similarity_threshold = max(
+            threshold, self.thresholds.get('similarity', 0) if similarity_threshold is None else similarity_threshold
+        )
+        return self.select(filter_threshold, similarity_threshold)[1]
+
+    def iter_rows(self, threshold=0, filter_threshold=None, similarity_threshold=None, indices=None):
+        """按相似度降序产生报告行"""
+        if indices is None:
+            indices = self._report_indices(threshold, filter_threshold, similarity_threshold)
+        for k in indices:
+            i, j = self.text1[k], self.text2[k]
+            similarity = float(self.similarity[k])
+            row = [self.texts[i], self.texts[j], self.labels[i], self.labels[j], similarity, float(self.distance[k])]
+            if self.scope is not None:
+                row.append(_SCOPES[self.scope[k]])
+            if self.origins is not None:
+                row += self.origins[i] + self.origins[j]
+            row.append(f"{similarity:.2%}")
+            yield row
+
+    def write_xlsx(self, path, threshold=0, filter_threshold=None, similarity_threshold=None):
+        """使用 openpyxl 的 write_only 模式逐行写出，内存占用与结果数量无关"""
+        workbook = Workbook(write_only=True)
+        indices = self._report_indices(threshold, filter_threshold, similarity_threshold)
+        # 相似文本按连通分量合并为分组，每个文本只出现一次；逐对明细见下一个工作表
+        sheet = workbook.create_sheet('相似文本分组')
+        origin_columns = ORIGIN_FIELDS if self.origins is not None else []
+        sheet.append(['group', 'size', 'pairs', 'role', 'index', 'text', 'similarity_to_medoid',
+                      'similarity_percentage'] + origin_columns)
+        for number, group in enumerate(self.groups(indices), 1):
+            for text_id, similarity in group['members']:
+                member = self.member(text_id)
+                sheet.append([number, len(group['members']), len(group['edges']),
+                              'medoid' if text_id == group['medoid'] else 'member', member['index'], member['text'],
+                              similarity, f"{similarity:.2%}"] + [member[field] for field in origin_columns])
+        sheet = workbook.create_sheet('相似文本')
+        sheet.append(self.columns)
+        for row in self.iter_rows(indices=indices):
+            sheet.append(row)
+        if self.duplicate_groups:
+            sheet = workbook.create_sheet('重复文本')
+            # 交叉比对时重复文本按来源分别统计
+            with_source = any('source' in group for group in self.duplicate_groups)
+            sheet.append((['source'] if with_source else []) +
+                         ['rows', 'count', 'text', 'match_type', 'similarity', 'similarity_percentage'])
+            for group in self.duplicate_groups:
+                sheet.append(([group.get('source')] if with_source else []) +
+                             [', '.join(str(row) for row in group['rows']), len(group['rows']), group['text'],
+                              group['match_type'], 1.0, f"{1.0:.2%}"])
+        if self.corpus_duplicates:
+            sheet = workbook.create_sheet('历史库重复')
+            sheet.append(['rows', 'text', 'corpus_index', 'corpus_text', 'similarity', 'similarity_percentage'])
+            for duplicate in self.corpus_duplicates:
+                sheet.append([', '.join(str(row) for row in duplicate['rows']), duplicate['text'],
+                              duplicate['corpus_index'], duplicate['corpus_text'], 1.0, f"{1.0:.2%}"])
+        workbook.save(path)
+
+    def iter_csv(self, threshold=0, chunk_rows=2000, filter_threshold=None, similarity_threshold=None):
+        """以CSV格式分块产生报告内容（带BOM，Excel可直接打开），用于流式下载"""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        buffer.write('\ufeff')
+        writer.writerow(self.columns)
+        for n, row in enumerate(self.iter_rows(threshold, filter_threshold, similarity_threshold), 1):
+            writer.writerow(row)
+            if n % chunk_rows == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+
+class ResultStore:
+    """按任务保存 PairResults，最近使用的若干个保留在内存中"""
+
+    def __init__(self, root='reports', max_cached=4):
+        self.root = root
+        self.max_cached = max_cached
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def path(self, key):
+        return os.path.join(self.root, os.path.basename(str(key)))
+
+    def save(self, key, results):
+        """保存任务结果，并记为最近一次的结果"""
+        results.save(self.path(key))
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, 'LATEST'), 'w', encoding='utf-8') as f:
+            f.write(str(key))
+        with self._lock:
+            self._remember(str(key), results)
+
+    def latest_key(self):
+        try:
+            with open(os.path.join(self.root, 'LATEST'), encoding='utf-8') as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def get(self, key=None):
+        """读取任务结果，key 为空时返回最近一次的结果；不存在时返回 None"""
+        key = str(key) if key else self.latest_key()
+        if key is None:
+            return None
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+        if not os.path.exists(os.path.join(self.path(key), 'pairs.npz')):
+            return None
+        results = PairResults.load(self.path(key))
+        with self._lock:
+            self._remember(key, results)
+        return results
+
+    def _remember(self, key, results):
+        self._cache[key] = results
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_cached:
+            self._cache.popitem(last=False)
+
+    def export_xlsx(self, key=None, threshold=0, name='all', filter_threshold=None, similarity_threshold=None):
+        """导出（并缓存）按阈值筛选后的Excel文件，返回文件路径；结果不存在时返回 None
+        
+        filter_threshold / similarity_threshold: 页面上调整后的阈值，默认为任务提交时的阈值
+        """
+        key = str(key) if key else self.latest_key()
+        results = self.get(key)
+        if results is None:
+            return None
+        thresholds = results.select(filter_threshold, similarity_threshold)[2]
+        if filter_threshold is not None or similarity_threshold is not None:
+            name = f"{name}_f{thresholds['filter']}_s{thresholds['similarity']}"
+        path = os.path.join(self.path(key), f'similarity_report_{os.path.basename(name)}.xlsx')
+        # 任务结果保存后不再变化，同一阈值的导出文件可直接复用
+        if not os.path.exists(path):
+            tmp_path = f'{path}.tmp'
+            results.write_xlsx(tmp_path, threshold, filter_threshold, similarity_threshold)
+            os.replace(tmp_path, path)
+        return path
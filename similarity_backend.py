@@ -0,0 +1,56 @@
+import numpy as np
+
+
+class NumpySimilarityBackend:
+    """进程内的向量相似度计算：归一化后分块矩阵乘法并按阈值筛选"""
+
+    def __init__(self, block_size=1024):
+        # 每次只计算 block_size x block_size 的相似度块，内存占用与文本数量无关
+        self.block_size = block_size
+
+    @staticmethod
+    def normalize(embeddings):
+        """转换为连续的float32矩阵并按行L2归一化"""
+        matrix = np.ascontiguousarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        return matrix / norms
+
+    def find_similar_pairs(self, embeddings, similarity_threshold=0.9):
+        """返回 [(i, j, similarity, distance)]，i<j
+
+        与Milvus IP路径保持一致：similarity 为余弦相似度，distance = 1 - similarity。
+        """
+        matrix = self.normalize(embeddings)
+        n = matrix.shape[0]
+
+        pairs = []
+        for row_start in range(0, n, self.block_size):
+            row_block = matrix[row_start:row_start + self.block_size]
+            # 只计算上三角的块
+            for col_start in range(row_start, n, self.block_size):
+                col_block = matrix[col_start:col_start + self.block_size]
+                cosine = row_block @ col_block.T
+                rows, cols = np.nonzero(cosine >= similarity_threshold)
+                rows_global = rows + row_start
+                cols_global = cols + col_start
+                upper = rows_global < cols_global
+                for i, j, r, c in zip(rows_global[upper], cols_global[upper], rows[upper], cols[upper]):
+                    similarity = float(cosine[r, c])
+                    pairs.append((int(i), int(j), similarity, 1 - similarity))
+        return pairs
+
+    def find_cross_pairs(self, query_embeddings, target_embeddings, similarity_threshold=0.9):
+        """查询集合与目标集合之间的相似对，返回 [(查询位置, 目标位置, similarity, distance)]"""
+        queries = self.normalize(query_embeddings)
+        targets = self.normalize(target_embeddings)
+        pairs = []
+        for row_start in range(0, queries.shape[0], self.block_size):
+            row_block = queries[row_start:row_start + self.block_size]
+            for col_start in range(0, targets.shape[0], self.block_size):
+                cosine = row_block @ targets[col_start:col_start + self.block_size].T
+                rows, cols = np.nonzero(cosine >= similarity_threshold)
+                for r, c in zip(rows, cols):
+                    similarity = float(cosine[r, c])
+                    pairs.append((int(r + row_start), int(c + col_start), similarity, 1 - similarity))
+        return pairs
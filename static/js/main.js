@@ -5,16 +5,29 @@ let currentInitialPage = 1;
 let currentFinalPage = 1;
 let similarityChart = null;
 let methodChart = null;
+let currentResult = null;
+let refreshTimer = null;
+let refreshSequence = 0;
 
 // 初始化事件监听器
 document.addEventListener('DOMContentLoaded', function() {
-    // 监听滑块值变化
+    // 监听滑块值变化：已有结果时按新阈值重新筛选（不重新上传）
     document.getElementById('filter_threshold').addEventListener('input', function(e) {
         document.getElementById('filter_threshold_value').textContent = e.target.value;
+        scheduleRefresh();
     });
 
     document.getElementById('similarity_threshold').addEventListener('input', function(e) {
         document.getElementById('similarity_threshold_value').textContent = e.target.value;
+        scheduleRefresh();
+    });
+
+    // 交叉比对模式可选择多个文件
+    document.getElementById('mode').addEventListener('change', function(e) {
+        const crosscheck = e.target.value === 'crosscheck';
+        document.getElementById('file').multiple = crosscheck;
+        document.getElementById('compareOption').classList.toggle('d-none', !crosscheck);
+        document.getElementById('commitOption').classList.toggle('d-none', crosscheck);
     });
 
     // 监听页面大小变化
@@ -40,6 +53,59 @@ document.addEventListener('DOMContentLoaded', function() {
     });
 });
 
+// 滑块停止拖动片刻后再请求，避免每个中间值都发送请求
+function scheduleRefresh() {
+    if (!window.currentJobId) return;
+    clearTimeout(refreshTimer);
+    refreshTimer = setTimeout(refreshResults, 150);
+}
+
+// 按滑块当前的阈值从服务端已保存的分数中重新筛选结果
+async function refreshResults() {
+    const filterValue = document.getElementById('filter_threshold').value;
+    const similarityValue = document.getElementById('similarity_threshold').value;
+    const params = new URLSearchParams({ filter: filterValue, similarity: similarityValue });
+    const sequence = ++refreshSequence;
+    try {
+        const response = await fetch(`/jobs/${window.currentJobId}/results?${params}`);
+        const data = await response.json();
+        // 拖动较快时只显示最后一次请求的结果
+        if (sequence !== refreshSequence) return;
+        if (data.error) {
+            throw new Error(data.error);
+        }
+        showResults(Object.assign({}, currentResult, data));
+        showAppliedThresholds(data.thresholds, filterValue, similarityValue, data.floors);
+    } catch (error) {
+        Swal.fire({
+            icon: 'error',
+            title: '错误',
+            text: error.message
+        });
+    }
+}
+
+// 低于下限的阈值按下限筛选，提示需要重新上传才能使用更低的阈值；
+// 增量查重与交叉比对没有初筛下限，初筛阈值固定为提交任务时的值
+function showAppliedThresholds(thresholds, filterValue, similarityValue, floors) {
+    window.currentThresholds = thresholds;
+    const filterFixed = floors && !('filter' in floors);
+    const labels = [
+        ['filter_threshold_value', filterValue, thresholds.filter, filterFixed],
+        ['similarity_threshold_value', similarityValue, thresholds.similarity, false]
+    ];
+    labels.forEach(([id, value, applied, fixed]) => {
+        const element = document.getElementById(id);
+        if (fixed && applied !== null && applied !== parseFloat(value)) {
+            element.textContent = `${value}（该模式下初筛阈值不可调整，按 ${applied} 筛选）`;
+        } else if (applied !== null && applied > parseFloat(value)) {
+            element.textContent = `${value}（已按 ${applied} 筛选，更低的阈值需重新上传）`;
+        } else {
+            element.textContent = value;
+        }
+    });
+}
+
 // 更新进度条
 function updateProgress(percent, text) {
     document.getElementById('progressBar').style.width = `${percent}%`;
@@ -75,7 +141,7 @@ function sortTable(tableType, column) {
         let valueB = b[column];
         
         // 处理相似度的百分比字符串
-        if (column === 'similarity') {
+        if (column.endsWith('similarity')) {
             valueA = parseFloat(valueA);
             valueB = parseFloat(valueB);
         }
@@ -129,93 +195,132 @@ function generatePagination(currentPage, totalPages, onPageChange) {
     return pagination.join('');
 }
 
-// 更新初筛结果表格
-function updateInitialTable() {
-    const pageSize = parseInt(document.getElementById('initialPageSize').value);
-    const searchText = document.getElementById('initialSearch').value.toLowerCase();
+// 分组成员的搜索：匹配任一成员的文本或行号
+function groupMatches(group, searchText) {
+    return group.members.some(member =>
+        member.text.toLowerCase().includes(searchText) ||
+        member.index.toString().toLowerCase().includes(searchText)
+    );
+}
+
+// 分组表格的一行：首位成员为中心文本，其余成员按与中心文本的相似度降序
+function renderGroupRow(group, kind) {
+    const [medoid, ...others] = group.members;
+    const members = others.map(member => `
+        <div><span class="text-muted">${member.index}</span> ${member.text}
+            <span class="${getSimilarityClass(member.similarity)}">(${member.similarity})</span></div>
+    `).join('');
+    return `
+        <tr>
+            <td>${group.id + 1}</td>
+            <td>${group.size}</td>
+            <td><span class="text-muted">${medoid.index}</span> ${medoid.text}</td>
+            <td>${members}</td>
+            <td class="${getSimilarityClass(group.max_similarity)}">${group.max_similarity}</td>
+            <td class="${getSimilarityClass(group.min_similarity)}">${group.min_similarity}</td>
+            <td><button class="btn btn-outline-primary btn-sm" onclick="viewGroupPairs('${kind}', ${group.id})">查看文本对(${group.pair_count})</button></td>
+        </tr>
+    `;
+}
+
+// 更新分组表格（初筛结果或最终结果）
+function updateGroupTable(kind, data, currentPage, onPageChange) {
+    const pageSize = parseInt(document.getElementById(`${kind}PageSize`).value);
+    const searchText = document.getElementById(`${kind}Search`).value.toLowerCase();
     
     // 过滤数据
-    const filteredData = initialData.filter(item => 
-        item.text1.toLowerCase().includes(searchText) ||
-        item.text2.toLowerCase().includes(searchText) ||
-        item.index1.toString().includes(searchText) ||
-        item.index2.toString().includes(searchText)
-    );
+    const filteredData = data.filter(group => groupMatches(group, searchText));
     
     // 计算分页
     const totalPages = Math.ceil(filteredData.length / pageSize);
-    const start = (currentInitialPage - 1) * pageSize;
+    const start = (currentPage - 1) * pageSize;
     const end = start + pageSize;
     const pageData = filteredData.slice(start, end);
     
     // 更新表格内容
-    const tbody = document.getElementById('initialResultsBody');
-    tbody.innerHTML = pageData.map(pair => `
-        <tr>
-            <td>${pair.index1}</td>
-            <td>${pair.text1}</td>
-            <td>${pair.index2}</td>
-            <td>${pair.text2}</td>
-            <td class="${getSimilarityClass(pair.similarity)}">${pair.similarity}</td>
-            <td>${pair.distance.toFixed(4)}</td>
-            <td>${pair.method}</td>
-        </tr>
-    `).join('');
+    document.getElementById(`${kind}ResultsBody`).innerHTML = pageData.map(group => renderGroupRow(group, kind)).join('');
     
     // 更新分页按钮
-    document.getElementById('initialPagination').innerHTML = generatePagination(
-        currentInitialPage,
-        totalPages,
-        'setInitialPage'
-    );
+    document.getElementById(`${kind}Pagination`).innerHTML = generatePagination(currentPage, totalPages, onPageChange);
     
     // 更新分页信息
-    document.getElementById('initialPageInfo').textContent = 
-        `显示 ${start + 1} 到 ${Math.min(end, filteredData.length)} 条，共 ${filteredData.length} 条`;
+    document.getElementById(`${kind}PageInfo`).textContent = 
+        `显示 ${start + 1} 到 ${Math.min(end, filteredData.length)} 组，共 ${filteredData.length} 组`;
+}
+
+// 更新初筛结果表格
+function updateInitialTable() {
+    updateGroupTable('initial', initialData, currentInitialPage, 'setInitialPage');
 }
 
 // 更新最终结果表格
 function updateFinalTable() {
-    const pageSize = parseInt(document.getElementById('finalPageSize').value);
-    const searchText = document.getElementById('finalSearch').value.toLowerCase();
-    
-    // 过滤数据
-    const filteredData = finalData.filter(item => 
-        item.text1.toLowerCase().includes(searchText) ||
-        item.text2.toLowerCase().includes(searchText) ||
-        item.index1.toString().includes(searchText) ||
-        item.index2.toString().includes(searchText)
-    );
-    
-    // 计算分页
-    const totalPages = Math.ceil(filteredData.length / pageSize);
-    const start = (currentFinalPage - 1) * pageSize;
-    const end = start + pageSize;
-    const pageData = filteredData.slice(start, end);
-    
-    // 更新表格内容
-    const tbody = document.getElementById('finalResultsBody');
-    tbody.innerHTML = pageData.map(pair => `
+    updateGroupTable('final', finalData, currentFinalPage, 'setFinalPage');
+}
+
+// 按需获取分组内的文本对明细（使用页面上当前的阈值）
+async function viewGroupPairs(kind, groupId) {
+    const params = new URLSearchParams({ kind });
+    const thresholds = window.currentThresholds || {};
+    if (thresholds.filter != null) params.set('filter', thresholds.filter);
+    if (thresholds.similarity != null) params.set('similarity', thresholds.similarity);
+    try {
+        const response = await fetch(`/jobs/${window.currentJobId}/groups/${groupId}?${params}`);
+        const data = await response.json();
+        if (data.error) {
+            throw new Error(data.error);
+        }
+        const rows = data.pairs.map(pair => `
+            <tr>
+                <td>${pair.index1}</td>
+                <td>${pair.text1}</td>
+                <td>${pair.index2}</td>
+                <td>${pair.text2}</td>
+                <td class="${getSimilarityClass(pair.similarity)}">${pair.similarity}</td>
+                ${kind === 'initial' ? `<td>${pair.method}</td>` : ''}
+            </tr>
+        `).join('');
+        Swal.fire({
+            title: `第 ${groupId + 1} 组的文本对（${data.pairs.length} 对）`,
+            width: '80%',
+            html: `
+                <div class="table-responsive text-start">
+                    <table class="table table-sm table-hover">
+                        <thead>
+                            <tr>
+                                <th>行号1</th><th>文本1</th><th>行号2</th><th>文本2</th><th>相似度</th>
+                                ${kind === 'initial' ? '<th>方法</th>' : ''}
+                            </tr>
+                        </thead>
+                        <tbody>${rows}</tbody>
+                    </table>
+                </div>
+            `
+        });
+    } catch (error) {
+        Swal.fire({
+            icon: 'error',
+            title: '错误',
+            text: error.message
+        });
+    }
+}
+
+// 更新重复文本表格（最多显示前100组）
+function updateDuplicateTable(groups) {
+    const maxGroups = 100;
+    document.getElementById('duplicateResultsBody').innerHTML = groups.slice(0, maxGroups).map(group => `
         <tr>
-            <td>${pair.index1}</td>
-            <td>${pair.text1}</td>
-            <td>${pair.index2}</td>
-            <td>${pair.text2}</td>
-            <td class="${getSimilarityClass(pair.similarity)}">${pair.similarity}</td>
-            <td>${pair.distance.toFixed(4)}</td>
+            <td>${group.source ? `${group.source}: ` : ''}${group.rows.join(', ')}</td>
+            <td>${group.count}</td>
+            <td>${group.text}</td>
+            <td>${group.match_type === 'exact' ? '完全相同' : group.match_type === 'corpus' ? '与历史库重复' : '仅空白/标点不同'}</td>
         </tr>
     `).join('');
-    
-    // 更新分页按钮
-    document.getElementById('finalPagination').innerHTML = generatePagination(
-        currentFinalPage,
-        totalPages,
-        'setFinalPage'
-    );
-    
-    // 更新分页信息
-    document.getElementById('finalPageInfo').textContent = 
-        `显示 ${start + 1} 到 ${Math.min(end, filteredData.length)} 条，共 ${filteredData.length} 条`;
+    document.getElementById('duplicateInfo').textContent = groups.length > maxGroups
+        ? `共 ${groups.length} 组，仅显示前 ${maxGroups} 组，完整列表见下载的报告`
+        : `共 ${groups.length} 组`;
+    document.getElementById('duplicateResults').classList.toggle('d-none', groups.length === 0);
 }
 
 // 设置当前页码
@@ -229,45 +334,50 @@ function setFinalPage(page) {
     updateFinalTable();
 }
 
+// 显示任务结果（初筛结果与最终结果的相似文本分组、统计信息）
+function showResults(data) {
+    currentResult = data;
+    // 保存数据到全局变量
+    initialData = data.initial_groups || [];
+    finalData = data.final_groups;
+    
+    // 更新统计信息
+    updateStatistics(data);
+
+    // 显示初筛结果
+    document.getElementById('initialResults').classList.toggle('d-none', !data.initial_groups);
+    currentInitialPage = 1;
+    updateInitialTable();
+
+    // 显示最终结果
+    document.getElementById('finalResults').classList.remove('d-none');
+    currentFinalPage = 1;
+    updateFinalTable();
+}
+
 // 更新统计信息
 function updateStatistics(data) {
     // 更新数字统计
     document.getElementById('totalRecords').textContent = data.total_records;
-    document.getElementById('initialPairs').textContent = data.initial_pairs.length;
-    document.getElementById('finalPairs').textContent = data.final_pairs.length;
-    document.getElementById('highSimilarityPairs').textContent = 
-        data.final_pairs.filter(p => parseFloat(p.similarity) >= 0.9).length;
+    document.getElementById('initialPairs').textContent = data.initial_pair_count || 0;
+    document.getElementById('finalPairs').textContent = data.final_pair_count;
+    document.getElementById('finalGroups').textContent = data.final_groups.length;
+    document.getElementById('highSimilarityPairs').textContent = data.similarity_distribution['90-100%'];
     
     // 更新相似度分布图表
-    updateSimilarityChart(data.final_pairs);
+    updateSimilarityChart(data.similarity_distribution);
     
     // 更新方法分布图表
-    updateMethodChart(data.initial_pairs);
+    updateMethodChart(data.method_distribution || {});
     
     // 显示统计面板
     document.getElementById('statistics').classList.remove('d-none');
 }
 
-// 更新相似度分布图表
-function updateSimilarityChart(pairs) {
+// 更新相似度分布图表（分布由服务端按全部相似文本对统计）
+function updateSimilarityChart(distribution) {
     const ctx = document.getElementById('similarityChart').getContext('2d');
     
-    // 计算相似度分布
-    const distribution = {
-        '90-100%': 0,
-        '80-90%': 0,
-        '70-80%': 0,
-        '< 70%': 0
-    };
-    
-    pairs.forEach(pair => {
-        const similarity = parseFloat(pair.similarity);
-        if (similarity >= 0.9) distribution['90-100%']++;
-        else if (similarity >= 0.8) distribution['80-90%']++;
-        else if (similarity >= 0.7) distribution['70-80%']++;
-        else distribution['< 70%']++;
-    });
-    
     if (similarityChart) {
         similarityChart.destroy();
     }
@@ -299,21 +409,16 @@ function updateSimilarityChart(pairs) {
     });
 }
 
-// 更新方法分布图表
-function updateMethodChart(pairs) {
+// 更新方法分布图表（分布由服务端按全部初筛文本对统计）
+function updateMethodChart(methods) {
     const ctx = document.getElementById('methodChart').getContext('2d');
     
-    // 计算方法分布
     const distribution = {
-        'keyword': 0,
-        'tfidf': 0,
-        'edit_distance': 0
+        'keyword': methods.keyword || 0,
+        'tfidf': methods.tfidf || 0,
+        'edit_distance': methods.edit_distance || 0
     };
     
-    pairs.forEach(pair => {
-        distribution[pair.method]++;
-    });
-    
     if (methodChart) {
         methodChart.destroy();
     }
@@ -343,6 +448,70 @@ function updateMethodChart(pairs) {
     });
 }
 
+// 等待后台任务完成：优先使用SSE推送进度，不支持或连接中断时改为轮询
+function waitForJob(jobId) {
+    return new Promise((resolve, reject) => {
+        let pollTimer = null;
+
+        function handleStatus(status) {
+            updateProgress(status.progress, `${status.message} (${status.progress}%)`);
+            if (status.status === 'done') {
+                return true;
+            }
+            if (status.status === 'failed') {
+                reject(new Error(status.error || '处理文件时出错'));
+                return true;
+            }
+            return false;
+        }
+
+        async function fetchResult() {
+            const response = await fetch(`/jobs/${jobId}`);
+            const status = await response.json();
+            if (status.status === 'done') {
+                resolve(status.result);
+            } else if (status.status === 'failed') {
+                reject(new Error(status.error || '处理文件时出错'));
+            }
+            return status;
+        }
+
+        function startPolling() {
+            pollTimer = setInterval(async () => {
+                try {
+                    const status = await fetchResult();
+                    if (handleStatus(status)) {
+                        clearInterval(pollTimer);
+                    }
+                } catch (error) {
+                    clearInterval(pollTimer);
+                    reject(error);
+                }
+            }, 1000);
+        }
+
+        if (!window.EventSource) {
+            startPolling();
+            return;
+        }
+
+        const source = new EventSource(`/jobs/${jobId}/events`);
+        source.onmessage = function(event) {
+            const status = JSON.parse(event.data);
+            if (handleStatus(status)) {
+                source.close();
+                if (status.status === 'done') {
+                    fetchResult().catch(reject);
+                }
+            }
+        };
+        source.onerror = function() {
+            source.close();
+            startPolling();
+        };
+    });
+}
+
 // 处理表单提交
 document.getElementById('uploadForm').addEventListener('submit', async function(e) {
     e.preventDefault();
@@ -351,33 +520,35 @@ document.getElementById('uploadForm').addEventListener('submit', async function(
     const formData = new FormData(this);
 
     try {
-        const response = await fetch('/upload', {
+        updateProgress(0, '上传文件...');
+        // 增量模式与历史库比对，只有增量模式才会写入历史库；交叉比对上传多个文件
+        const endpoints = { incremental: '/incremental', crosscheck: '/crosscheck' };
+        const endpoint = endpoints[formData.get('mode')] || '/upload';
+        const response = await fetch(endpoint, {
             method: 'POST',
             body: formData
         });
 
-        const data = await response.json();
+        const job = await response.json();
 
-        if (data.error) {
-            throw new Error(data.error);
+        if (job.error) {
+            throw new Error(job.error);
         }
 
-        // 保存数据到全局变量
-        initialData = data.initial_pairs;
-        finalData = data.final_pairs;
-        
-        // 更新统计信息
-        updateStatistics(data);
+        const data = await waitForJob(job.job_id);
+        window.currentJobId = job.job_id;
+        // 下载报告时默认使用提交任务时的阈值，拖动滑块后改为调整后的阈值
+        window.currentThresholds = null;
+        showResults(data);
 
-        // 显示初筛结果
-        document.getElementById('initialResults').classList.remove('d-none');
-        currentInitialPage = 1;
-        updateInitialTable();
-
-        // 显示最终结果
-        document.getElementById('finalResults').classList.remove('d-none');
-        currentFinalPage = 1;
-        updateFinalTable();
+        // 显示重复文本（增量模式下包括与历史库重复的文本）
+        const corpusDuplicates = (data.corpus_duplicates || []).map(duplicate => ({
+            rows: duplicate.rows,
+            count: duplicate.rows.length,
+            text: `${duplicate.text}（历史库 ${duplicate.corpus_index}）`,
+            match_type: 'corpus'
+        }));
+        updateDuplicateTable((data.duplicate_groups || []).concat(corpusDuplicates));
 
     } catch (error) {
         Swal.fire({
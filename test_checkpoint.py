@@ -0,0 +1,99 @@
+import threading
+import time
+
+import pytest
+
+from checkpoint import CheckpointStore, run_stage
+from excel_reader import IngestResult
+
+
+@pytest.fixture
+def store(tmp_path):
+    return CheckpointStore(str(tmp_path / 'checkpoints'))
+
+
+def _pairs():
+    return [
+        {'text1': '甲', 'text2': '乙', 'index1': 1, 'index2': 2, 'similarity': 0.9, 'method': 'tfidf'},
+        {'text1': '甲', 'text2': '丙', 'index1': 1, 'index2': 5, 'similarity': 0.4, 'method': 'keyword'},
+    ]
+
+
+def test_completed_stage_is_reused(store):
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return _pairs()
+
+    checkpoint = store.open('job')
+    assert run_stage(checkpoint, 'prefilter', {'threshold': 0.3}, compute) == _pairs()
+    assert run_stage(store.open('job'), 'prefilter', {'threshold': 0.3}, compute) == _pairs()
+    assert len(calls) == 1
+
+
+def test_ingest_round_trip(store):
+    ingested = IngestResult()
+    for row, text in enumerate(['甲', '乙', '甲']):
+        ingested.add(row, text)
+    run_stage(store.open('job'), 'ingest', {'column': 'text'}, lambda: ingested)
+    loaded = store.open('job').load('ingest')
+    assert loaded.total_rows == ingested.total_rows
+    assert loaded.rows_by_text == ingested.rows_by_text
+
+
+def test_changed_params_discard_later_stages(store):
+    checkpoint = store.open('job')
+    run_stage(checkpoint, 'prefilter', {'threshold': 0.3}, _pairs)
+    run_stage(checkpoint, 'embedding', {'model': 'm'}, lambda: {'甲': [1.0, 0.0]})
+    run_stage(checkpoint, 'prefilter', {'threshold': 0.5}, _pairs)
+    assert not checkpoint.is_complete('embedding', {'model': 'm'})
+    assert checkpoint.committed_embeddings() == {}
+
+
+def test_committed_embeddings_survive_a_failed_run(store):
+    checkpoint = store.open('job')
+    checkpoint.start('embedding', {'model': 'm'})
+    checkpoint.commit_embeddings(['甲'], [[1.0, 0.0]])
+    checkpoint.start('embedding', {'model': 'm'})
+    assert checkpoint.committed_embeddings() == {'甲': [1.0, 0.0]}
+
+
+def test_complete_tolerates_discarded_stage(store):
+    checkpoint = store.open('job')
+    checkpoint.start('embedding', {'model': 'm'})
+    # 另一个任务以不同参数重新开始了更早的阶段
+    store.open('job').start('prefilter', {'threshold': 0.5})
+    checkpoint.complete('embedding')
+    assert 'embedding' not in checkpoint.manifest()['stages']
+
+
+def test_exclusive_serializes_jobs_on_the_same_key(store):
+    order = []
+    entered = threading.Event()
+
+    def first():
+        with store.open('job').exclusive():
+            entered.set()
+            time.sleep(0.2)
+            order.append('first')
+
+    thread = threading.Thread(target=first)
+    thread.start()
+    entered.wait()
+    waited = []
+    with store.open('job').exclusive(on_wait=lambda: waited.append(True)):
+        order.append('second')
+    thread.join()
+    assert order == ['first', 'second']
+    assert waited == [True]
+    with store.open('other').exclusive(on_wait=lambda: waited.append(False)):
+        pass
+    assert waited == [True]
+
+
+def test_sweep_skips_checkpoints_in_use(store):
+    run_stage(store.open('old'), 'prefilter', {}, _pairs)
+    with store.open('old').exclusive():
+        assert store.sweep(ttl=-1) == 0
+    assert store.sweep(ttl=-1) == 1
@@ -0,0 +1,41 @@
+from clustering import UnionFind, cluster_pairs
+
+
+def test_union_find_merges_components():
+    union_find = UnionFind()
+    union_find.union(1, 2)
+    union_find.union(3, 4)
+    union_find.union(2, 4)
+    assert union_find.find(1) == union_find.find(3)
+    assert union_find.find(5) != union_find.find(1)
+
+
+def test_groups_are_ordered_and_medoid_first():
+    groups = cluster_pairs([(1, 2, 0.9), (2, 3, 0.8), (1, 3, 0.95), (4, 5, 0.99)])
+    assert [len(group['members']) for group in groups] == [3, 2]
+    first = groups[0]
+    # 1 与其他成员的相似度之和最大
+    assert first['medoid'] == 1
+    assert first['members'] == [(1, 1.0), (3, 0.95), (2, 0.9)]
+    assert sorted(first['edges']) == [0, 1, 2]
+    assert groups[1]['edges'] == [3]
+
+
+def test_indirect_members_use_widest_path():
+    groups = cluster_pairs([(1, 2, 0.9), (2, 3, 0.8), (3, 4, 0.7)])
+    members = dict(groups[0]['members'])
+    medoid = groups[0]['medoid']
+    assert medoid in (2, 3)
+    assert members[medoid] == 1.0
+    # 1 到 4 之间的路径上最低的相似度为 0.7
+    assert min(members.values()) == 0.7
+
+
+def test_repeated_pair_keeps_highest_similarity():
+    groups = cluster_pairs([('a', 'b', 0.5), ('b', 'a', 0.9)])
+    assert dict(groups[0]['members'])['b' if groups[0]['medoid'] == 'a' else 'a'] == 0.9
+    assert groups[0]['edges'] == [0, 1]
+
+
+def test_no_edges():
+    assert cluster_pairs([]) == []
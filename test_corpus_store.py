@@ -0,0 +1,52 @@
+import pytest
+
+from corpus_store import CorpusStore
+from text_filter import TextFilter, text_fingerprint
+
+_TOKENS = [f"词{k}" for k in range(40)]
+
+
+def _entry(row, words):
+    return row, ''.join(words), tuple(words)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = CorpusStore(str(tmp_path / 'corpus.db'))
+    store.add([_entry(1, _TOKENS[:10]), _entry(2, _TOKENS[20:30])], model_name='model',
+              vectors={''.join(_TOKENS[:10]): [1.0, 0.0]}, source='历史.xlsx')
+    yield store
+    store.close()
+
+
+def test_add_skips_known_fingerprints(store):
+    text = ''.join(_TOKENS[:10])
+    assert store.add([(3, f" {text}！", tuple(_TOKENS[:10]))]) == {}
+    assert store.count() == 2
+    found = store.find_fingerprints([text_fingerprint(f"{text}。")])
+    assert found == {text_fingerprint(text): {'id': 1, 'text': text, 'source': '历史.xlsx', 'row': 1}}
+
+
+def test_vectors_are_stored_per_model(store):
+    assert store.get_vectors('model', [1]) == {1: [1.0, 0.0]}
+    assert store.get_vectors('other', [1]) == {}
+    store.put_vectors('other', {2: [0.0, 1.0]})
+    assert store.get_vectors('other', [2]) == {2: [0.0, 1.0]}
+
+
+def test_token_and_lsh_candidates_find_near_duplicates(store):
+    near = set(_TOKENS[:9]) | {'新词'}
+    unrelated = {'甲', '乙', '丙'}
+    token_sets = [near, unrelated]
+    lengths = [len(''.join(sorted(near))), 3]
+    assert store.token_candidates(token_sets) == [(0, 1)]
+    assert store.lsh_candidates(token_sets, lengths) == [(0, 1)]
+    assert store.get_texts([1])[1]['tokens'] == tuple(_TOKENS[:10])
+
+
+def test_changed_lsh_params_rebuild_buckets(store, tmp_path):
+    store.close()
+    reopened = CorpusStore(str(tmp_path / 'corpus.db'), text_filter=TextFilter(num_bands=40, rows_per_band=2))
+    near = set(_TOKENS[:9]) | {'新词'}
+    assert reopened.lsh_candidates([near], [len(''.join(near))]) == [(0, 1)]
+    reopened.close()
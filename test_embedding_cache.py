@@ -0,0 +1,46 @@
+import time
+
+import pytest
+
+from embedding_cache import EmbeddingCache, normalize_text
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / 'embeddings.db'), max_entries=3)
+    yield cache
+    cache.close()
+
+
+def test_normalized_texts_share_an_entry(cache):
+    assert normalize_text('  机器学习\t１２３  ') == '机器学习 123'
+    cache.put_many('model', 2, ['机器学习１２３'], [[0.5, 0.25]])
+    assert cache.get_many('model', 2, ['机器学习123', ' 机器学习１２３ ']) == {
+        '机器学习123': [0.5, 0.25], ' 机器学习１２３ ': [0.5, 0.25]
+    }
+
+
+def test_model_and_dim_are_part_of_the_key(cache):
+    cache.put_many('model', 2, ['文本'], [[1.0, 0.0]])
+    assert cache.get_many('other', 2, ['文本']) == {}
+    assert cache.get_many('model', 3, ['文本']) == {}
+    assert cache.stats()['misses'] == 2
+
+
+def test_least_recently_used_entries_are_evicted(cache):
+    cache.put_many('model', 1, ['a', 'b', 'c'], [[1.0], [2.0], [3.0]])
+    time.sleep(0.01)
+    cache.get_many('model', 1, ['a'])
+    time.sleep(0.01)
+    cache.put_many('model', 1, ['d'], [[4.0]])
+    assert set(cache.get_many('model', 1, ['a', 'b', 'c', 'd'])) == {'a', 'c', 'd'}
+
+
+def test_reopen_keeps_entries(tmp_path):
+    path = str(tmp_path / 'embeddings.db')
+    cache = EmbeddingCache(path)
+    cache.put_many('model', 2, ['文本'], [[0.5, 0.5]])
+    cache.close()
+    reopened = EmbeddingCache(path)
+    assert reopened.get_many('model', 2, ['文本']) == {'文本': [0.5, 0.5]}
+    reopened.close()
@@ -0,0 +1,76 @@
+import threading
+
+import pytest
+
+from embedding_scheduler import EmbeddingScheduler, TokenBucket, estimate_tokens
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+    def __init__(self, retry_after):
+        super().__init__('rate limited')
+        self.response = type('Response', (), {'headers': {'retry-after': str(retry_after)}})()
+
+
+def test_estimate_tokens():
+    assert estimate_tokens('机器学习') == 5
+    assert estimate_tokens('abcdefgh') == 3
+
+
+def test_batches_respect_item_and_token_limits():
+    scheduler = EmbeddingScheduler(lambda batch: batch, max_batch_items=3, max_batch_tokens=12)
+    texts = ['甲乙丙丁戊', '甲乙', '甲', '甲', '甲乙丙丁戊己庚辛壬癸子丑']
+    batches = scheduler.make_batches(texts)
+    assert [start for start, _ in batches] == [0, 3, 4]
+    assert [text for _, batch in batches for text in batch] == texts
+    for _, batch in batches[:-1]:
+        assert len(batch) <= 3 and sum(map(estimate_tokens, batch)) <= 12
+
+
+def test_run_keeps_input_order_and_reports_batches():
+    completed = []
+    lock = threading.Lock()
+
+    def on_batch(batch, embeddings):
+        with lock:
+            completed.extend(batch)
+
+    scheduler = EmbeddingScheduler(lambda batch: [[float(len(text))] for text in batch],
+                                   max_batch_items=2, max_workers=3, requests_per_second=1000)
+    texts = ['a' * n for n in range(1, 10)]
+    assert scheduler.run(texts, batch_callback=on_batch) == [[float(n)] for n in range(1, 10)]
+    assert sorted(completed) == sorted(texts)
+
+
+def test_rate_limited_batches_are_retried():
+    calls = []
+
+    def embed(batch):
+        calls.append(batch)
+        if len(calls) == 1:
+            raise RateLimitError(0.01)
+        return [[1.0] for _ in batch]
+
+    scheduler = EmbeddingScheduler(embed, requests_per_second=1000)
+    assert scheduler.run(['文本']) == [[1.0]]
+    assert scheduler.rate_limit_hits == 1
+    assert scheduler.rate_limiter.rate < 1000
+
+
+def test_other_errors_are_raised_after_retries(monkeypatch):
+    monkeypatch.setattr('embedding_scheduler.time.sleep', lambda seconds: None)
+
+    def embed(batch):
+        raise ValueError('boom')
+
+    with pytest.raises(ValueError):
+        EmbeddingScheduler(embed, requests_per_second=1000, max_retries=2).run(['文本'])
+
+
+def test_token_bucket_penalize_and_reward():
+    bucket = TokenBucket(8)
+    bucket.penalize(retry_after=0)
+    assert bucket.rate == 4
+    bucket.reward()
+    assert bucket.rate == pytest.approx(4.4)
@@ -0,0 +1,55 @@
+import csv
+
+import pytest
+from openpyxl import Workbook
+
+from excel_reader import IngestResult, read_text_column
+
+
+def _ingest(texts):
+    ingested = IngestResult()
+    for row, text in enumerate(texts):
+        ingested.add(row, text)
+    return ingested
+
+
+def test_fingerprint_groups_merge_normalized_duplicates():
+    ingested = _ingest(['机器学习，很重要', '机器学习 很重要！', 'ＡＢＣ', 'abc', 'abc', '独立文本'])
+    groups = {group['representative'][1]: group for group in ingested.duplicate_groups()}
+    assert groups['机器学习，很重要']['rows'] == [0, 1]
+    assert groups['机器学习，很重要']['match_type'] == 'normalized'
+    assert groups['ＡＢＣ']['rows'] == [2, 3, 4]
+    assert [text for _, text in ingested.representatives()] == ['机器学习，很重要', 'ＡＢＣ', '独立文本']
+
+
+def test_exact_duplicates_keep_exact_match_type():
+    groups = _ingest(['同一句话', '其他', '同一句话']).duplicate_groups()
+    assert [(group['rows'], group['match_type']) for group in groups] == [([0, 2], 'exact')]
+
+
+def test_blank_cells_and_symbol_only_texts_are_not_grouped():
+    ingested = _ingest(['nan', 'nan', '   ', '!!!', '???', '正文'])
+    assert ingested.duplicate_groups() == []
+    assert [text for _, text in ingested.representatives()] == ['!!!', '???', '正文']
+    assert ingested.total_rows == 6
+
+
+@pytest.mark.parametrize('extension', ['xlsx', 'csv'])
+def test_read_text_column(tmp_path, extension):
+    rows = [['id', 'text'], [1, '第一行'], [2, None], [3, '第一行'], [4, '第三行']]
+    path = tmp_path / f'input.{extension}'
+    if extension == 'xlsx':
+        workbook = Workbook()
+        for row in rows:
+            workbook.active.append(row)
+        workbook.save(path)
+    else:
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            csv.writer(f).writerows(['' if value is None else value for value in row] for row in rows)
+    ingested = read_text_column(str(path), 'text', chunk_size=2)
+    assert ingested.total_rows == 4
+    # 行号从1开始（不含表头）
+    assert ingested.rows_by_text['第一行'] == [1, 3]
+    assert [text for _, text in ingested.representatives()] == ['第一行', '第三行']
+    with pytest.raises(ValueError):
+        read_text_column(str(path), 'missing')
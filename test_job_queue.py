@@ -0,0 +1,51 @@
+import pytest
+
+from job_queue import Job, JobQueue
+
+
+def _wait(job):
+    version = job.version
+    while not job.finished:
+        version = job.wait_for_change(version, timeout=5)
+    return job
+
+
+def test_job_result_and_progress():
+    queue = JobQueue(max_workers=1)
+
+    def work(job, value):
+        job.update('prefilter', 50)
+        return value * 2
+
+    job = _wait(queue.submit(work, 21))
+    assert queue.get(job.id) is job
+    assert job.to_dict(include_result=True)['result'] == 42
+    assert job.to_dict()['progress'] == 100.0
+
+
+def test_failed_job_reports_error():
+    queue = JobQueue(max_workers=1)
+
+    def work(job):
+        raise RuntimeError('出错了')
+
+    job = _wait(queue.submit(work))
+    assert job.status == 'failed'
+    assert job.to_dict()['error'] == '出错了'
+
+
+def test_progress_is_mapped_to_stage_ranges_and_never_decreases():
+    job = Job('j')
+    job.update('prefilter', 50)
+    assert job.progress == pytest.approx(27.5)
+    job.update('ingest', 100)
+    assert job.progress == pytest.approx(27.5)
+    assert job.message == '读取文件'
+
+
+def test_finished_jobs_are_purged_after_retention():
+    queue = JobQueue(max_workers=1, retention=0)
+    job = _wait(queue.submit(lambda job: None))
+    job.finished_at -= 1
+    queue.submit(lambda job: None)
+    assert queue.get(job.id) is None
@@ -0,0 +1,43 @@
+import pathlib
+import re
+
+from metrics import MetricsRegistry, _HELP
+
+
+def test_items_are_counted_per_metric():
+    registry = MetricsRegistry()
+    registry.observe('stage_seconds', 0.5, 10, stage='tokenize')
+    registry.observe('milvus_request_seconds', 0.1, 3, op='search')
+    text = registry.render()
+    assert 'textcheck_stage_items_total{stage="tokenize"} 10' in text
+    assert 'textcheck_milvus_request_items_total{op="search"} 3' in text
+    assert 'stage_items_total{op=' not in text
+
+
+def test_job_scope_collects_only_its_own_metrics():
+    registry = MetricsRegistry()
+    registry.inc('jobs_total')
+    with registry.job_scope() as job:
+        registry.inc('cache_hits_total', 2, cache='token')
+        with registry.timer(stage='jieba', items=5):
+            pass
+    registry.inc('cache_hits_total', cache='token')
+    summary = job.to_dict()
+    assert summary['counters'] == {'cache_hits_total': {'token': 2}}
+    assert summary['timers']['stage_seconds']['jieba']['items'] == 5
+    assert 'textcheck_cache_hits_total{cache="token"} 3' in registry.render()
+
+
+def test_every_metric_has_help():
+    used = set()
+    for path in pathlib.Path(__file__).parent.glob('*.py'):
+        if path.name.startswith('test_'):
+            continue
+        source = path.read_text(encoding='utf-8')
+        used.update(re.findall(r"metrics\.(?:inc|observe|timer)\(\s*'(\w+)'", source))
+        if re.search(r"metrics\.timer\(\s*(?:stage|items)=", source):
+            used.add('stage_seconds')
+    used.update(f"{metric[:-len('_seconds')]}_items_total" for metric in list(used) if metric.endswith('_seconds'))
+    # job_seconds 不带条目数
+    used.discard('job_items_total')
+    assert used - set(_HELP) == set()
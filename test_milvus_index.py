@@ -0,0 +1,38 @@
+import pytest
+
+from milvus_index import choose_index, ivf_nlist, normalize_index, same_index, search_params_for
+
+
+def test_index_type_follows_collection_size():
+    assert choose_index(0)['index_type'] == 'FLAT'
+    assert choose_index(10000) == {'metric_type': 'IP', 'index_type': 'IVF_FLAT', 'params': {'nlist': 400}}
+    assert choose_index(10 ** 6)['index_type'] == 'HNSW'
+    assert ivf_nlist(1) == 16
+    assert ivf_nlist(10 ** 12) == 65536
+
+
+def test_search_params():
+    ivf = choose_index(250000)
+    assert search_params_for(ivf, 0.95) == {'metric_type': 'IP', 'params': {'nprobe': 100}}
+    assert search_params_for(choose_index(10 ** 6), 0.95, top_k=1000)['params'] == {'ef': 1000}
+    assert search_params_for(choose_index(10), 0.99)['params'] == {}
+
+
+@pytest.mark.parametrize('described', [
+    {'index_type': 'IVF_FLAT', 'metric_type': 'IP', 'params': {'nlist': 400}},
+    {'index_type': 'IVF_FLAT', 'metric_type': 'IP', 'params': '{"nlist": 400}'},
+    {'index_type': 'IVF_FLAT', 'metric_type': 'IP', 'params': {'nlist': '400'}},
+    {'index_type': 'IVF_FLAT', 'metric_type': 'IP', 'nlist': '400', 'field_name': 'embedding'},
+])
+def test_normalize_describe_index_output(described):
+    assert normalize_index(described) == choose_index(10000)
+
+
+def test_same_index_rebuilds_on_type_metric_or_nlist_drift():
+    current = choose_index(10000)
+    assert same_index(current, choose_index(30000))        # nlist 400 vs 693
+    assert not same_index(current, choose_index(50000))    # nlist 400 vs 894
+    assert not same_index(current, choose_index(10 ** 6))
+    assert not same_index({**current, 'metric_type': 'L2'}, choose_index(10000))
+    assert not same_index(None, choose_index(0))
+    assert same_index(choose_index(0), choose_index(9999))
@@ -0,0 +1,91 @@
+import random
+from itertools import combinations
+
+import numpy as np
+import pytest
+
+from result_store import PairResults, ResultStore
+
+FLOORS = {'filter': 0.2, 'similarity': 0.5}
+
+
+def _pipeline(num_texts=40, seed=0):
+    """模拟按下限阈值运行的整表查重：初筛文本对与通过初筛的文本之间的全部向量相似度"""
+    rng = random.Random(seed)
+    texts = [(row, f"文本{row}") for row in range(num_texts)]
+    candidates = []
+    for (row1, text1), (row2, text2) in combinations(texts, 2):
+        if rng.random() < 0.1:
+            candidates.append({'text1': text1, 'text2': text2, 'index1': row1, 'index2': row2,
+                               'similarity': round(rng.uniform(FLOORS['filter'], 1), 3),
+                               'method': rng.choice(['keyword', 'tfidf', 'edit_distance'])})
+    similarity = {pair: round(rng.uniform(0, 1), 3) for pair in combinations(range(num_texts), 2)}
+    return texts, candidates, similarity
+
+
+def _rerun(texts, candidates, similarity, filter_threshold, similarity_threshold):
+    """按给定阈值重新运行：向量阶段只比较初筛保留的文本"""
+    kept = [pair for pair in candidates if pair['similarity'] >= filter_threshold]
+    rows = sorted({pair['index1'] for pair in kept} | {pair['index2'] for pair in kept})
+    pairs = [
+        {'text1': texts[i][1], 'text2': texts[j][1], 'index1': i, 'index2': j,
+         'similarity': similarity[(i, j)], 'distance': 1 - similarity[(i, j)]}
+        for i, j in combinations(rows, 2) if similarity[(i, j)] >= similarity_threshold
+    ]
+    return kept, pairs
+
+
+def _keys(pairs):
+    return sorted((pair['index1'], pair['index2']) for pair in pairs)
+
+
+@pytest.fixture
+def results():
+    texts, candidates, similarity = _pipeline()
+    _, pairs = _rerun(texts, candidates, similarity, FLOORS['filter'], FLOORS['similarity'])
+    return texts, candidates, similarity, PairResults.from_pairs(
+        pairs, candidates=candidates, thresholds={'filter': 0.4, 'similarity': 0.8}, floors=FLOORS
+    )
+
+
+@pytest.mark.parametrize('filter_threshold,similarity_threshold', [
+    (None, None), (0.2, 0.5), (0.3, 0.6), (0.6, 0.7), (0.9, 0.95), (0.1, 0.3)
+])
+def test_rethresholding_matches_rerun(results, filter_threshold, similarity_threshold):
+    texts, candidates, similarity, stored = results
+    candidate_indices, pair_indices, used = stored.select(filter_threshold, similarity_threshold)
+    expected_filter = max(0.4 if filter_threshold is None else filter_threshold, FLOORS['filter'])
+    expected_similarity = max(0.8 if similarity_threshold is None else similarity_threshold, FLOORS['similarity'])
+    assert used == {'filter': expected_filter, 'similarity': expected_similarity}
+    kept, pairs = _rerun(texts, candidates, similarity, expected_filter, expected_similarity)
+    assert _keys(stored.candidate(k) for k in candidate_indices) == _keys(kept)
+    assert _keys(stored.pair(k) for k in pair_indices) == _keys(pairs)
+
+
+def test_groups_partition_selected_pairs(results):
+    stored = results[3]
+    _, pair_indices, _ = stored.select()
+    groups = stored.groups(pair_indices)
+    assert sorted(k for group in groups for k in group['edges']) == pair_indices.tolist()
+    members = [text_id for group in groups for text_id, _ in group['members']]
+    assert len(members) == len(set(members))
+
+
+def test_save_and_load(results, tmp_path):
+    stored = results[3]
+    store = ResultStore(str(tmp_path), max_cached=0)
+    store.save('job', stored)
+    loaded = store.get()
+    assert loaded is not stored
+    assert loaded.thresholds == stored.thresholds and loaded.floors == stored.floors
+    assert [loaded.pair(k) for k in range(len(loaded))] == [stored.pair(k) for k in range(len(stored))]
+    assert np.array_equal(loaded.candidates['score'], stored.candidates['score'])
+    assert store.get('missing') is None
+
+
+def test_count_and_csv(results):
+    stored = results[3]
+    assert stored.count(0.9) == int(np.sum(stored.similarity >= 0.9))
+    content = ''.join(stored.iter_csv(chunk_rows=3))
+    assert content.startswith('\ufeff' + ','.join(stored.columns))
+    assert len(content.strip().splitlines()) == 1 + len(stored.select()[1])
@@ -0,0 +1,112 @@
+import random
+
+import pytest
+
+from text_filter import TextFilter, lsh_candidate_probability, lsh_params_for
+from tokenizer import shutdown_process_pools
+
+_SENTENCES = [
+    "机器学习是人工智能的一个重要分支",
+    "深度学习是机器学习的一种常用方法",
+    "自然语言处理是人工智能的重要应用",
+    "计算机视觉在医疗影像分析中应用广泛",
+    "强化学习在游戏人工智能中表现出色",
+    "Python是一门广泛使用的编程语言",
+    "今天的天气非常好适合出去散步",
+    "请在下周一之前提交项目的进度报告",
+]
+_VARIANTS = ["{}", "{}。", "我认为{}", "{}，这是共识", "据说{}"]
+
+
+def _corpus():
+    """固定的小语料：每个句子若干种改写，加上一条空文本和一条纯符号文本"""
+    texts = [variant.format(sentence) for sentence in _SENTENCES for variant in _VARIANTS]
+    texts += ["", "！！！"]
+    return list(enumerate(texts))
+
+
+def _pair_keys(pairs):
+    return sorted((p['index1'], p['index2'], round(p['similarity'], 9), p['method']) for p in pairs)
+
+
+@pytest.fixture(scope='module')
+def text_filter():
+    yield TextFilter()
+    shutdown_process_pools()
+
+
+def _pairs_with_jaccard(count, size, overlap, seed=0):
+    """生成 count 对分词集合，每对大小均为 size、共同词 overlap 个，其余文本之间没有共同词"""
+    rng = random.Random(seed)
+    texts, text_words, pairs = [], {}, []
+    vocab = iter(range(10 ** 9))
+    for _ in range(count):
+        shared = {f"w{next(vocab)}" for _ in range(overlap)}
+        for _ in range(2):
+            words = shared | {f"w{next(vocab)}" for _ in range(size - overlap)}
+            text_words[len(texts)] = words
+            texts.append((len(texts), "x" * size))
+        pairs.append((len(texts) - 2, len(texts) - 1))
+    rng.shuffle(texts)
+    position = {idx: pos for pos, (idx, _) in enumerate(texts)}
+    return texts, text_words, [tuple(sorted((position[a], position[b]))) for a, b in pairs]
+
+
+@pytest.mark.parametrize('threshold', [0.2, 0.3, 0.5, 0.8])
+def test_lsh_params_meet_target_recall(threshold):
+    num_bands, rows_per_band = lsh_params_for(threshold)
+    assert num_bands * rows_per_band <= 256
+    assert lsh_candidate_probability(0.8 * threshold, num_bands, rows_per_band) >= 0.95
+
+
+def test_lsh_recall_near_threshold():
+    # 20 个词共同 8 个：Jaccard = 8/32 = 0.25，低于阈值 0.3（只靠TF-IDF超过阈值的文本对）
+    texts, text_words, pairs = _pairs_with_jaccard(300, 20, 8)
+    candidates = set(TextFilter().lsh_candidates(texts, text_words, threshold=0.3))
+    recall = len(candidates.intersection(pairs)) / len(pairs)
+    assert recall >= 0.9
+
+
+def test_explicit_lsh_params_are_kept():
+    text_filter = TextFilter(num_bands=20, rows_per_band=5)
+    assert text_filter.lsh_params(0.3) == (20, 5)
+    assert TextFilter().lsh_params(0.8) == lsh_params_for(0.8)
+    with pytest.raises(ValueError):
+        TextFilter(num_bands=20)
+
+
+@pytest.mark.parametrize('tfidf_mode', ['pair', 'corpus'])
+@pytest.mark.parametrize('candidate_mode', ['exhaustive', 'lsh', 'inverted'])
+def test_parallel_matches_serial(text_filter, candidate_mode, tfidf_mode):
+    texts = _corpus()
+    serial = text_filter.batch_process(texts, 0.3, candidate_mode, tfidf_mode)
+    parallel = text_filter.batch_process(texts, 0.3, candidate_mode, tfidf_mode, workers=2, block_size=8)
+    assert serial
+    assert _pair_keys(parallel) == _pair_keys(serial)
+
+
+def test_parallel_matches_serial_with_groups(text_filter):
+    texts = _corpus()
+    groups = [0 if pos < 20 else 1 for pos in range(len(texts))]
+    kwargs = dict(groups=groups, compare=[(0, 1), (1, 1)])
+    serial = text_filter.batch_process(texts, 0.3, 'exhaustive', 'corpus', **kwargs)
+    parallel = text_filter.batch_process(texts, 0.3, 'exhaustive', 'corpus', workers=2, block_size=8, **kwargs)
+    assert all(groups[p['index1']] == 1 or groups[p['index2']] == 1 for p in serial)
+    assert _pair_keys(parallel) == _pair_keys(serial)
+
+
+def test_inverted_matches_exhaustive(text_filter):
+    # 打分前要求共同词 >= 2，倒排索引只跳过超高频词，在小语料上两种方式结果相同
+    texts = _corpus()
+    exhaustive = text_filter.batch_process(texts, 0.3, 'exhaustive', 'corpus')
+    inverted = text_filter.batch_process(texts, 0.3, 'inverted', 'corpus')
+    assert _pair_keys(inverted) == _pair_keys(exhaustive)
+
+
+def test_scoring_pool_is_reused(text_filter):
+    import tokenizer
+    texts = _corpus()
+    text_filter.batch_process(texts, 0.3, 'inverted', 'corpus', workers=2, block_size=8)
+    executor = tokenizer._pools['score'][0]
+    text_filter.batch_process(texts, 0.5, 'lsh', 'pair', workers=2, block_size=8)
+    assert tokenizer._pools['score'][0] is executor
@@ -0,0 +1,34 @@
+import pytest
+
+import tokenizer
+from tokenizer import Tokenizer, shared_process_pool, shutdown_process_pools
+
+
+@pytest.fixture
+def parallel_tokenizer(tmp_path):
+    yield Tokenizer(cache_path=str(tmp_path / 'tokens.db'), parallel_threshold=1, workers=2)
+    shutdown_process_pools()
+
+
+def test_parallel_segmentation_matches_serial(parallel_tokenizer):
+    texts = [f"第{i}条：机器学习是人工智能的一个重要分支" for i in range(2500)]
+    expected = Tokenizer(parallel_threshold=len(texts) + 1).tokenize_many(texts)
+    assert parallel_tokenizer.tokenize_many(texts) == expected
+
+
+def test_segment_pool_is_reused(parallel_tokenizer):
+    parallel_tokenizer.tokenize_many([f"第{i}条文本" for i in range(1500)])
+    executor = tokenizer._pools['segment'][0]
+    # 1500 条文本只有2个分块，工作进程按需启动
+    assert len(executor._processes) <= 2
+    parallel_tokenizer.tokenize_many([f"另一批第{i}条文本" for i in range(1500)])
+    assert tokenizer._pools['segment'][0] is executor
+    assert shared_process_pool('segment', 1) is executor
+
+
+def test_cache_round_trip(tmp_path):
+    path = str(tmp_path / 'tokens.db')
+    tokens = Tokenizer(cache_path=path).tokenize("机器学习是人工智能的一个重要分支")
+    reloaded = Tokenizer(cache_path=path)
+    assert reloaded.tokenize("机器学习是人工智能的一个重要分支") == tokens
+    assert reloaded.stats()['hits'] == 1
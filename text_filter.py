@@ -1,19 +1,164 @@
 import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
 from Levenshtein import distance as levenshtein_distance
-import jieba
+import hashlib
+import math
+import re
+import threading
+import time
+import unicodedata
+import uuid
+import zlib
+from bisect import bisect_right
+from collections import OrderedDict
+from concurrent.futures import as_completed, wait
+from multiprocessing import shared_memory
+from tokenizer import Tokenizer, shared_process_pool
+from metrics import metrics
+
+# MinHash 使用的梅森素数 2^31-1，保证 a*x+b 在 uint64 范围内不溢出
+_MERSENNE_PRIME = np.uint64((1 << 31) - 1)
+
+# 未指定LSH分桶参数时按该阈值推导（与 batch_process 的默认阈值一致）
+DEFAULT_LSH_THRESHOLD = 0.3
+# 关键词（Jaccard）相似度为 LSH_SIMILARITY_MARGIN * 阈值的文本对成为候选对的最低概率
+LSH_TARGET_RECALL = 0.95
+# TF-IDF/编辑距离超过阈值的文本对关键词相似度可能低于阈值，按阈值的该比例设计分桶参数
+LSH_SIMILARITY_MARGIN = 0.8
+# MinHash 签名长度上限（bands * rows），签名计算耗时与之成正比
+LSH_MAX_PERM = 256
+
+
+def lsh_params_for(threshold, target_recall=LSH_TARGET_RECALL, max_perm=LSH_MAX_PERM):
+    """按阈值推导LSH分桶参数，返回 (num_bands, rows_per_band)
+
+    Jaccard 相似度为 s 的文本对成为候选对的概率为 1-(1-s^rows)^bands（见 lsh_candidate_probability）。
+    对每个 rows 取使 s = LSH_SIMILARITY_MARGIN * threshold 时概率 >= target_recall 的最少 bands，
+    在签名长度不超过 max_perm 的前提下选 rows 最大的一组（S曲线最陡，低相似度的候选对最少）。
+    关键词相似度更低（只靠TF-IDF或编辑距离超过阈值）的文本对召回率随之下降。
+    """
+    similarity = min(max(threshold * LSH_SIMILARITY_MARGIN, 0.01), 0.99)
+    best = (1, max_perm)
+    for rows in range(1, max_perm + 1):
+        hit = similarity ** rows
+        bands = math.ceil(math.log(1 - target_recall) / math.log(1 - hit))
+        if bands * rows > max_perm:
+            break
+        best = (bands, rows)
+    return best
+
+
+def lsh_candidate_probability(similarity, num_bands, rows_per_band):
+    """Jaccard 相似度为 similarity 的文本对至少在一个band上落入同一个桶的概率"""
+    return 1 - (1 - similarity ** rows_per_band) ** num_bands
+
+# 指纹计算时忽略的字符：空白、标点及下划线
+_IGNORED_CHARS_RE = re.compile(r'[\W_]+')
+
+def text_fingerprint(text):
+    """规范化文本指纹：全角转半角、忽略大小写、空白和标点，用于识别完全重复的文本"""
+    text = unicodedata.normalize('NFKC', text)
+    normalized = _IGNORED_CHARS_RE.sub('', text.lower())
+    # 只由标点/符号组成的文本规范化后为空，改用原文，否则 '!!!' 与 '???' 会被视为重复
+    return hashlib.sha1((normalized or text).encode('utf-8')).hexdigest()
+
+class InvertedTokenIndex:
+    """分词倒排索引：token -> 文本位置列表，用于直接统计文本对的共同词数量"""
+
+    def __init__(self, min_overlap=2, max_df_ratio=0.05, min_posting_cap=1000):
+        # 出现次数超过 max(min_posting_cap, max_df_ratio * 文本数) 的高频词视为停用词丢弃
+        self.min_overlap = min_overlap
+        self.max_df_ratio = max_df_ratio
+        self.min_posting_cap = min_posting_cap
+        self.postings = {}
+        self.token_sets = []
+        self.dropped_tokens = 0
+        self.skipped_postings = 0
+
+    def build(self, token_sets):
+        """根据每条文本的分词集合建立倒排索引"""
+        self.token_sets = [set(words) for words in token_sets]
+        postings = {}
+        for pos, words in enumerate(self.token_sets):
+            for word in words:
+                postings.setdefault(word, []).append(pos)
+        
+        posting_cap = max(self.min_posting_cap, int(self.max_df_ratio * len(self.token_sets)))
+        self.postings = {}
+        self.dropped_tokens = 0
+        self.skipped_postings = 0
+        for word, positions in postings.items():
+            if len(positions) > posting_cap:
+                self.dropped_tokens += 1
+                self.skipped_postings += len(positions)
+                continue
+            self.postings[word] = positions
+        return self
+
+    def candidate_pairs(self):
+        """逐行统计共同词数量，只产生共同词 >= min_overlap 的 (i, j, overlap)，i<j"""
+        for i, words in enumerate(self.token_sets):
+            counts = {}
+            for word in words:
+                positions = self.postings.get(word)
+                if positions is None:
+                    continue
+                # 倒排列表按位置升序，只统计 j > i 的部分
+                for j in positions[bisect_right(positions, i):]:
+                    counts[j] = counts.get(j, 0) + 1
+            for j in sorted(counts):
+                if counts[j] >= self.min_overlap:
+                    yield i, j, counts[j]
+
+    def stats(self):
+        """返回索引规模及被丢弃的倒排项数量"""
+        return {
+            'tokens': len(self.postings),
+            'postings': sum(len(positions) for positions in self.postings.values()),
+            'dropped_tokens': self.dropped_tokens,
+            'skipped_postings': self.skipped_postings
+        }
+
 
 class TextFilter:
-    def __init__(self):
-        self.tfidf_vectorizer = TfidfVectorizer(
-            tokenizer=lambda x: list(jieba.cut(x)),
+    def __init__(self, num_bands=None, rows_per_band=None, seed=42, tokenizer=None):
+        # 所有打分方法共用同一个分词缓存，每个文本只分词一次
+        self.tokenizer = tokenizer or Tokenizer()
+        # 逐对拟合的TF-IDF模型每次 fit_transform 都会改变，后台任务共用同一个 TextFilter，因此每个线程各用一个
+        self._local = threading.local()
+        # LSH分桶参数：签名长度 = bands * rows，阈值约为 (1/bands)^(1/rows)
+        # 未指定时按默认阈值推导（历史库的分桶使用这组参数），batch_process 的 lsh 模式再按每次调用的阈值推导；
+        # 显式指定时 batch_process 也固定使用这组参数
+        if (num_bands is None) != (rows_per_band is None):
+            raise ValueError("num_bands and rows_per_band must be given together")
+        self._fixed_lsh_params = num_bands is not None
+        if num_bands is None:
+            num_bands, rows_per_band = lsh_params_for(DEFAULT_LSH_THRESHOLD)
+        self.num_bands = num_bands
+        self.rows_per_band = rows_per_band
+        self.num_perm = num_bands * rows_per_band
+        self._seed = seed
+        self._permutations = {}
+        self._perm_a, self._perm_b = self._minhash_permutations(self.num_perm)
+
+    def _new_tfidf_vectorizer(self):
+        # sklearn 导入较慢，只在首次使用TF-IDF时导入
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        return TfidfVectorizer(
+            tokenizer=self.tokenizer.tokenize,
             token_pattern=None  # 设置为 None 以避免警告
         )
 
+    @property
+    def tfidf_vectorizer(self):
+        vectorizer = getattr(self._local, 'tfidf_vectorizer', None)
+        if vectorizer is None:
+            vectorizer = self._local.tfidf_vectorizer = self._new_tfidf_vectorizer()
+        return vectorizer
+
     def keyword_filter(self, text1, text2, threshold=0.3):
         """基于关键词的初步筛选"""
-        words1 = set(jieba.cut(text1))
-        words2 = set(jieba.cut(text2))
+        words1 = set(self.tokenizer.tokenize(text1))
+        words2 = set(self.tokenizer.tokenize(text2))
         overlap = len(words1.intersection(words2))
         union = len(words1.union(words2))
         similarity = overlap / union if union > 0 else 0
@@ -28,6 +173,37 @@ class TextFilter:
         except:
             return 0
 
+    def fit_corpus_tfidf(self, texts):
+        """在整列文本上一次性拟合TF-IDF模型，返回行归一化的稀疏矩阵（词表为空时返回 None）
+        
+        矩阵由调用方持有，不保存在实例上，并发任务共用同一个 TextFilter 时互不影响
+        """
+        try:
+            return self._new_tfidf_vectorizer().fit_transform(texts).tocsr()
+        except ValueError:
+            # 词表为空（例如全部为空文本）
+            return None
+
+    @staticmethod
+    def corpus_tfidf_scores(matrix, threshold=0.3, block_size=1000):
+        """分块计算 X[block] * X.T，返回相似度 >= threshold 的 {(i, j): score}（i<j 为文本位置）
+        
+        matrix 为 fit_corpus_tfidf 返回的矩阵
+        """
+        scores = {}
+        if matrix is None:
+            return scores
+        
+        matrix_t = matrix.T.tocsc()
+        n = matrix.shape[0]
+        for start in range(0, n, block_size):
+            block = (matrix[start:start + block_size] * matrix_t).tocoo()
+            rows = block.row + start
+            keep = (rows < block.col) & (block.data >= threshold)
+            for i, j, value in zip(rows[keep], block.col[keep], block.data[keep]):
+                scores[(int(i), int(j))] = float(value)
+        return scores
+
     def edit_distance_filter(self, text1, text2):
         """基于编辑距离的初步筛选"""
         max_len = max(len(text1), len(text2))
@@ -37,76 +213,592 @@ class TextFilter:
         similarity = 1 - (distance / max_len)
         return similarity
 
-    def batch_process(self, texts_with_index, threshold=0.3):
-        """批量处理文本列表，返回可能相似的文本对"""
+    @staticmethod
+    def max_edit_distance(max_len, threshold):
+        """满足 1 - d/max_len >= threshold 的最大编辑距离 d（与浮点比较结果严格一致）"""
+        bound = int((1 - threshold) * max_len)
+        while bound + 1 <= max_len and 1 - ((bound + 1) / max_len) >= threshold:
+            bound += 1
+        while bound >= 0 and 1 - (bound / max_len) < threshold:
+            bound -= 1
+        return bound
+
+    def thresholded_edit_distance_filter(self, text1, text2, threshold):
+        """带阈值的编辑距离筛选：相似度低于阈值时返回0，超过距离上限即提前终止
+        
+        低于阈值的编辑距离分数不可能成为超过阈值的最高分，因此不影响 batch_process 的结果。
+        """
+        max_len = max(len(text1), len(text2))
+        if max_len == 0:
+            return 0
+        bound = self.max_edit_distance(max_len, threshold)
+        # 长度差本身就是编辑距离的下界
+        if bound < 0 or abs(len(text1) - len(text2)) > bound:
+            return 0
+        # score_cutoff 使用带状/位并行算法，超过上限后返回 bound+1
+        distance = levenshtein_distance(text1, text2, score_cutoff=bound)
+        if distance > bound:
+            return 0
+        return 1 - (distance / max_len)
+
+    def _score_pair(self, text1, text2, words1, words2, tfidf_score=None, threshold=None):
+        """计算一对文本的详细相似度，返回(最高相似度, 对应方法)
+        
+        给定 threshold 时编辑距离使用带阈值的提前终止版本
+        """
+        if tfidf_score is None:
+            tfidf_score = self.tfidf_filter(text1, text2)
+        similarities = {
+            'keyword': len(words1.intersection(words2)) / len(words1.union(words2)),
+            'tfidf': tfidf_score,
+            'edit_distance': (self.edit_distance_filter(text1, text2) if threshold is None
+                              else self.thresholded_edit_distance_filter(text1, text2, threshold))
+        }
+        
+        # 找出最高相似度及其对应的方法
+        max_method = max(similarities.items(), key=lambda x: x[1])
+        return max_method[1], max_method[0]
+
+    def _evaluate_pair(self, text1, text2, words1, words2, threshold, tfidf_score=None):
+        """对一对文本做长度/共同词预筛选并计算相似度，未通过或低于阈值时返回 None"""
+        # 快速预筛选：如果文本长度差异太大，直接跳过
+        len1, len2 = len(text1), len(text2)
+        if min(len1, len2) / max(len1, len2) < 0.5:
+            return None
+        
+        # 快速关键词匹配预筛选
+        overlap = len(words1.intersection(words2))
+        if overlap < 2:  # 如果共同词汇太少，直接跳过
+            return None
+        
+        # 计算详细相似度
+        max_similarity, best_method = self._score_pair(text1, text2, words1, words2, tfidf_score, threshold)
+        if max_similarity < threshold:
+            return None
+        return max_similarity, best_method
+
+    def _all_pairs(self, n):
+        """穷举所有 i<j 的文本对位置"""
+        for i in range(n):
+            for j in range(i + 1, n):
+                yield i, j
+
+    @staticmethod
+    def _group_ranges(groups, compare):
+        """分组在文本列表中的连续区间 {分组: (起, 止)}，以及按区间顺序排列的待比较分组对"""
+        ranges = {}
+        for pos, group in enumerate(groups):
+            if group not in ranges:
+                ranges[group] = (pos, pos + 1)
+            elif ranges[group][1] == pos:
+                ranges[group] = (ranges[group][0], pos + 1)
+            else:
+                raise ValueError("groups 中同一分组的文本必须连续排列")
+        group_pairs = sorted(
+            {tuple(sorted((a, b), key=lambda group: ranges[group][0])) for a, b in compare
+             if a in ranges and b in ranges},
+            key=lambda pair: (ranges[pair[0]][0], ranges[pair[1]][0])
+        )
+        return ranges, group_pairs
+
+    def _group_pairs(self, ranges, group_pairs):
+        """只穷举需要比较的分组之间的文本对（i<j），分组内部仅在 (a, a) 需要比较时才穷举"""
+        for a, b in group_pairs:
+            a_start, a_end = ranges[a]
+            b_start, b_end = ranges[b]
+            for i in range(a_start, a_end):
+                for j in range(max(b_start, i + 1), b_end):
+                    yield i, j
+
+    def _token_hashes(self, words):
+        """将分词结果映射为稳定的32位哈希值（不受PYTHONHASHSEED影响）"""
+        return np.fromiter(
+            (zlib.crc32(word.encode('utf-8')) for word in words),
+            dtype=np.uint64,
+            count=len(words)
+        )
+
+    def _minhash_permutations(self, num_perm):
+        """签名长度为 num_perm 的哈希函数参数 (a, b)，由 seed 决定，按长度缓存"""
+        if num_perm not in self._permutations:
+            rng = np.random.RandomState(self._seed)
+            self._permutations[num_perm] = (
+                rng.randint(1, (1 << 31) - 1, size=num_perm).astype(np.uint64),
+                rng.randint(0, (1 << 31) - 1, size=num_perm).astype(np.uint64)
+            )
+        return self._permutations[num_perm]
+
+    def lsh_params(self, threshold):
+        """batch_process 在该阈值下使用的 (num_bands, rows_per_band)"""
+        if self._fixed_lsh_params:
+            return self.num_bands, self.rows_per_band
+        return lsh_params_for(threshold)
+
+    def minhash_signatures(self, token_sets, num_perm=None):
+        """为每个分词集合计算MinHash签名，返回 (文本数, num_perm) 的矩阵（默认使用实例的签名长度）"""
+        perm_a, perm_b = self._minhash_permutations(num_perm or self.num_perm)
+        signatures = np.full((len(token_sets), len(perm_a)), _MERSENNE_PRIME, dtype=np.uint64)
+        for row, words in enumerate(token_sets):
+            if not words:
+                continue
+            hashes = self._token_hashes(words)
+            # (a*x + b) mod p，每一行对应一个哈希函数
+            permuted = (perm_a[:, None] * hashes[None, :] + perm_b[:, None]) % _MERSENNE_PRIME
+            signatures[row] = permuted.min(axis=1)
+        return signatures
+
+    def _length_compatible_pairs(self, members, lengths):
+        """按文本长度排序后滑动窗口，只产生长度比 >= 0.5 的文本对"""
+        members = sorted(members, key=lambda pos: lengths[pos])
+        for a, pos1 in enumerate(members):
+            for pos2 in members[a + 1:]:
+                # 已按长度升序，后面的只会更长
+                if lengths[pos1] < lengths[pos2] * 0.5:
+                    break
+                yield (pos1, pos2) if pos1 < pos2 else (pos2, pos1)
+
+    def lsh_candidates(self, texts_with_index, text_words, threshold=DEFAULT_LSH_THRESHOLD):
+        """基于MinHash/LSH分桶生成候选文本对（文本在列表中的位置对），分桶参数见 lsh_params"""
+        num_bands, rows_per_band = self.lsh_params(threshold)
+        token_sets = [text_words[idx] for idx, _ in texts_with_index]
+        lengths = [len(text) for _, text in texts_with_index]
+        signatures = self.minhash_signatures(token_sets, num_bands * rows_per_band)
+        
+        candidates = set()
+        for band in range(num_bands):
+            start = band * rows_per_band
+            band_slice = signatures[:, start:start + rows_per_band]
+            buckets = {}
+            for pos in range(len(texts_with_index)):
+                # 空文本没有有效签名，不参与分桶
+                if not token_sets[pos]:
+                    continue
+                buckets.setdefault(band_slice[pos].tobytes(), []).append(pos)
+            
+            for members in buckets.values():
+                if len(members) < 2:
+                    continue
+                candidates.update(self._length_compatible_pairs(members, lengths))
+        
+        return sorted(candidates)
+
+    def batch_process(self, texts_with_index, threshold=0.3, candidate_mode='exhaustive', tfidf_mode='pair',
+                      progress_callback=None, workers=None, block_size=256, groups=None, compare=None):
+        """批量处理文本列表，返回可能相似的文本对
+        
+        candidate_mode:
+            'exhaustive' - 穷举所有文本对（O(n²)）
+            'lsh' - 使用MinHash/LSH分桶只比较可能相似的候选对
+            'inverted' - 使用分词倒排索引，只产生共同词 >= 2 的候选对
+        tfidf_mode:
+            'pair' - 每对文本单独拟合TF-IDF
+            'corpus' - 整列拟合一次TF-IDF，分块稀疏矩阵乘法得到相似度
+        progress_callback(stage, percent, message): 进度回调，stage 固定为 'prefilter'
+        workers: 大于1时使用多进程并行打分，结果与串行完全一致
+        block_size: 并行模式下每个任务处理的分块边长（穷举模式为 block_size x block_size 的文本对）
+        groups: 与 texts_with_index 一一对应的分组（同一分组的文本须连续排列），与 compare 一起使用
+        compare: 需要比较的 [(分组a, 分组b)]，只对这些分组之间的文本对打分；(a, a) 表示分组内部也比较
+        """
         similar_pairs = {}  # 使用字典存储文本对的最高相似度结果
-        total_pairs = len(texts_with_index) * (len(texts_with_index) - 1) // 2
-        processed_pairs = 0
-        last_progress = -1  # 用于控制进度显示频率
         
         print(f"开始文本初筛，共 {len(texts_with_index)} 条文本...")
         
-        # 预处理所有文本的分词结果
+        # 预处理所有文本的分词结果（每个唯一文本只分词一次）
+        with metrics.timer(stage='tokenize', items=len(texts_with_index)):
+            text_tokens = self.tokenizer.tokenize_many([text for _, text in texts_with_index])
         text_words = {}
         for idx, text in texts_with_index:
-            text_words[idx] = set(jieba.cut(text))
-        
-        for i, (idx1, text1) in enumerate(texts_with_index):
-            for j, (idx2, text2) in enumerate(texts_with_index[i+1:], i+1):
-                # 快速预筛选：如果文本长度差异太大，直接跳过
-                len1, len2 = len(text1), len(text2)
-                if min(len1, len2) / max(len1, len2) < 0.5:
-                    processed_pairs += 1
-                    continue
-                
-                # 快速关键词匹配预筛选
-                words1 = text_words[idx1]
-                words2 = text_words[idx2]
-                overlap = len(words1.intersection(words2))
-                if overlap < 2:  # 如果共同词汇太少，直接跳过
-                    processed_pairs += 1
-                    continue
-                
-                # 计算详细相似度
-                similarities = {
-                    'keyword': len(words1.intersection(words2)) / len(words1.union(words2)),
-                    'tfidf': self.tfidf_filter(text1, text2),
-                    'edit_distance': self.edit_distance_filter(text1, text2)
-                }
-                
-                # 找出最高相似度及其对应的方法
-                max_method = max(similarities.items(), key=lambda x: x[1])
-                max_similarity = max_method[1]
-                best_method = max_method[0]
-                
-                # 如果最高相似度超过阈值，保存结果
-                if max_similarity >= threshold:
-                    pair_key = (min(idx1, idx2), max(idx1, idx2))
-                    current_result = {
-                        'text1': text1,
-                        'text2': text2,
-                        'index1': idx1,
-                        'index2': idx2,
-                        'similarity': max_similarity,
-                        'method': best_method
-                    }
-                    
-                    # 如果这对文本已经存在，只保留相似度更高的结果
-                    if pair_key not in similar_pairs or similar_pairs[pair_key]['similarity'] < max_similarity:
-                        similar_pairs[pair_key] = current_result
-                
-                processed_pairs += 1
-                # 每处理5%显示一次进度
-                current_progress = int((processed_pairs / total_pairs) * 20)
-                if current_progress > last_progress:
-                    percent = (processed_pairs / total_pairs) * 100
-                    print(f"初筛进度: {percent:.1f}% ({processed_pairs}/{total_pairs})")
-                    last_progress = current_progress
+            text_words[idx] = set(text_tokens[text])
+        
+        corpus_scores = None
+        tfidf_matrix = None
+        if tfidf_mode == 'corpus':
+            with metrics.timer(stage='tfidf_fit', items=len(texts_with_index)):
+                tfidf_matrix = self.fit_corpus_tfidf([text for _, text in texts_with_index])
+            # 低于阈值的TF-IDF分数不会成为超过阈值的最高分，按0处理即可
+            # 并行模式下由各工作进程按块计算
+            if not (workers and workers > 1):
+                with metrics.timer(stage='tfidf_scores'):
+                    corpus_scores = self.corpus_tfidf_scores(tfidf_matrix, threshold)
+        elif tfidf_mode != 'pair':
+            raise ValueError(f"Unknown tfidf mode: {tfidf_mode}")
+        
+        group_ranges = None
+        if groups is not None:
+            group_ranges, group_pairs = self._group_ranges(groups, compare or [])
+            allowed = set(group_pairs)
+        
+        candidates_start = time.perf_counter()
+        if candidate_mode == 'exhaustive' and group_ranges is not None:
+            candidates = self._group_pairs(group_ranges, group_pairs)
+            total_pairs = sum(
+                (group_ranges[a][1] - group_ranges[a][0]) * (group_ranges[a][1] - group_ranges[a][0] - 1) // 2
+                if a == b else
+                (group_ranges[a][1] - group_ranges[a][0]) * (group_ranges[b][1] - group_ranges[b][0])
+                for a, b in group_pairs
+            )
+        elif candidate_mode == 'exhaustive':
+            candidates = self._all_pairs(len(texts_with_index))
+            total_pairs = len(texts_with_index) * (len(texts_with_index) - 1) // 2
+        elif candidate_mode == 'lsh':
+            candidates = self.lsh_candidates(texts_with_index, text_words, threshold)
+            total_pairs = len(candidates)
+            print(f"LSH候选对数量: {total_pairs} (bands={self.lsh_params(threshold)[0]}, "
+                  f"rows={self.lsh_params(threshold)[1]})")
+        elif candidate_mode == 'inverted':
+            # 索引只在本次调用内使用，不保存在实例上，并发任务互不影响
+            token_index = InvertedTokenIndex().build(text_words[idx] for idx, _ in texts_with_index)
+            candidates = [(i, j) for i, j, _ in token_index.candidate_pairs()]
+            total_pairs = len(candidates)
+            index_stats = token_index.stats()
+            print(f"倒排索引: {index_stats['tokens']} 个词, {index_stats['postings']} 条倒排项, "
+                  f"跳过高频词 {index_stats['dropped_tokens']} 个 ({index_stats['skipped_postings']} 条倒排项)")
+            # 索引规模记录在指标中（任务内执行时同时计入该任务的指标）
+            metrics.inc('inverted_index_postings_total', index_stats['postings'])
+            metrics.inc('inverted_index_skipped_postings_total', index_stats['skipped_postings'])
+            print(f"倒排索引候选对数量: {total_pairs}")
+        else:
+            raise ValueError(f"Unknown candidate mode: {candidate_mode}")
+        if group_ranges is not None and candidate_mode != 'exhaustive':
+            # 候选索引建立在全部文本上，只保留需要比较的分组之间的候选对
+            candidates = [(i, j) for i, j in candidates if (groups[i], groups[j]) in allowed]
+            total_pairs = len(candidates)
+            print(f"跨分组候选对数量: {total_pairs}")
+        metrics.observe('stage_seconds', time.perf_counter() - candidates_start, total_pairs,
+                        stage=f'candidates_{candidate_mode}')
+        
+        scoring_start = time.perf_counter()
+        if workers and workers > 1:
+            scored_pairs = self._score_candidates_parallel(
+                texts_with_index, text_tokens, candidate_mode, candidates, total_pairs,
+                threshold, workers, block_size, progress_callback, tfidf_matrix,
+                group_blocks=[(group_ranges[a], group_ranges[b]) for a, b in group_pairs]
+                if group_ranges is not None else None
+            )
+        else:
+            scored_pairs = self._score_candidates(
+                texts_with_index, text_words, candidates, total_pairs,
+                threshold, corpus_scores, progress_callback
+            )
+        
+        for i, j, max_similarity, best_method in scored_pairs:
+            idx1, text1 = texts_with_index[i]
+            idx2, text2 = texts_with_index[j]
+            pair_key = (min(idx1, idx2), max(idx1, idx2))
+            current_result = {
+                'text1': text1,
+                'text2': text2,
+                'index1': idx1,
+                'index2': idx2,
+                'similarity': max_similarity,
+                'method': best_method
+            }
+            
+            # 如果这对文本已经存在，只保留相似度更高的结果
+            if pair_key not in similar_pairs or similar_pairs[pair_key]['similarity'] < max_similarity:
+                similar_pairs[pair_key] = current_result
+        metrics.observe('stage_seconds', time.perf_counter() - scoring_start, total_pairs, stage='scoring')
 
         print(f"初筛完成，找到 {len(similar_pairs)} 对相似文本")
         # 将字典转换为列表
         return list(similar_pairs.values())
 
+    def _report_progress(self, processed_pairs, total_pairs, last_progress, progress_callback):
+        """每处理5%显示一次进度，返回新的进度档位"""
+        current_progress = int((processed_pairs / total_pairs) * 20)
+        if current_progress > last_progress:
+            percent = (processed_pairs / total_pairs) * 100
+            print(f"初筛进度: {percent:.1f}% ({processed_pairs}/{total_pairs})")
+            if progress_callback is not None:
+                progress_callback('prefilter', percent, f"初筛进度: {processed_pairs}/{total_pairs}")
+            return current_progress
+        return last_progress
+
+    def _score_candidates(self, texts_with_index, text_words, candidates, total_pairs,
+                          threshold, corpus_scores, progress_callback):
+        """串行打分，按候选顺序产生 (i, j, 相似度, 方法)"""
+        last_progress = -1  # 用于控制进度显示频率
+        processed_pairs = 0
+        for i, j in candidates:
+            idx1, text1 = texts_with_index[i]
+            idx2, text2 = texts_with_index[j]
+            processed_pairs += 1
+            
+            tfidf_score = corpus_scores.get((i, j), 0) if corpus_scores is not None else None
+            result = self._evaluate_pair(text1, text2, text_words[idx1], text_words[idx2], threshold, tfidf_score)
+            if result is not None:
+                yield (i, j) + result
+            
+            last_progress = self._report_progress(processed_pairs, total_pairs, last_progress, progress_callback)
+
+    def _score_candidates_parallel(self, texts_with_index, text_tokens, candidate_mode, candidates, total_pairs,
+                                   threshold, workers, block_size, progress_callback, tfidf_matrix=None,
+                                   group_blocks=None):
+        """多进程打分：分词与文本写入共享内存，各进程只接收分块坐标，结果按 (i, j) 排序返回
+
+        tfidf_matrix: 整列拟合的TF-IDF矩阵（fit_corpus_tfidf 的返回值），None 表示逐对拟合
+        group_blocks: 穷举模式下只需比较的 [((行起, 行止), (列起, 列止))] 区域，默认为全部文本的上三角
+        """
+        n = len(texts_with_index)
+        
+        # 分词结果转为词id数组，与词表、文本一起放入共享内存，避免每个任务重复序列化
+        vocabulary = {}
+        token_ids = []
+        token_offsets = [0]
+        text_bytes = []
+        text_offsets = [0]
+        for _, text in texts_with_index:
+            token_ids.extend(vocabulary.setdefault(word, len(vocabulary)) for word in text_tokens[text])
+            token_offsets.append(len(token_ids))
+            encoded = text.encode('utf-8')
+            text_bytes.append(encoded)
+            text_offsets.append(text_offsets[-1] + len(encoded))
+        
+        vocab_bytes = []
+        vocab_offsets = [0]
+        for word in vocabulary:
+            encoded = word.encode('utf-8')
+            vocab_bytes.append(encoded)
+            vocab_offsets.append(vocab_offsets[-1] + len(encoded))
+        
+        arrays = {
+            'token_ids': np.array(token_ids, dtype=np.int32),
+            'token_offsets': np.array(token_offsets, dtype=np.int64),
+            'text_bytes': np.frombuffer(b''.join(text_bytes) or b'\0', dtype=np.uint8),
+            'text_offsets': np.array(text_offsets, dtype=np.int64),
+            'vocab_bytes': np.frombuffer(b''.join(vocab_bytes) or b'\0', dtype=np.uint8),
+            'vocab_offsets': np.array(vocab_offsets, dtype=np.int64),
+        }
+        if tfidf_matrix is not None:
+            arrays['tfidf_data'] = tfidf_matrix.data
+            arrays['tfidf_indices'] = tfidf_matrix.indices
+            arrays['tfidf_indptr'] = tfidf_matrix.indptr
+        shared = _SharedArrays(arrays)
+        spec = {
+            'key': uuid.uuid4().hex,
+            'arrays': shared.spec,
+            'tfidf_shape': tfidf_matrix.shape if tfidf_matrix is not None else None,
+            'threshold': threshold,
+        }
+        
+        # 穷举模式按上三角分块；候选模式按候选列表分段
+        if candidate_mode == 'exhaustive':
+            tasks = [
+                ('block', row_start, min(row_start + block_size, row_end),
+                 col_start, min(col_start + block_size, col_end))
+                for (rows_start, row_end), (cols_start, col_end) in (group_blocks or [((0, n), (0, n))])
+                for row_start in range(rows_start, row_end, block_size)
+                # 行列为同一区间时只需上三角的块
+                for col_start in range(row_start if cols_start == rows_start else cols_start, col_end, block_size)
+            ]
+        else:
+            chunk = block_size * block_size
+            candidate_array = np.array(candidates, dtype=np.int64).reshape(-1, 2)
+            tasks = [('pairs', candidate_array[start:start + chunk]) for start in range(0, len(candidate_array), chunk)]
+        
+        results = []
+        processed_pairs = 0
+        last_progress = -1
+        try:
+            # 进程池在多次调用之间复用（见 shared_process_pool），共享内存由工作进程按 spec 挂载
+            executor = shared_process_pool('score', workers)
+            futures = [executor.submit(_score_parallel_task, spec, task) for task in tasks]
+            try:
+                for future in as_completed(futures):
+                    task_pairs, task_results = future.result()
+                    results.extend(task_results)
+                    processed_pairs += task_pairs
+                    if total_pairs:
+                        last_progress = self._report_progress(processed_pairs, total_pairs, last_progress,
+                                                              progress_callback)
+            finally:
+                # 出错时取消尚未开始的任务，已开始的任务结束后才释放共享内存
+                for future in futures:
+                    future.cancel()
+                wait(futures)
+        finally:
+            shared.release()
+        
+        # 与串行路径的遍历顺序保持一致
+        results.sort(key=lambda item: (item[0], item[1]))
+        return results
+
+    def compare_candidate_recall(self, texts_with_index, threshold=0.3):
+        """对比LSH候选生成与穷举结果的召回率，用于调整 num_bands/rows_per_band"""
+        start = time.time()
+        exhaustive = self.batch_process(texts_with_index, threshold, candidate_mode='exhaustive')
+        exhaustive_time = time.time() - start
+        
+        start = time.time()
+        lsh = self.batch_process(texts_with_index, threshold, candidate_mode='lsh')
+        lsh_time = time.time() - start
+        
+        exhaustive_keys = {(min(p['index1'], p['index2']), max(p['index1'], p['index2'])) for p in exhaustive}
+        lsh_keys = {(min(p['index1'], p['index2']), max(p['index1'], p['index2'])) for p in lsh}
+        recall = len(exhaustive_keys & lsh_keys) / len(exhaustive_keys) if exhaustive_keys else 1.0
+        
+        num_bands, rows_per_band = self.lsh_params(threshold)
+        stats = {
+            'num_bands': num_bands,
+            'rows_per_band': rows_per_band,
+            'exhaustive_pairs': len(exhaustive_keys),
+            'lsh_pairs': len(lsh_keys),
+            'recall': recall,
+            'exhaustive_time': exhaustive_time,
+            'lsh_time': lsh_time
+        }
+        print(f"LSH召回率: {recall:.2%} (bands={num_bands}, rows={rows_per_band}), "
+              f"耗时 {lsh_time:.2f}s vs 穷举 {exhaustive_time:.2f}s")
+        return stats
+
+class _SharedArrays:
+    """将一组 numpy 数组复制到共享内存，供工作进程按名称挂载"""
+
+    def __init__(self, arrays):
+        self.segments = []
+        self.spec = {}
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            segment = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, dtype=array.dtype, buffer=segment.buf)[...] = array
+            self.segments.append(segment)
+            self.spec[name] = (segment.name, array.dtype.str, array.shape)
+
+    @staticmethod
+    def attach(spec):
+        """在工作进程中挂载共享内存，返回 (数组字典, 共享内存段列表)"""
+        arrays, segments = {}, []
+        for name, (segment_name, dtype, shape) in spec.items():
+            segment = shared_memory.SharedMemory(name=segment_name)
+            segments.append(segment)
+            arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=segment.buf)
+        return arrays, segments
+
+    def release(self):
+        for segment in self.segments:
+            segment.close()
+            segment.unlink()
+
+
+# 工作进程内按调用（spec['key']）挂载的共享数据，进程池在多次调用之间复用
+_worker_states = OrderedDict()
+# 每个工作进程最多保留的调用数：并发任务共用进程池时交替处理，超出后关闭最早的共享内存映射
+_MAX_WORKER_STATES = 2
+# 工作进程内复用的 TextFilter，分词缓存由主进程的分词结果填充，不会重新加载jieba词典
+_worker_filter = None
+
+
+def _worker_state(spec):
+    """返回本次调用在工作进程内的状态，首次处理该调用的任务时挂载共享内存"""
+    state = _worker_states.get(spec['key'])
+    if state is not None:
+        _worker_states.move_to_end(spec['key'])
+        return state
+    while len(_worker_states) >= _MAX_WORKER_STATES:
+        _, old = _worker_states.popitem(last=False)
+        # numpy 视图先于共享内存段释放，否则 close 会因仍有引用而失败
+        segments = old.pop('segments')
+        old.clear()
+        for segment in segments:
+            segment.close()
+
+    global _worker_filter
+    if _worker_filter is None:
+        _worker_filter = TextFilter()
+    arrays, segments = _SharedArrays.attach(spec['arrays'])
+    vocab_bytes, vocab_offsets = arrays['vocab_bytes'], arrays['vocab_offsets']
+    state = {
+        'arrays': arrays,
+        'segments': segments,
+        'threshold': spec['threshold'],
+        'words': {},
+        'texts': {},
+        'vocabulary': [
+            vocab_bytes[vocab_offsets[k]:vocab_offsets[k + 1]].tobytes().decode('utf-8')
+            for k in range(len(vocab_offsets) - 1)
+        ],
+        'tfidf': None,
+    }
+    if spec['tfidf_shape'] is not None:
+        from scipy import sparse
+        matrix = sparse.csr_matrix(
+            (arrays['tfidf_data'], arrays['tfidf_indices'], arrays['tfidf_indptr']),
+            shape=spec['tfidf_shape']
+        )
+        # 与 corpus_tfidf_scores 使用相同的乘法形式，保证分数逐位一致
+        state['tfidf'] = (matrix, matrix.T.tocsc())
+    _worker_states[spec['key']] = state
+    return state
+
+
+def _worker_token_ids(state, pos):
+    offsets = state['arrays']['token_offsets']
+    return state['arrays']['token_ids'][offsets[pos]:offsets[pos + 1]].tolist()
+
+
+def _worker_text(state, pos):
+    texts = state['texts']
+    if pos not in texts:
+        offsets = state['arrays']['text_offsets']
+        text = state['arrays']['text_bytes'][offsets[pos]:offsets[pos + 1]].tobytes().decode('utf-8')
+        # 用主进程的分词结果填充本进程的分词缓存，TF-IDF打分时无需重新分词
+        vocabulary = state['vocabulary']
+        _worker_filter.tokenizer.seed(text, [vocabulary[k] for k in _worker_token_ids(state, pos)])
+        texts[pos] = text
+    return texts[pos]
+
+
+def _worker_words(state, pos):
+    words = state['words']
+    if pos not in words:
+        words[pos] = set(_worker_token_ids(state, pos))
+    return words[pos]
+
+
+def _worker_tfidf_block(state, rows, cols):
+    """计算 rows x cols 的TF-IDF相似度块，低于阈值的置0（与串行一致）"""
+    matrix, matrix_t = state['tfidf']
+    block = (matrix[rows] * matrix_t[:, cols]).toarray()
+    block[block < state['threshold']] = 0
+    return block
+
+
+def _score_parallel_task(spec, task):
+    """工作进程中对一个分块或一段候选对打分，返回 (处理的文本对数, 结果列表)"""
+    state = _worker_state(spec)
+    threshold = state['threshold']
+    use_tfidf = state['tfidf'] is not None
+    results = []
+    
+    def evaluate(i, j, tfidf_score):
+        result = _worker_filter._evaluate_pair(
+            _worker_text(state, i), _worker_text(state, j), _worker_words(state, i), _worker_words(state, j),
+            threshold, tfidf_score
+        )
+        if result is not None:
+            results.append((i, j) + result)
+    
+    if task[0] == 'block':
+        _, row_start, row_end, col_start, col_end = task
+        block = (_worker_tfidf_block(state, slice(row_start, row_end), slice(col_start, col_end))
+                 if use_tfidf else None)
+        processed = 0
+        for i in range(row_start, row_end):
+            for j in range(max(col_start, i + 1), col_end):
+                processed += 1
+                tfidf_score = float(block[i - row_start, j - col_start]) if use_tfidf else None
+                evaluate(i, j, tfidf_score)
+        return processed, results
+    
+    pairs = task[1]
+    for i in np.unique(pairs[:, 0]):
+        js = pairs[pairs[:, 0] == i, 1]
+        row_scores = _worker_tfidf_block(state, [int(i)], js)[0] if use_tfidf else None
+        for k, j in enumerate(js):
+            evaluate(int(i), int(j), float(row_scores[k]) if use_tfidf else None)
+    return len(pairs), results
+
+
 def main():
     # 测试用例
     texts = [
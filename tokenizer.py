@@ -0,0 +1,204 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import jieba
+
+from metrics import metrics
+
+
+def process_pool_context():
+    """进程池的启动方式：forkserver，不支持时（如Windows）使用 spawn
+
+    Web服务中有任务队列、向量请求调度等多个线程，直接 fork 时子进程可能继承被其他线程持有的锁（如 metrics）而永久阻塞
+    """
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+
+# 按名称复用的进程池 {name: (executor, max_workers)}
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def shared_process_pool(name, workers, initializer=None):
+    """按名称复用的进程池，工作进程只在首次使用时启动并执行 initializer（如加载jieba词典）
+
+    工作进程按提交的任务数逐个启动，任务数少时不会启动全部 workers 个进程；
+    需要的进程数超过现有进程池或进程池已损坏时重建，旧进程池处理完已提交的任务后退出
+    """
+    with _pools_lock:
+        executor, max_workers = _pools.get(name, (None, 0))
+        if executor is None or max_workers < workers or getattr(executor, '_broken', False):
+            if executor is not None:
+                executor.shutdown(wait=False)
+            executor = ProcessPoolExecutor(max_workers=workers, mp_context=process_pool_context(),
+                                           initializer=initializer)
+            _pools[name] = (executor, workers)
+        return executor
+
+
+def shutdown_process_pools():
+    """关闭所有复用的进程池（基准测试测量冷启动耗时、测试结束时使用）"""
+    with _pools_lock:
+        for executor, _ in _pools.values():
+            executor.shutdown()
+        _pools.clear()
+
+
+def _init_segment_worker():
+    # jieba.initialize 是默认分词器的绑定方法，forkserver/spawn 下无法序列化传给工作进程
+    jieba.initialize()
+
+
+def _segment_chunk(texts):
+    """工作进程中对一批文本分词"""
+    return [tuple(jieba.cut(text)) for text in texts]
+
+
+class Tokenizer:
+    """jieba分词缓存：每个唯一文本只分词一次，结果按文本哈希缓存在内存（LRU）和可选的SQLite中"""
+
+    # SQLite 单条语句的参数数量有限，批量查询时分块
+    _CHUNK_SIZE = 500
+    # 多进程分词时每个任务的最少文本数
+    _MIN_SEGMENT_CHUNK = 1000
+
+    def __init__(self, cache_path=None, max_memory_entries=500000, parallel_threshold=20000, workers=None):
+        self.max_memory_entries = max_memory_entries
+        # 待分词文本超过 parallel_threshold 条时使用多进程分词。
+        # 实测串行约2000条/秒，工作进程冷启动（含加载词典）约2秒：2核时冷启动约在该规模与串行持平，
+        # 进程池复用后收益更早出现（见 benchmark_pipeline.py 的 tokenize_* 阶段）
+        self.parallel_threshold = parallel_threshold
+        self.workers = workers or os.cpu_count() or 1
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        if cache_path:
+            self._conn = sqlite3.connect(cache_path, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('CREATE TABLE IF NOT EXISTS tokens (key TEXT PRIMARY KEY, tokens TEXT NOT NULL)')
+            self._conn.commit()
+
+    @staticmethod
+    def initialize():
+        """预加载jieba词典，避免首个请求承担加载耗时"""
+        jieba.initialize()
+
+    @staticmethod
+    def initialized():
+        return jieba.dt.initialized
+
+    @staticmethod
+    def make_key(text):
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    def _remember(self, key, tokens):
+        self._memory[key] = tokens
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def seed(self, text, tokens):
+        """写入已知的分词结果（例如从共享内存恢复）"""
+        with self._lock:
+            self._remember(self.make_key(text), tuple(tokens))
+
+    def tokenize(self, text):
+        """返回文本的分词结果（tuple）"""
+        return self.tokenize_many([text])[text]
+
+    def tokenize_many(self, texts):
+        """批量分词，返回 {text: tokens}；依次查询内存缓存、磁盘缓存，剩余文本统一分词"""
+        keys = {}
+        for text in texts:
+            keys.setdefault(text, self.make_key(text))
+
+        result = {}
+        missing = []
+        with self._lock:
+            for text, key in keys.items():
+                tokens = self._memory.get(key)
+                if tokens is None:
+                    missing.append(text)
+                else:
+                    self._memory.move_to_end(key)
+                    result[text] = tokens
+
+        if missing and self._conn is not None:
+            loaded = self._load([keys[text] for text in missing])
+            still_missing = []
+            for text in missing:
+                tokens = loaded.get(keys[text])
+                if tokens is None:
+                    still_missing.append(text)
+                else:
+                    result[text] = tokens
+            missing = still_missing
+
+        self.hits += len(keys) - len(missing)
+        self.misses += len(missing)
+        metrics.inc('cache_hits_total', len(keys) - len(missing), cache='token')
+        metrics.inc('cache_misses_total', len(missing), cache='token')
+
+        segmented = []
+        if missing:
+            with metrics.timer(stage='jieba', items=len(missing)):
+                segmented = self._segment(missing)
+        new_tokens = dict(zip(missing, segmented))
+        result.update(new_tokens)
+
+        with self._lock:
+            for text in keys:
+                self._remember(keys[text], result[text])
+        if new_tokens and self._conn is not None:
+            self._store([(keys[text], tokens) for text, tokens in new_tokens.items()])
+        return result
+
+    def _segment(self, texts):
+        """分词：数量较大时使用进程池，否则在当前进程中完成"""
+        if len(texts) < self.parallel_threshold or self.workers <= 1:
+            return _segment_chunk(texts)
+        chunk_size = max(self._MIN_SEGMENT_CHUNK, len(texts) // (self.workers * 4))
+        chunks = [texts[start:start + chunk_size] for start in range(0, len(texts), chunk_size)]
+        # 进程池在多次调用之间复用，每个工作进程只加载一次jieba词典；工作进程按需启动，最多 min(workers, 分块数) 个。
+        # 工作进程不从多线程的服务进程 fork（见 process_pool_context）
+        executor = shared_process_pool('segment', self.workers, _init_segment_worker)
+        return [tokens for chunk in executor.map(_segment_chunk, chunks) for tokens in chunk]
+
+    def _load(self, keys):
+        loaded = {}
+        with self._lock:
+            for start in range(0, len(keys), self._CHUNK_SIZE):
+                chunk = keys[start:start + self._CHUNK_SIZE]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self._conn.execute(
+                    f'SELECT key, tokens FROM tokens WHERE key IN ({placeholders})', chunk
+                ).fetchall()
+                for key, tokens in rows:
+                    loaded[key] = tuple(json.loads(tokens))
+        return loaded
+
+    def _store(self, rows):
+        with self._lock:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO tokens (key, tokens) VALUES (?, ?)',
+                [(key, json.dumps(tokens, ensure_ascii=False)) for key, tokens in rows]
+            )
+            self._conn.commit()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0,
+            'memory_entries': len(self._memory)
+        }
@@ -0,0 +1,69 @@
+import threading
+import time
+
+from metrics import metrics
+
+
+class Warmup:
+    """启动后在后台依次加载各组件（分词词典、向量模型、Milvus连接等），记录每个组件的状态
+
+    组件未就绪时并不阻止请求：各组件本身在首次使用时也会按需加载，预热只是把耗时提前到空闲时。
+    required 为假的组件（例如仅在文本很多时才使用的Milvus）失败时服务仍视为就绪。
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self._components = []  # [(名称, 加载函数, 是否必需)]
+        self._checks = {}      # 名称 -> 判断组件是否已加载的函数
+        self._state = {}       # 名称 -> {'status', 'required', 'seconds', 'error'}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._started = False
+
+    def add(self, name, load, required=True, check=None):
+        """登记组件；check() 为真表示组件已在首次使用时加载（例如预热完成前就有请求到达）"""
+        self._components.append((name, load, required))
+        if check is not None:
+            self._checks[name] = check
+        self._state[name] = {'status': 'pending', 'required': required, 'seconds': None, 'error': None}
+
+    def _set(self, name, **fields):
+        with self._lock:
+            self._state[name].update(fields)
+
+    def run(self):
+        """依次加载全部组件，单个组件失败不影响其余组件"""
+        self._started = True
+        for name, load, _ in self._components:
+            self._set(name, status='loading')
+            start = time.perf_counter()
+            try:
+                load()
+            except Exception as e:
+                print(f"预热 {name} 失败: {e}")
+                self._set(name, status='failed', error=str(e), seconds=round(time.perf_counter() - start, 3))
+            else:
+                self._set(name, status='ready', error=None, seconds=round(time.perf_counter() - start, 3))
+            finally:
+                metrics.observe('stage_seconds', time.perf_counter() - start, stage=f'warmup_{name}')
+
+    def start(self):
+        """在后台线程中预热"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run, name='warmup', daemon=True)
+            self._thread.start()
+
+    def status(self):
+        """各组件状态；ready 表示必需组件均已加载完成（未启用预热时，尚未使用的组件不影响就绪）"""
+        with self._lock:
+            for name, check in self._checks.items():
+                state = self._state[name]
+                if state['status'] != 'ready' and check():
+                    state.update(status='ready', error=None)
+            components = {name: dict(state) for name, state in self._state.items()}
+        return {
+            'ready': all(state['status'] == 'ready' or (state['status'] == 'pending' and not self._started)
+                         for state in components.values() if state['required']),
+            'uptime_seconds': round(time.time() - self.started_at, 3),
+            'components': components
+        }